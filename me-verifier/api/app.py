@@ -3,6 +3,8 @@ import io
 import os
 import time
 import math
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
 from PIL import Image
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
@@ -11,6 +13,8 @@ import numpy as np
 import torch
 from facenet_pytorch import MTCNN, InceptionResnetV1
 
+from api.pipeline import VerifyPipeline, PipelineError
+
 # --- Carga de configuración ---
 load_dotenv()
 MODEL_PATH   = os.getenv("MODEL_PATH", "models/model.joblib")
@@ -18,6 +22,14 @@ THRESHOLD    = float(os.getenv("THRESHOLD", "0.75"))
 DEVICE       = torch.device(os.getenv("DEVICE", "cpu"))
 MODEL_VERSION= os.getenv("MODEL_VERSION", "me-verifier-v1")
 MAX_MB       = int(os.getenv("MAX_MB", "5"))
+# Pipeline por etapas (api/pipeline.py); PIPELINE=0 mantiene el modo serial por request
+PIPELINE         = os.getenv("PIPELINE", "0") == "1"
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+PIPELINE_BATCH   = int(os.getenv("PIPELINE_BATCH", "16"))
+PIPELINE_WAIT_MS = float(os.getenv("PIPELINE_WAIT_MS", "5"))
+PIPELINE_INFLIGHT= int(os.getenv("PIPELINE_INFLIGHT", "32"))
+PIPELINE_TIMEOUT = float(os.getenv("PIPELINE_TIMEOUT", "30"))
+PIPELINE_QUEUE_TIMEOUT = float(os.getenv("PIPELINE_QUEUE_TIMEOUT", "5"))  # espera por un cupo antes del 503
 
 # --- App Flask ---
 app = Flask(__name__)
@@ -27,6 +39,25 @@ mtcnn  = MTCNN(image_size=160, margin=14, post_process=True, device=DEVICE)  # k
 resnet = InceptionResnetV1(pretrained="vggface2").eval().to(DEVICE)
 clf    = joblib.load(MODEL_PATH)
 
+# El pipeline se crea en la primera request (no antes del fork de gunicorn)
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = VerifyPipeline(
+                    resnet, clf, DEVICE,
+                    workers=PIPELINE_WORKERS,
+                    max_inflight=PIPELINE_INFLIGHT,
+                    batch_size=PIPELINE_BATCH,
+                    max_wait_ms=PIPELINE_WAIT_MS,
+                    acquire_timeout=PIPELINE_QUEUE_TIMEOUT,
+                )
+    return _pipeline
+
 def _ext_ok(filename: str) -> bool:
     fn = filename.lower()
     return fn.endswith(".jpg") or fn.endswith(".jpeg") or fn.endswith(".png")
@@ -62,13 +93,17 @@ def verify():
         # Si no se puede medir, seguimos igual (Flask puede manejar tamaños por config si quieres)
         pass
 
-    # Abrir imagen
+    # Abrir imagen (con el pipeline, decode y detección ocurren en sus workers)
     try:
         raw = f.read()
-        img = Image.open(io.BytesIO(raw)).convert("RGB")
+        if not PIPELINE:
+            img = Image.open(io.BytesIO(raw)).convert("RGB")
     except Exception:
         return jsonify({"error": "imagen inválida"}), 400
 
+    if PIPELINE:
+        return _verify_pipeline(raw, t0)
+
     # Detectar y alinear rostro (tensor CHW en rango [0,1])
     face = mtcnn(img)
     if face is None:
@@ -91,6 +126,23 @@ def verify():
         df = float(clf.decision_function(emb)[0])
         score = 1.0 / (1.0 + math.exp(-df))     # mapea a (0,1) como proxy
 
+    return _verify_response(score, t0)
+
+def _verify_pipeline(raw: bytes, t0: float):
+    fut = None
+    try:
+        fut = get_pipeline().submit(raw)
+        score = fut.result(timeout=PIPELINE_TIMEOUT)
+    except PipelineError as e:
+        return jsonify({"error": e.message}), e.status
+    except FutureTimeout:
+        fut.cancel()   # libera el cupo; el resultado tardío se descarta
+        return jsonify({"error": f"tiempo de espera agotado ({PIPELINE_TIMEOUT:g} s)"}), 504
+    except Exception as e:
+        return jsonify({"error": f"pipeline no disponible: {type(e).__name__}"}), 503
+    return _verify_response(score, t0)
+
+def _verify_response(score: float, t0: float):
     is_me = bool(score >= THRESHOLD)
     elapsed_ms = round((time.time() - t0) * 1000.0, 1)
 
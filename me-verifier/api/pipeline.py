@@ -0,0 +1,235 @@
+# api/pipeline.py
+# Pipeline por etapas para /verify:
+#   1) decode + MTCNN en un pool de procesos (CPU-bound, sin GIL compartido)
+#   2) InceptionResnetV1 + clasificador en lotes, en un hilo dedicado
+# Las etapas se conectan con colas acotadas y cada request recibe un Future
+# que se resuelve cuando su score está listo.
+import io
+import math
+import queue
+import threading
+import time
+import multiprocessing as mp
+from concurrent.futures import CancelledError, Future, InvalidStateError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from facenet_pytorch import MTCNN
+
+# MTCNN por proceso worker (se inicializa una vez en _init_worker)
+_mtcnn: Optional[MTCNN] = None
+
+
+class PipelineError(Exception):
+    """Error de una request dentro del pipeline, con su código HTTP."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _init_worker(device: str) -> None:
+    global _mtcnn
+    # Cada proceso usa 1 hilo: el paralelismo viene del número de procesos
+    torch.set_num_threads(1)
+    _mtcnn = MTCNN(image_size=160, margin=14, post_process=True, device=torch.device(device))
+
+
+def _decode_and_detect(raw: bytes) -> Tuple[str, Optional[np.ndarray]]:
+    """Etapa 1 (en proceso worker): bytes -> rostro alineado CHW float32 en [0,1]."""
+    try:
+        img = Image.open(io.BytesIO(raw)).convert("RGB")
+    except Exception:
+        return "invalid", None
+    face = _mtcnn(img)
+    if face is None:
+        return "no_face", None
+    return "ok", face.numpy().astype(np.float32, copy=False)
+
+
+def _resolve(fut: Future, result=None, error: Optional[BaseException] = None) -> None:
+    """Resuelve `fut` salvo que ya esté terminado (p.ej. cancelado por timeout de la request)."""
+    try:
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def clf_scores(clf, emb: np.ndarray) -> np.ndarray:
+    """Puntajes en [0,1] para un lote de embeddings (N,512)."""
+    try:
+        # Regresión logística u otro modelo con predict_proba
+        return np.asarray(clf.predict_proba(emb)[:, 1], dtype=float)
+    except Exception:
+        # LinearSVC/otros sin predict_proba: sigmoide sobre decision_function
+        df = np.asarray(clf.decision_function(emb), dtype=float).reshape(-1)
+        return np.array([1.0 / (1.0 + math.exp(-v)) for v in df])
+
+
+class VerifyPipeline:
+    """
+    Pipeline concurrente decode -> detect -> embed -> score.
+
+    - `workers` procesos hacen decode + MTCNN.
+    - Un hilo agrupa rostros en lotes de hasta `batch_size` (esperando como
+      máximo `max_wait_ms`) y hace un solo forward de ResNet + clasificador.
+    - `max_inflight` acota las requests dentro del pipeline: si se llena,
+      `submit` espera a lo más `acquire_timeout` segundos (backpressure) y
+      luego responde 503 en vez de encolar sin límite.
+    - Si un worker muere (BrokenProcessPool) las requests afectadas reciben
+      503 y el pool se reconstruye para las siguientes.
+    """
+
+    def __init__(self, resnet, clf, device: torch.device, workers: int = 2,
+                 max_inflight: int = 32, batch_size: int = 16, max_wait_ms: float = 5.0,
+                 acquire_timeout: float = 5.0):
+        self.resnet = resnet
+        self.clf = clf
+        self.device = device
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.acquire_timeout = acquire_timeout
+
+        self._pool_lock = threading.Lock()
+        self._pool = self._new_pool()
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        # Nunca hay más de max_inflight rostros en vuelo, más el aviso de cierre:
+        # con ese cupo extra put() no bloquea
+        self._embed_q: "queue.Queue" = queue.Queue(maxsize=max_inflight + 1)
+        self._closed = False
+        self._thread = threading.Thread(target=self._embed_loop, name="embed-stage", daemon=True)
+        self._thread.start()
+
+    # ---------- API pública ----------
+    def submit(self, raw: bytes) -> Future:
+        """Encola una imagen (bytes) y devuelve un Future con el score."""
+        out: Future = Future()
+        if self._closed:
+            out.set_exception(PipelineError("pipeline detenido", 503))
+            return out
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            out.set_exception(PipelineError("servidor saturado, intenta de nuevo", 503))
+            return out
+        out.add_done_callback(lambda _: self._slots.release())
+        pool = self._pool
+        try:
+            det = pool.submit(_decode_and_detect, raw)
+        except BrokenProcessPool:
+            # Un worker murió antes de esta request: pool nuevo y un reintento
+            try:
+                det = self._replace_pool(pool).submit(_decode_and_detect, raw)
+            except Exception as e:
+                out.set_exception(PipelineError(f"pipeline no disponible: {e}", 503))
+                return out
+        except Exception as e:
+            out.set_exception(PipelineError(f"pipeline no disponible: {e}", 503))
+            return out
+        det.add_done_callback(lambda f: self._on_detected(f, out, pool))
+        return out
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._embed_q.put_nowait(None)   # usa el cupo reservado: no bloquea
+        self._thread.join(timeout=5)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        # Rostros que llegaron después del aviso de cierre
+        while True:
+            try:
+                item = self._embed_q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                _resolve(item[1], error=PipelineError("pipeline detenido", 503))
+
+    # ---------- Etapas internas ----------
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: no heredar estado de torch/hilos del proceso padre
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(str(self.device),),
+        )
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Reemplaza `broken` por un pool nuevo (una sola vez aunque fallen varias requests)."""
+        with self._pool_lock:
+            if self._pool is broken and not self._closed:
+                print("[WARN] pool de detección caído; se crea uno nuevo", flush=True)
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+            return self._pool
+
+    def _on_detected(self, det: Future, out: Future, pool: ProcessPoolExecutor) -> None:
+        try:
+            status, face = det.result()
+        except BrokenProcessPool:
+            self._replace_pool(pool)
+            _resolve(out, error=PipelineError("worker de detección caído, intenta de nuevo", 503))
+            return
+        except CancelledError:
+            _resolve(out, error=PipelineError("pipeline detenido", 503))
+            return
+        except Exception as e:
+            _resolve(out, error=PipelineError(f"error en la detección: {e}", 503))
+            return
+        if status == "invalid":
+            _resolve(out, error=PipelineError("imagen inválida", 400))
+        elif status == "no_face":
+            _resolve(out, error=PipelineError("no se detectó rostro", 422))
+        elif self._closed:
+            _resolve(out, error=PipelineError("pipeline detenido", 503))
+        elif out.done():
+            pass   # la request ya expiró: no gasta un lugar en el lote
+        else:
+            self._embed_q.put((face, out))
+
+    def _next_batch(self):
+        item = self._embed_q.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._embed_q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._embed_q.put(None)  # re-publica el cierre tras este lote
+                break
+            batch.append(item)
+        return batch
+
+    def _embed_loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures = [fut for _, fut in batch]
+            try:
+                # Normalización consistente con embeddings.py: (x - 0.5)/0.5
+                x = torch.from_numpy(np.stack([face for face, _ in batch])).to(self.device)
+                x = (x - 0.5) / 0.5
+                with torch.no_grad():
+                    emb = self.resnet(x).cpu().numpy()   # (N,512)
+                scores = clf_scores(self.clf, emb)
+            except Exception as e:
+                for fut in futures:
+                    _resolve(fut, error=PipelineError(f"error al calcular el puntaje: {e}", 503))
+                continue
+            for fut, s in zip(futures, scores):
+                _resolve(fut, float(s))
@@ -0,0 +1,99 @@
+# scripts/bench_pipeline.py
+# Compara throughput sostenido de /verify: modo serial por request vs pipeline por etapas.
+# Uso:
+#   python scripts/bench_pipeline.py --requests 200 --concurrency 8
+#
+# Usa las imágenes de data/eval/{me,not_me} como carga (en bucle).
+import argparse
+import io
+import math
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import torch
+from PIL import Image
+
+from api.app import mtcnn, resnet, clf, DEVICE
+from api.pipeline import VerifyPipeline, PipelineError
+
+EVAL_DIR = ROOT / "data" / "eval"
+
+
+def load_payloads():
+    exts = (".jpg", ".jpeg", ".png")
+    files = [p for p in EVAL_DIR.rglob("*") if p.suffix.lower() in exts]
+    if not files:
+        raise SystemExit(f"No hay imágenes en {EVAL_DIR}")
+    return [p.read_bytes() for p in sorted(files)]
+
+
+def serial_verify(raw: bytes):
+    """Mismo camino que api/app.py sin pipeline: todo en el hilo de la request."""
+    img = Image.open(io.BytesIO(raw)).convert("RGB")
+    face = mtcnn(img)
+    if face is None:
+        return None
+    x = (face.unsqueeze(0).to(DEVICE) - 0.5) / 0.5
+    with torch.no_grad():
+        emb = resnet(x).cpu().numpy()
+    try:
+        return float(clf.predict_proba(emb)[:, 1][0])
+    except Exception:
+        return 1.0 / (1.0 + math.exp(-float(clf.decision_function(emb)[0])))
+
+
+def run(name, fn, payloads, n, concurrency):
+    lat = []
+
+    def one(i):
+        t = time.perf_counter()
+        try:
+            fn(payloads[i % len(payloads)])
+        except PipelineError:
+            pass  # sin rostro / inválida cuentan igual como request atendida
+        lat.append((time.perf_counter() - t) * 1000.0)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(one, range(min(concurrency, n))))   # calentamiento
+        lat.clear()
+        t0 = time.perf_counter()
+        list(ex.map(one, range(n)))
+        dt = time.perf_counter() - t0
+
+    lat.sort()
+    p95 = lat[max(0, int(0.95 * len(lat)) - 1)]
+    print(f"{name:<10} {n / dt:8.2f} req/s | p50 {statistics.median(lat):8.1f} ms | p95 {p95:8.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--wait-ms", type=float, default=5.0)
+    args = ap.parse_args()
+
+    payloads = load_payloads()
+    print(f"[bench] {len(payloads)} imágenes | {args.requests} requests | concurrencia {args.concurrency}")
+
+    run("serial", serial_verify, payloads, args.requests, args.concurrency)
+
+    pipe = VerifyPipeline(resnet, clf, DEVICE, workers=args.workers,
+                          max_inflight=max(args.concurrency, args.batch) * 2,
+                          batch_size=args.batch, max_wait_ms=args.wait_ms)
+    try:
+        run("pipeline", lambda raw: pipe.submit(raw).result(), payloads, args.requests, args.concurrency)
+    finally:
+        pipe.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import io
+import pytest
 from PIL import Image
 from api.app import app   # <- importa la app del Flask
 
@@ -16,3 +17,34 @@ def test_verify_no_face():
     data = {'image': (buf, 'white.png')}
     r = client.post('/verify', data=data, content_type='multipart/form-data')
     assert r.status_code in (200, 422, 400)
+
+# El pipeline por etapas debe mapear "sin rostro" al mismo 422 que el modo serial
+def test_pipeline_no_face():
+    from api.app import resnet, clf, DEVICE
+    from api.pipeline import VerifyPipeline, PipelineError
+    buf = io.BytesIO()
+    Image.new('RGB', (200, 200), (255, 255, 255)).save(buf, format='PNG')
+    pipe = VerifyPipeline(resnet, clf, DEVICE, workers=1, max_inflight=2, batch_size=2)
+    try:
+        with pytest.raises(PipelineError) as e:
+            pipe.submit(buf.getvalue()).result(timeout=60)
+        assert e.value.status == 422
+    finally:
+        pipe.close()
+
+# Con el pipeline lleno, submit no bloquea indefinidamente: responde 503
+def test_pipeline_saturated():
+    from api.app import resnet, clf, DEVICE
+    from api.pipeline import VerifyPipeline, PipelineError
+    buf = io.BytesIO()
+    Image.new('RGB', (200, 200), (255, 255, 255)).save(buf, format='PNG')
+    pipe = VerifyPipeline(resnet, clf, DEVICE, workers=1, max_inflight=1, acquire_timeout=0.1)
+    try:
+        first = pipe.submit(buf.getvalue())   # ocupa el único cupo mientras arranca el worker
+        with pytest.raises(PipelineError) as e:
+            pipe.submit(buf.getvalue()).result(timeout=5)
+        assert e.value.status == 503
+        with pytest.raises(PipelineError):
+            first.result(timeout=60)
+    finally:
+        pipe.close()
@@ -1,12 +1,14 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import json
 import click
 from typing import List, Dict
 
-from providers.openrouter import OpenRouterProvider
-from rag.retrieve import Retriever, format_context
-from rag.prompts import build_messages
+# Solo módulos livianos al inicio: faiss/torch (rag.retrieve) y el cliente del
+# proveedor se importan recién cuando hacen falta, así --no-rag o el daemon no
+# pagan la carga del stack RAG.
+from rag.schema import RetrievalFilter, format_context
 
 @click.command()
 @click.argument("question", required=False)
@@ -17,38 +19,53 @@ from rag.prompts import build_messages
 @click.option("--rag/--no-rag", default=True, show_default=True, help="Usar RAG (recuperación + citas).")
 @click.option("--show-sources/--no-show-sources", default=False, show_default=True,   # <--- NUEVO
               help="Muestra las fuentes (chunks) recuperadas.")
-def main(question: str, provider: str, model: str, k: int, rag: bool, show_sources: bool):   # <--- agrega show_sources
+@click.option("--mode", type=click.Choice(["dense", "hybrid"]), default=None,
+              help="Recuperación densa (FAISS) o híbrida (FAISS + BM25). Por defecto RETRIEVAL_MODE o dense.")
+@click.option("--doc-id", "doc_ids", multiple=True, help="Restringe a estos doc_id (repetible).")
+@click.option("--vigencia-min", type=int, default=None, help="Solo documentos con vigencia >= este año.")
+@click.option("--tipo", "tipos", multiple=True, help="Solo documentos de este tipo (PDF, TXT...; repetible).")
+@click.option("--stream/--no-stream", default=False, show_default=True,
+              help="Imprime la respuesta a medida que llegan los tokens.")
+@click.option("--server", default=None, envvar="UFRO_SERVER",
+              help="URL base del servidor (p.ej. http://127.0.0.1:8200); con --stream consume /ask/stream.")
+@click.option("--daemon/--no-daemon", "use_daemon", default=True, show_default=True,
+              help="Usa el Retriever caliente de rag/daemon.py si está corriendo.")
+def main(question: str, provider: str, model: str, k: int, rag: bool, show_sources: bool,
+         mode: str, doc_ids, vigencia_min: int, tipos, stream: bool, server: str, use_daemon: bool):
     """
     CLI para hacer preguntas. Ejemplos:
       python app.py "¿Cuál es la fecha de inicio del semestre 2025?"
       python app.py "¿Cómo apelar una nota?" --k 5
       python app.py --no-rag "Hola, responde OK"
+      python app.py "¿Cuándo inicia el semestre?" --stream --server http://127.0.0.1:8200
+      python app.py "¿Qué dice el reglamento de convivencia?" --doc-id convivencia_2025
     """
+    if not question:
+        question = click.prompt("Escribe tu pregunta")
+
+    filt = RetrievalFilter.make(doc_ids, vigencia_min, tipos)
+
+    if stream and server:
+        stream_from_server(server, question, provider, model, k, rag, show_sources, mode, filt)
+        return
+
     if provider == "openrouter":
+        from providers.openrouter import OpenRouterProvider
         llm = OpenRouterProvider(model=model)
     else:
         raise click.ClickException(f"Proveedor no soportado: {provider}")
 
-    if not question:
-        question = click.prompt("Escribe tu pregunta")
-
     if not rag:
         messages: List[Dict[str, str]] = [
             {"role": "system", "content": "Eres un asistente UFRO, responde breve."},
             {"role": "user", "content": question},
         ]
-        answer = llm.chat(messages)
         click.secho("\nRespuesta (sin RAG):", fg="yellow")
-        click.echo(answer)
+        echo_answer(llm, messages, stream)
         return
 
     # RAG
-    try:
-        retriever = Retriever()
-    except Exception as e:
-        raise click.ClickException(f"No se pudo inicializar el retriever: {e}")
-
-    chunks = retriever.query(question, k=k)
+    chunks = retrieve(question, k, mode, filt, use_daemon)
 
     # Mostrar fuentes recuperadas para depurar
     if show_sources:  # <-- Asegúrate de que este bloque esté dentro de la función main()
@@ -62,12 +79,86 @@ def main(question: str, provider: str, model: str, k: int, rag: bool, show_sourc
         click.echo(f"[{i}] {title} (p.{page}) -> {url}")
         click.echo(f"     {snippet}\n")
 
-    context_block = format_context(chunks)
-    messages = build_messages(question, context_block)
+    from rag.context import pack_context, token_budget
+    from rag.prompts import build_messages
+    packed, ctx = pack_context(chunks, token_budget(model))
+    messages = build_messages(question, format_context(packed))
+    if show_sources:
+        click.secho(f"Contexto: {ctx['tokens_out']} tokens (ahorrados {ctx['tokens_saved']}, "
+                    f"{ctx['merged']} unidos, {ctx['duplicates']} duplicados)", fg="cyan")
 
-    answer = llm.chat(messages)
     click.secho("\nRespuesta (RAG):", fg="green")
-    click.echo(answer)
+    echo_answer(llm, messages, stream)
+
+def retrieve(question: str, k: int, mode: str, filt: RetrievalFilter, use_daemon: bool):
+    """Recupera vía daemon si está corriendo; si no, carga un Retriever en este proceso."""
+    if use_daemon:
+        from rag.daemon import daemon_query
+        try:
+            chunks = daemon_query(question, k=k, mode=mode, filt=filt)
+        except Exception as e:
+            raise click.ClickException(f"Error en el daemon: {e}")
+        if chunks is not None:
+            return chunks
+    try:
+        from rag.retrieve import Retriever
+        retriever = Retriever()
+    except Exception as e:
+        raise click.ClickException(f"No se pudo inicializar el retriever: {e}")
+    return retriever.query(question, k=k, mode=mode, filt=filt)
+
+def echo_answer(llm, messages: List[Dict[str, str]], stream: bool):
+    if not stream:
+        click.echo(llm.chat(messages))
+        return
+    for piece in llm.stream(messages):
+        click.echo(piece, nl=False)
+    click.echo()
+
+def stream_from_server(server: str, question: str, provider: str, model: str, k: int,
+                       rag: bool, show_sources: bool, mode: str = None, filt: RetrievalFilter = None):
+    """Consume POST /ask/stream (server-sent events) e imprime a medida que llega."""
+    import httpx
+
+    data = {"question": question, "provider": provider, "model": model,
+            "k": str(k), "rag": str(rag).lower()}
+    if mode:
+        data["mode"] = mode
+    if filt is not None:
+        if filt.doc_ids:
+            data["doc_ids"] = ",".join(filt.doc_ids)
+        if filt.vigencia_min is not None:
+            data["vigencia_min"] = str(filt.vigencia_min)
+        if filt.tipos:
+            data["tipo"] = ",".join(filt.tipos)
+    url = server.rstrip("/") + "/ask/stream"
+    event = "message"
+    with httpx.stream("POST", url, data=data, timeout=None) as resp:
+        if resp.status_code >= 400:
+            resp.read()
+            raise click.ClickException(f"{url} -> {resp.status_code}: {resp.text}")
+        click.secho(f"\nRespuesta ({'RAG' if rag else 'sin RAG'}):", fg="green" if rag else "yellow")
+        for line in resp.iter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                continue
+            if not line.startswith("data: "):
+                continue
+            msg = json.loads(line[6:])
+            if event == "token":
+                click.echo(msg["text"], nl=False)
+            elif event == "sources" and show_sources:
+                click.secho("Fuentes recuperadas:", fg="cyan")
+                for i, src in enumerate(msg, 1):
+                    click.echo(f"[{i}] {src['title']} (p.{src['page']}) -> {src['url']}")
+                click.echo()
+            elif event == "error":
+                raise click.ClickException(msg.get("detail", "error en el servidor"))
+            elif event == "done":
+                t = msg.get("timings", {})
+                click.echo()
+                click.secho(f"[recuperación {t.get('retrieval_ms')} ms | primer token "
+                            f"{t.get('first_token_ms')} ms | total {t.get('total_ms')} ms]", fg="cyan")
 
 if __name__ == "__main__":
     main()
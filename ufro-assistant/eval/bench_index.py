@@ -0,0 +1,117 @@
+# eval/bench_index.py
+# Compara tipos de índice FAISS (flat, hnsw, ivf_flat, ivf_pq) sobre los chunks
+# actuales: recall@k contra flat, QPS, tiempo de construcción y tamaño.
+#
+#   python eval/bench_index.py --k 4 --synthetic 500 --replicate 20
+import json
+import random
+import time
+from pathlib import Path
+
+# Para resolver imports si se ejecuta con `python eval/bench_index.py`
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import click
+import faiss
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+from eval.gold import load_gold
+from rag.index_factory import INDEX_TYPES, build_index, resolve_params, parse_param_overrides
+from rag.retrieve import MODEL_NAME
+from rag.release import current_release
+
+
+def synthetic_queries(texts, n: int, seed: int = 42):
+    """Frases tomadas de chunks al azar (ventanas de 8-20 palabras)."""
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        words = rnd.choice(texts).split()
+        if not words:
+            continue
+        size = rnd.randint(8, 20)
+        start = rnd.randint(0, max(0, len(words) - size))
+        out.append(" ".join(words[start:start + size]))
+    return out
+
+
+def replicate(emb: np.ndarray, times: int, noise: float, seed: int = 42) -> np.ndarray:
+    """Corpus sintético más grande: copias perturbadas y re-normalizadas."""
+    if times <= 1:
+        return emb
+    rng = np.random.default_rng(seed)
+    copies = [emb] + [emb + rng.normal(0, noise, emb.shape).astype("float32") for _ in range(times - 1)]
+    out = np.vstack(copies).astype("float32")
+    faiss.normalize_L2(out)
+    return out
+
+
+@click.command()
+@click.option("--k", default=4, show_default=True)
+@click.option("--gold", default="eval/gold_set.jsonl", show_default=True)
+@click.option("--synthetic", default=500, show_default=True, help="Consultas sintéticas extra.")
+@click.option("--replicate", "times", default=1, show_default=True,
+              help="Multiplica el corpus con copias perturbadas (para simular un corpus grande).")
+@click.option("--noise", default=0.05, show_default=True)
+@click.option("--types", default=",".join(INDEX_TYPES), show_default=True)
+@click.option("--param", "params", multiple=True,
+              help="Override tipo.clave=valor, p.ej. hnsw.ef_search=128 o ivf_flat.nprobe=16.")
+@click.option("--out", default="eval/bench_index.json", show_default=True)
+def main(k, gold, synthetic, times, noise, types, params, out):
+    meta = pd.read_parquet(current_release().meta_path)
+    texts = meta["text"].astype(str).tolist()
+    model = SentenceTransformer(MODEL_NAME)
+
+    click.echo(f"[INFO] Codificando {len(texts)} chunks...")
+    emb = np.asarray(model.encode(texts, normalize_embeddings=True, batch_size=64), dtype="float32")
+    emb = replicate(emb, times, noise)
+    ids = np.arange(len(emb), dtype="int64")
+
+    queries = [g["question"] for g in load_gold(Path(gold))] + synthetic_queries(texts, synthetic)
+    q_emb = np.asarray(model.encode(queries, normalize_embeddings=True, batch_size=64), dtype="float32")
+    click.echo(f"[INFO] Corpus {len(emb)} vectores | {len(queries)} consultas | k={k}")
+
+    per_type = {}
+    for item in parse_param_overrides(params).items():
+        kind, _, key = item[0].partition(".")
+        per_type.setdefault(kind, {})[key] = item[1]
+
+    # Verdad de referencia: búsqueda exacta
+    exact = faiss.IndexFlatIP(emb.shape[1])
+    exact.add(emb)
+    _, truth = exact.search(q_emb, k)
+
+    rows = []
+    for kind in [t.strip() for t in types.split(",") if t.strip()]:
+        try:
+            cfg = resolve_params(kind, per_type.get(kind))
+            t0 = time.perf_counter()
+            index = build_index(kind, emb, ids, cfg)
+            build_s = time.perf_counter() - t0
+        except ValueError as e:
+            click.echo(f"[SKIP] {kind}: {e}")
+            continue
+
+        # Una consulta por llamada, como en el servidor
+        t0 = time.perf_counter()
+        found = np.vstack([index.search(q_emb[i:i + 1], k)[1] for i in range(len(q_emb))])
+        qps = len(q_emb) / (time.perf_counter() - t0)
+
+        recall = float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+        rows.append({"type": kind, "params": cfg, "recall@k": round(recall, 4), "qps": round(qps, 1),
+                     "build_s": round(build_s, 3), "size_mb": round(size_mb, 2)})
+        click.echo(f"{kind:<9} recall@{k} {recall:6.3f} | {qps:9.1f} QPS | build {build_s:7.2f}s | {size_mb:8.2f} MB | {cfg}")
+
+    out_path = Path(out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps({"k": k, "n_vectors": len(emb), "n_queries": len(queries), "results": rows},
+                                   ensure_ascii=False, indent=2), encoding="utf-8")
+    click.echo(f"[OK] Resultados en {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# eval/compare_chunkers.py
+# Compara chunkers (fixed vs structure) offline sobre data/raw + el gold set:
+# n° de chunks, tiempo de chunking, tamaño del índice, tokens por prompt y
+# tasa de acierto de la recuperación (documento y página/artículo esperados).
+#
+#   python eval/compare_chunkers.py --k 4
+import json
+import time
+from pathlib import Path
+
+# Para resolver imports si se ejecuta con `python eval/compare_chunkers.py`
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import click
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from eval.gold import load_gold, norm, parse_ref, ref_hit
+from rag.ingest import (CHUNKERS, RAW_DIR, build_chunks_for_doc, get_chunker, list_docs,
+                        read_doc_pages, read_sources_csv)
+from rag.context import estimate_tokens, pack_context, token_budget
+from rag.prompts import build_messages
+from rag.retrieve import MODEL_NAME, RetrievedChunk, format_context
+
+
+def load_corpus():
+    df_src = read_sources_csv()
+    paths = list_docs(RAW_DIR)
+    docs = []
+    for _, row in df_src.iterrows():
+        path = next((p for p in paths if str(row["doc_id"]).lower() in p.stem.lower()), None)
+        if path is not None:
+            docs.append((row, path, read_doc_pages(path)))
+    return docs
+
+
+@click.command()
+@click.option("--k", default=4, show_default=True)
+@click.option("--gold", default="eval/gold_set.jsonl", show_default=True)
+@click.option("--chunkers", default=",".join(CHUNKERS), show_default=True)
+@click.option("--model", "llm_model", default="openai/gpt-4.1-mini", show_default=True,
+              help="Modelo cuyo presupuesto de contexto se usa para los tokens empaquetados.")
+@click.option("--out", default="eval/compare_chunkers.json", show_default=True)
+def main(k, gold, chunkers, llm_model, out):
+    docs = load_corpus()
+    if not docs:
+        raise click.ClickException(f"No hay documentos en {RAW_DIR} que coincidan con sources.csv")
+    gold_items = [(it["question"], parse_ref(it["refs"][0])) for it in load_gold(Path(gold)) if it["refs"]]
+    model = SentenceTransformer(MODEL_NAME)
+    q_emb = np.asarray(model.encode([q for q, _ in gold_items], normalize_embeddings=True),
+                       dtype="float32")
+    click.echo(f"[INFO] {len(docs)} documentos | {len(gold_items)} preguntas | k={k}")
+
+    rows = []
+    for name in [c.strip() for c in chunkers.split(",") if c.strip()]:
+        spans_fn, sig = get_chunker(name)
+        t0 = time.perf_counter()
+        chunks = [r for row, path, pages in docs for r in build_chunks_for_doc(row, path, pages, spans_fn)
+                  if not r["needs_ocr"]]
+        chunk_s = time.perf_counter() - t0
+
+        emb = np.asarray(model.encode([c["text"] for c in chunks], normalize_embeddings=True, batch_size=64),
+                         dtype="float32")
+        index = faiss.IndexFlatIP(emb.shape[1])
+        index.add(emb)
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+        _, idx = index.search(q_emb, k)
+        hits = doc_hits = 0
+        raw_tokens, packed_tokens = [], []
+        for (q, ref), row_idx in zip(gold_items, idx):
+            found = [RetrievedChunk(score=0.0, doc_id=c["doc_id"], title=c["title"], page=c["page"],
+                                    url=c["url"], vigencia=c["vigencia"], text=c["text"], chunk_id=int(i),
+                                    char_start=c["char_start"], char_end=c["char_end"])
+                     for i in row_idx if i != -1 for c in [chunks[i]]]
+            hits += any(ref_hit(c, ref) for c in found)
+            doc_hits += any(norm(c.title) == ref[0] for c in found)
+            raw_tokens.append(estimate_tokens(build_messages(q, format_context(found))[1]["content"]))
+            packed, _ = pack_context(found, token_budget(llm_model))
+            packed_tokens.append(estimate_tokens(build_messages(q, format_context(packed))[1]["content"]))
+
+        n = max(1, len(gold_items))
+        res = {"chunker": name, "signature": sig, "chunks": len(chunks), "chunk_s": round(chunk_s, 3),
+               "index_mb": round(size_mb, 3),
+               "avg_chunk_tokens": round(float(np.mean([estimate_tokens(c["text"]) for c in chunks])), 1),
+               "prompt_tokens": round(float(np.mean(raw_tokens)), 1),
+               "prompt_tokens_packed": round(float(np.mean(packed_tokens)), 1),
+               "hit@k": round(hits / n, 4), "doc_hit@k": round(doc_hits / n, 4)}
+        rows.append(res)
+        click.echo(f"{name:<10} {res['chunks']:6d} chunks | {chunk_s:6.2f}s | índice {size_mb:7.2f} MB | "
+                   f"prompt {res['prompt_tokens']:7.1f} tok (empaquetado {res['prompt_tokens_packed']:7.1f}) | "
+                   f"hit@{k} {res['hit@k']:.3f} | doc_hit@{k} {res['doc_hit@k']:.3f}")
+
+    out_path = Path(out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps({"k": k, "n_questions": len(gold_items), "results": rows},
+                                   ensure_ascii=False, indent=2), encoding="utf-8")
+    click.echo(f"[OK] Resultados en {out_path}")
+
+
+if __name__ == "__main__":
+    main()
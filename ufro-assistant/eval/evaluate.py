@@ -1,40 +1,247 @@
 # eval/evaluate.py
+import asyncio
+import csv
 import json
 import time
 import click
+import numpy as np
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
 
 # Para resolver imports si se ejecuta con `python -m`
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from providers.openrouter import OpenRouterProvider
-try:
-    from providers.deepseek import DeepSeekProvider
-    HAVE_DEEPSEEK = True
-except Exception:
-    HAVE_DEEPSEEK = False
-
-from rag.retrieve import Retriever, format_context
+from eval.gold import load_gold, parse_ref, ref_hit
+from rag.cache import file_fingerprint
+from rag.retrieve import Retriever, format_context, RETRIEVAL_MODE, RETRIEVAL_MODES
 from rag.prompts import build_messages
+from rag.context import pack_context, token_budget
+
+
+class RateLimiter:
+    """Espacia el inicio de las llamadas a `rps` por segundo (0 = sin límite)."""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+RETRIEVAL_FIELDS = ["line", "question", "k", "mode", "retrieval_ms", "recall", "rr", "first_hit_rank",
+                    "retrieved", "expected_refs", "error"]
+LLM_FIELDS = ["line", "question", "expected", "answer", "em", "latency", "retrieval_ms", "provider", "model",
+              "expected_refs", "error"]
+
+
+class ResultWriter:
+    """
+    Resultados fila a fila en CSV o JSONL (según la extensión), con flush por
+    fila: si la corrida se corta, lo ya evaluado queda en disco. Con resume,
+    las líneas que ya tienen resultado sin error no se vuelven a evaluar.
+    Los parámetros de la corrida (`run`) se guardan junto al archivo
+    (<out>.run.json): solo se retoma si coinciden; si no, se empieza de cero.
+    """
+
+    def __init__(self, path: Path, resume: bool, fields: List[str], run: Dict[str, Any]):
+        self.path = path
+        self.jsonl = path.suffix == ".jsonl"
+        self.run_path = path.with_name(path.name + ".run.json")
+        self.restarted = False
+        if resume and path.exists() and self._previous_run() != run:
+            # otra k / modo / modelo / gold / índice: sus filas no sirven para esta corrida
+            resume, self.restarted = False, True
+        self.rows: List[Dict[str, Any]] = self._read() if resume and path.exists() else []
+        self._fields = fields
+        self._checked = False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not resume or not path.exists():
+            path.write_text("", encoding="utf-8")
+        self.run_path.write_text(json.dumps(run, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def _previous_run(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self.run_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None   # archivo sin parámetros (p.ej. de una versión anterior): no se retoma
+
+    def _read(self) -> List[Dict[str, Any]]:
+        with self.path.open(encoding="utf-8", newline="") as f:
+            if self.jsonl:
+                return [json.loads(line) for line in f if line.strip()]
+            return list(csv.DictReader(f))
+
+    def done(self) -> Set[int]:
+        return {int(r["line"]) for r in self.rows if not r.get("error")}
+
+    def drop_errors(self) -> None:
+        """Quita del archivo las filas con error: esas preguntas se vuelven a evaluar."""
+        kept = [r for r in self.rows if not r.get("error")]
+        if len(kept) == len(self.rows):
+            return
+        self.rows = kept
+        if self.jsonl:
+            self.path.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in kept), encoding="utf-8")
+        else:
+            self._rewrite(kept)
+            self._checked = True
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.rows.append(row)
+        if self.jsonl:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            return
+        if not self._checked:
+            self._checked = True
+            header = self.path.read_text(encoding="utf-8").splitlines()[:1]
+            if header != [",".join(self._fields)]:
+                # archivo nuevo o con otras columnas: se reescribe con las filas previas
+                self._rewrite(self.rows[:-1])
+        with self.path.open("a", encoding="utf-8", newline="") as f:
+            csv.DictWriter(f, fieldnames=self._fields, extrasaction="ignore", restval="").writerow(row)
+
+    def _rewrite(self, rows: List[Dict[str, Any]]) -> None:
+        with self.path.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self._fields, extrasaction="ignore", restval="")
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    p = np.percentile(np.asarray(values, dtype="float64"), [50, 90, 95, 99])
+    return {"p50": round(p[0], 1), "p90": round(p[1], 1), "p95": round(p[2], 1), "p99": round(p[3], 1)}
+
+
+def retrieval_metrics(chunks, refs: List[str]) -> Dict[str, Any]:
+    """
+    recall@k (fracción de refs encontradas en el top-k) y rango del primer
+    acierto. Sin refs ambas quedan vacías y summarize las excluye por igual.
+    """
+    parsed = [parse_ref(r) for r in refs]
+    if not parsed:
+        return {"recall": "", "rr": "", "first_hit_rank": ""}
+    found = [any(ref_hit(c, ref) for c in chunks) for ref in parsed]
+    rank = next((i for i, c in enumerate(chunks, start=1) if any(ref_hit(c, ref) for ref in parsed)), 0)
+    return {"recall": round(sum(found) / len(parsed), 4),
+            "rr": round(1.0 / rank, 4) if rank else 0.0, "first_hit_rank": rank}
+
+
+def build_llm(provider: str, model: str):
+    from providers.openrouter import OpenRouterProvider
+    if provider == "openrouter":
+        return OpenRouterProvider(model=model)
+    if provider == "deepseek":
+        try:
+            from providers.deepseek import DeepSeekProvider
+        except Exception:
+            raise click.ClickException("Proveedor no disponible: deepseek")
+        return DeepSeekProvider(model=model)
+    raise click.ClickException(f"Proveedor no soportado: {provider}")
+
+
+async def evaluate_all(items, retriever, llm, writer: ResultWriter, k: int, mode: Optional[str],
+                       provider: str, model: str, concurrency: int, rps: float, retries: int, verbose: bool):
+    sem = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rps)
+
+    async def one(item):
+        q, ln = item["question"], item["line"]
+        row: Dict[str, Any] = {"line": ln, "question": q}
+        async with sem:
+            try:
+                t0 = time.perf_counter()
+                chunks = await asyncio.to_thread(retriever.query, q, k, mode)
+                retrieval_ms = round((time.perf_counter() - t0) * 1000.0, 1)
+                if llm is None:
+                    row.update({"k": k, "mode": mode or "", "retrieval_ms": retrieval_ms,
+                                **retrieval_metrics(chunks, item["refs"]),
+                                "retrieved": "; ".join(f"{c.title}, p.{c.page}" for c in chunks),
+                                "expected_refs": "; ".join(item["refs"]), "error": ""})
+                else:
+                    # mismo empaquetado que server.rag_messages: lo evaluado es lo que se sirve
+                    packed, _ = pack_context(chunks, token_budget(model))
+                    messages = build_messages(q, format_context(packed))
+                    answer, latency, error = "", 0.0, ""
+                    for attempt in range(retries + 1):
+                        await limiter.wait()
+                        try:
+                            t1 = time.perf_counter()
+                            answer = await llm.achat(messages)
+                            latency = time.perf_counter() - t1
+                            error = ""
+                            break
+                        except Exception as e:
+                            error = f"{type(e).__name__}: {e}"
+                            if attempt < retries:
+                                await asyncio.sleep(min(30.0, 2.0 ** attempt))
+                    em = 1 if item["expected"].casefold() in (answer or "").casefold() else 0
+                    row.update({"expected": item["expected"], "answer": answer, "em": em if not error else "",
+                                "latency": round(latency, 2), "retrieval_ms": retrieval_ms,
+                                "provider": provider, "model": model,
+                                "expected_refs": "; ".join(item["refs"]), "error": error})
+            except Exception as e:
+                row.update({"error": f"{type(e).__name__}: {e}"})
+        writer.write(row)
+        if verbose:
+            if row.get("error"):
+                click.secho(f"[Q{ln}] ERROR {row['error']}", fg="red")
+            elif llm is None:
+                click.echo(f"[Q{ln}] rr={row['rr']} recall={row['recall']} | {row['retrieval_ms']} ms | {q}")
+            else:
+                click.echo(f"[Q{ln}] {q}\n[A{ln}] {row['answer']}\n[EM] {row['em']} | [lat] {row['latency']}s")
+
+    await asyncio.gather(*(one(item) for item in items))
+
+
+def summarize(rows: List[Dict[str, Any]], retrieval_only: bool, k: int) -> Dict[str, Any]:
+    ok = [r for r in rows if not r.get("error")]
+    out: Dict[str, Any] = {"rows": len(rows), "ok": len(ok), "errors": len(rows) - len(ok)}
+    lat = [float(r["retrieval_ms"]) for r in ok if r.get("retrieval_ms") not in (None, "")]
+    out["retrieval_ms"] = percentiles(lat)
+    if retrieval_only:
+        # mismas filas para ambas métricas: las que tienen refs
+        scored = [r for r in ok if r.get("recall") not in (None, "")]
+        out["scored"] = len(scored)
+        out[f"recall@{k}"] = round(float(np.mean([float(r["recall"]) for r in scored])), 4) if scored else None
+        out["mrr"] = round(float(np.mean([float(r["rr"]) for r in scored])), 4) if scored else None
+    else:
+        out["em"] = round(float(np.mean([float(r["em"]) for r in ok])), 4) if ok else None
+        out["llm_latency_ms"] = percentiles([float(r["latency"]) * 1000.0 for r in ok])
+    return out
 
 
 @click.command()
 @click.option("--provider", type=click.Choice(["openrouter", "deepseek"]), default="openrouter")
 @click.option("--model", default="openai/gpt-4.1-mini")
 @click.option("--k", default=4)
+@click.option("--mode", type=click.Choice(list(RETRIEVAL_MODES)), default=None)
 @click.option("--gold", default="eval/gold_set.jsonl", help="Ruta al JSONL (una pregunta por línea).")
-@click.option("--out", default="eval/results.csv")
+@click.option("--out", default=None,
+              help="CSV o .jsonl de resultados (por defecto eval/results.csv o eval/retrieval.csv).")
 @click.option("--limit", default=0, help="Evaluar solo las primeras N líneas (0 = todas).")
+@click.option("--retrieval-only", is_flag=True, help="Solo recuperación: recall@k, MRR y latencia, sin LLM.")
+@click.option("--concurrency", default=4, show_default=True, help="Preguntas en vuelo a la vez.")
+@click.option("--rps", default=2.0, show_default=True, help="Máximo de llamadas al LLM por segundo (0 = sin límite).")
+@click.option("--retries", default=2, show_default=True, help="Reintentos por pregunta si falla el LLM.")
+@click.option("--resume/--no-resume", default=True, show_default=True,
+              help="Retoma desde --out saltando las preguntas ya evaluadas sin error (solo con los mismos parámetros).")
 @click.option("--verbose/--no-verbose", default=True)
-def main(provider, model, k, gold, out, limit, verbose):
-    # 0) Proveedor
-    if provider == "openrouter":
-        llm = OpenRouterProvider(model=model)
-    elif provider == "deepseek" and HAVE_DEEPSEEK:
-        llm = DeepSeekProvider(model=model)
-    else:
-        raise click.ClickException(f"Proveedor no soportado o no disponible: {provider}")
+def main(provider, model, k, mode, gold, out, limit, retrieval_only, concurrency, rps, retries, resume, verbose):
+    # 0) Proveedor (no hace falta en modo solo recuperación)
+    llm = None if retrieval_only else build_llm(provider, model)
 
     # 1) Retriever
     try:
@@ -47,96 +254,48 @@ def main(provider, model, k, gold, out, limit, verbose):
     if not gold_path.exists():
         raise click.ClickException(f"No existe el archivo GOLD: {gold_path}")
 
-    results = []
-    total = 0
-
     # 2) Leer JSONL
     try:
-        lines = gold_path.read_text(encoding="utf-8-sig").splitlines()
+        items = load_gold(gold_path)
     except UnicodeDecodeError:
         raise click.ClickException("El archivo GOLD no está en UTF-8. Vuelve a guardarlo con UTF-8.")
-    except Exception as e:
-        raise click.ClickException(f"No se pudo leer el GOLD: {e}")
+    except ValueError as e:
+        raise click.ClickException(str(e))
 
     if limit and limit > 0:
-        lines = lines[:limit]
-
-    if verbose:
-        click.echo(f"[INFO] Evaluando {len(lines)} preguntas desde {gold_path} | k={k} | provider={provider} | model={model}")
+        items = items[:limit]
 
-    for ln, raw in enumerate(lines, start=1):
-        s = raw.strip()
-        if not s:
-            continue
-        try:
-            item = json.loads(s)
-        except json.JSONDecodeError as e:
-            raise click.ClickException(f"JSON inválido en línea {ln}: {e}\nContenido: {s[:200]}")
-
-        # admitir ambos esquemas
-        q = item.get("q") or item.get("question")
-        expected = item.get("a") or item.get("expected_answer") or ""
-        refs = item.get("refs")
-        if refs is None:
-            exp_doc = item.get("expected_doc")
-            refs = [exp_doc] if exp_doc else []
-
-        if not q:
-            raise click.ClickException(f"Falta 'q'/'question' en línea {ln}")
-
-        if verbose:
-            click.echo(f"\n[Q{ln}] {q}")
-
-        # 3) Recuperación
-        try:
-            chunks = retriever.query(q, k=k)
-            context = format_context(chunks)
-        except Exception as e:
-            raise click.ClickException(f"Fallo en retrieval (línea {ln}): {e}")
+    out_path = Path(out or ("eval/retrieval.csv" if retrieval_only else "eval/results.csv"))
+    run = {"retrieval_only": retrieval_only, "k": k, "mode": mode or RETRIEVAL_MODE,
+           "provider": None if retrieval_only else provider, "model": None if retrieval_only else model,
+           "gold": str(gold_path), "gold_version": file_fingerprint(gold_path), "index_version": retriever.version}
+    writer = ResultWriter(out_path, resume, RETRIEVAL_FIELDS if retrieval_only else LLM_FIELDS, run)
+    if writer.restarted:
+        click.secho(f"[INFO] {out_path} es de una corrida con otros parámetros: se empieza de cero", fg="yellow")
+    writer.drop_errors()
+    done = writer.done()
+    todo = [it for it in items if it["line"] not in done]
 
-        messages = build_messages(q, context)
-
-        # 4) LLM
-        try:
-            t0 = time.perf_counter()
-            answer = llm.chat(messages)
-            latency = time.perf_counter() - t0
-        except Exception as e:
-            raise click.ClickException(f"Fallo al llamar al LLM (línea {ln}): {e}")
-
-        em = 1 if (expected or "").casefold() in (answer or "").casefold() else 0
-
-        results.append({
-            "line": ln,
-            "question": q,
-            "expected": expected,
-            "answer": answer,
-            "em": em,
-            "latency": round(latency, 2),
-            "provider": provider,
-            "model": model,
-            "expected_refs": "; ".join(refs) if isinstance(refs, list) else str(refs),
-        })
-
-        if verbose:
-            click.echo(f"[A{ln}] {answer}\n[EM] {em} | [lat] {round(latency,2)}s")
+    if verbose:
+        what = "solo recuperación" if retrieval_only else f"provider={provider} | model={model}"
+        click.echo(f"[INFO] {len(items)} preguntas desde {gold_path} ({len(items) - len(todo)} ya evaluadas) "
+                   f"| k={k} | {what} | concurrencia={concurrency}")
 
-        total += 1
+    # 3) Recuperación (+ LLM) en paralelo acotado
+    retriever.warmup()
+    t0 = time.perf_counter()
+    asyncio.run(evaluate_all(todo, retriever, llm, writer, k, mode, provider, model,
+                             concurrency, rps, retries, verbose))
+    elapsed = time.perf_counter() - t0
 
-    # 5) Guardar CSV
-    if not results:
+    if not writer.rows:
         click.echo("[AVISO] No se generaron resultados. Revisa tu GOLD y el índice.")
         return
 
-    import csv
-    out_path = Path(out)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open("w", encoding="utf8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=results[0].keys())
-        writer.writeheader()
-        writer.writerows(results)
-
-    click.echo(f"\n[OK] {total} filas evaluadas. Resultados en: {out_path}")
+    # 4) Resumen (sobre todas las filas del archivo, incluidas las retomadas)
+    summary = summarize(writer.rows, retrieval_only, k)
+    click.echo(f"\n[OK] {len(todo)} preguntas en {elapsed:.1f}s. Resultados en: {out_path}")
+    click.echo(json.dumps(summary, ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+# eval/gold.py
+# Lectura del gold set y criterio de acierto de un chunk contra una referencia
+# ("Calendario Académico 2025, p.1", "Reglamento ..., art. 15"). Lo usan
+# eval/evaluate.py y eval/compare_chunkers.py.
+import json
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+Ref = Tuple[str, Tuple[Optional[str], Optional[int]]]
+
+
+def norm(text: str) -> str:
+    """Minúsculas, sin tildes ni signos: para comparar títulos."""
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    return re.sub(r"[^a-z0-9]", "", "".join(ch for ch in text if not unicodedata.combining(ch)))
+
+
+def parse_ref(ref: str) -> Ref:
+    """'Título, p.3' -> (título normalizado, ('p', 3)); sin ubicación -> (título, (None, None))."""
+    title, _, loc = ref.rpartition(",")
+    m = re.match(r"\s*(p|art)\.?\s*(\d+)", loc.strip(), re.IGNORECASE)
+    if not title or not m:
+        return norm(ref), (None, None)
+    return norm(title), (m.group(1).lower(), int(m.group(2)))
+
+
+def ref_hit(chunk: Any, ref: Ref) -> bool:
+    """El chunk es del documento de la referencia y contiene su página/artículo."""
+    title, (kind, num) = ref
+    if norm(chunk.title) != title:
+        return False
+    if kind == "p":
+        return chunk.page == num
+    if kind == "art":
+        return re.search(rf"\bart(?:[íi]culo|\.)\s*{num}\b", chunk.text, re.IGNORECASE) is not None
+    return True
+
+
+def load_gold(path: Path) -> List[Dict[str, Any]]:
+    """
+    Una pregunta por línea (se toleran comas al final). Admite ambos esquemas:
+    {q, a, refs} y {question, expected_answer, expected_doc}.
+    Lanza ValueError con el número de línea si algo no se puede leer.
+    """
+    items = []
+    for ln, raw in enumerate(path.read_text(encoding="utf-8-sig").splitlines(), start=1):
+        s = raw.strip().rstrip(",")
+        if not s:
+            continue
+        try:
+            item = json.loads(s)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON inválido en línea {ln}: {e}\nContenido: {s[:200]}")
+        q = item.get("q") or item.get("question")
+        if not q:
+            raise ValueError(f"Falta 'q'/'question' en línea {ln}")
+        refs = item.get("refs")
+        if refs is None:
+            exp_doc = item.get("expected_doc")
+            refs = [exp_doc] if exp_doc else []
+        elif isinstance(refs, str):
+            refs = [refs]
+        items.append({"line": ln, "question": q,
+                      "expected": item.get("a") or item.get("expected_answer") or "", "refs": refs})
+    return items
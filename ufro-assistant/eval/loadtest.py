@@ -0,0 +1,188 @@
+# eval/loadtest.py
+# Prueba de carga de /ask (o /ask/stream) a concurrencia fija, sin claves:
+# con el proveedor "stub" el LLM es providers/stub_server.py, así que lo que
+# se mide es el servidor (recuperación, caches, pool HTTP, event loop).
+#
+#   python providers/stub_server.py --latency-ms 400 --tokens-per-s 60 &
+#   uvicorn server:app --port 8200 &
+#   python eval/loadtest.py --concurrency 32 --requests 500
+#   python eval/loadtest.py --concurrency 32 --duration 60 --stream
+#
+# Reporta throughput, errores por tipo y p50/p95/p99 por etapa: latencia
+# vista por el cliente y, desde los `timings` del servidor, recuperación,
+# LLM (o primer token con --stream) y total.
+import asyncio
+import itertools
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Para resolver imports si se ejecuta con `python eval/loadtest.py`
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import click
+import httpx
+import numpy as np
+
+from eval.gold import load_gold
+
+STAGES = ("client_ms", "client_first_token_ms", "retrieval_ms", "llm_ms", "first_token_ms", "total_ms")
+
+
+async def ask_once(client: httpx.AsyncClient, server: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    r = await client.post(server + "/ask", data=data)
+    row: Dict[str, Any] = {"status": r.status_code, "client_ms": (time.perf_counter() - t0) * 1000.0}
+    if r.status_code != 200:
+        row["error"] = f"HTTP {r.status_code}"
+        return row
+    body = r.json()
+    row["cached"] = bool(body.get("cached"))
+    row["coalesced"] = bool(body.get("coalesced"))
+    row.update(body.get("timings") or {})
+    return row
+
+
+async def ask_stream_once(client: httpx.AsyncClient, server: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    row: Dict[str, Any] = {}
+    event = None
+    async with client.stream("POST", server + "/ask/stream", data=data) as r:
+        row["status"] = r.status_code
+        if r.status_code != 200:
+            await r.aread()
+            row["error"] = f"HTTP {r.status_code}"
+        else:
+            async for line in r.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    if event == "token" and "client_first_token_ms" not in row:
+                        row["client_first_token_ms"] = (time.perf_counter() - t0) * 1000.0
+                    elif event == "done":
+                        done = json.loads(line[5:])
+                        row["cached"] = bool(done.get("cached"))
+                        row["coalesced"] = bool(done.get("coalesced"))
+                        row.update(done.get("timings") or {})
+                    elif event == "error":
+                        row["error"] = "stream: " + str(json.loads(line[5:]).get("detail", ""))[:80]
+    row["client_ms"] = (time.perf_counter() - t0) * 1000.0
+    return row
+
+
+async def run_load(server: str, questions: List[str], form: Dict[str, Any], concurrency: int,
+                   total: Optional[int], duration: Optional[float], stream: bool, vary: bool,
+                   timeout: float) -> Dict[str, Any]:
+    send = ask_stream_once if stream else ask_once
+    counter = itertools.count()
+    rows: List[Dict[str, Any]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    deadline = time.perf_counter() + duration if duration else None
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            while True:
+                i = next(counter)
+                if total is not None and i >= total:
+                    return
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                q = questions[i % len(questions)]
+                if vary:
+                    q = f"{q} (#{i})"   # evita aciertos del cache exacto
+                try:
+                    row = await send(client, server, {**form, "question": q})
+                except httpx.HTTPError as e:
+                    row = {"status": 0, "error": type(e).__name__}
+                rows.append(row)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    return {"rows": rows, "wall_s": wall}
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"n": len(values), "mean": round(float(np.mean(values)), 1), "p50": round(float(p50), 1),
+            "p95": round(float(p95), 1), "p99": round(float(p99), 1), "max": round(float(max(values)), 1)}
+
+
+def summarize(rows: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    ok = [r for r in rows if not r.get("error")]
+    errors: Dict[str, int] = {}
+    for r in rows:
+        if r.get("error"):
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    stages = {}
+    for stage in STAGES:
+        p = percentiles([float(r[stage]) for r in ok if r.get(stage) is not None])
+        if p is not None:
+            stages[stage] = p
+    return {
+        "requests": len(rows), "ok": len(ok), "errors": errors, "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s > 0 else 0.0,
+        "cache_hit_rate": round(sum(1 for r in ok if r.get("cached")) / len(ok), 3) if ok else 0.0,
+        "coalesced_rate": round(sum(1 for r in ok if r.get("coalesced")) / len(ok), 3) if ok else 0.0,
+        "stages": stages,
+    }
+
+
+@click.command()
+@click.option("--server", default="http://127.0.0.1:8200", show_default=True, envvar="UFRO_SERVER")
+@click.option("--gold", default="eval/gold_set.jsonl", show_default=True, help="Preguntas a enviar (en ronda).")
+@click.option("--provider", default="stub", show_default=True)
+@click.option("--model", default=None)
+@click.option("--k", default=4, show_default=True)
+@click.option("--mode", type=click.Choice(["dense", "hybrid"]), default=None)
+@click.option("--rag/--no-rag", default=True, show_default=True)
+@click.option("--concurrency", default=16, show_default=True, help="Requests en vuelo a la vez.")
+@click.option("--requests", "total", default=None, type=int, help="Total de requests (por defecto 200 si no hay --duration).")
+@click.option("--duration", default=None, type=float, help="Segundos de carga (en vez de --requests).")
+@click.option("--warmup", default=8, show_default=True, help="Requests previas que no se cuentan.")
+@click.option("--stream/--no-stream", default=False, show_default=True, help="Usa /ask/stream y mide el primer token.")
+@click.option("--vary/--no-vary", default=True, show_default=True,
+              help="Agrega un sufijo único a cada pregunta para no medir el cache exacto.")
+@click.option("--timeout", default=60.0, show_default=True)
+@click.option("--out", default=None, help="Guarda el resumen (JSON).")
+def main(server, gold, provider, model, k, mode, rag, concurrency, total, duration, warmup, stream, vary,
+         timeout, out):
+    if total is None and duration is None:
+        total = 200
+    questions = [g["question"] for g in load_gold(Path(gold))]
+    if not questions:
+        raise click.ClickException(f"No hay preguntas en {gold}")
+    form: Dict[str, Any] = {"provider": provider, "k": k, "rag": rag}
+    if model:
+        form["model"] = model
+    if mode:
+        form["mode"] = mode
+
+    if warmup:
+        asyncio.run(run_load(server, questions, form, min(concurrency, warmup), warmup, None, stream, vary, timeout))
+    res = asyncio.run(run_load(server, questions, form, concurrency, total, duration, stream, vary, timeout))
+    summary = {"server": server, "provider": provider, "concurrency": concurrency, "stream": stream,
+               **summarize(res["rows"], res["wall_s"])}
+
+    click.echo(f"[carga] {summary['requests']} requests en {summary['wall_s']}s | concurrencia {concurrency} | "
+               f"{summary['throughput_rps']} req/s | cache {summary['cache_hit_rate']:.1%} | "
+               f"coalescidas {summary['coalesced_rate']:.1%}")
+    if summary["errors"]:
+        click.echo("[errores] " + ", ".join(f"{k}: {v}" for k, v in sorted(summary["errors"].items())))
+    click.echo(f"{'etapa':<22}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage, p in summary["stages"].items():
+        click.echo(f"{stage:<22}{p['n']:>6}{p['p50']:>10.1f}{p['p95']:>10.1f}{p['p99']:>10.1f}{p['max']:>10.1f}")
+
+    if out:
+        out_path = Path(out)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+        click.echo(f"[OK] Resumen en {out_path}")
+
+
+if __name__ == "__main__":
+    main()
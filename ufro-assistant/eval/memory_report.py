@@ -0,0 +1,120 @@
+# eval/memory_report.py
+# Memoria del servidor según el número de workers de uvicorn (solo Linux:
+# lee /proc/<pid>/smaps_rollup). Para cada N levanta `uvicorn server:app
+# --workers N`, espera a que todos carguen el Retriever y reporta por proceso
+# RSS, PSS (memoria compartida repartida entre quienes la usan) y privada.
+# La suma de PSS es lo que realmente ocupa el servidor.
+#
+#   python eval/memory_report.py --workers 1,2,4
+#   INDEX_MMAP=0 python eval/memory_report.py --workers 1,2,4   # comparación sin mmap
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import click
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def smaps(pid: int):
+    """kB de Rss, Pss y Private_* del proceso."""
+    out = {"rss": 0, "pss": 0, "private": 0}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key == "Rss":
+                out["rss"] = int(rest.split()[0])
+            elif key == "Pss":
+                out["pss"] = int(rest.split()[0])
+            elif key in ("Private_Clean", "Private_Dirty"):
+                out["private"] += int(rest.split()[0])
+    return out
+
+
+def descendants(pid: int):
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+    out, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        out.append(p)
+        stack.extend(children.get(p, []))
+    return out
+
+
+def wait_ready(url: str, workers: int, timeout: float) -> None:
+    """Hasta que `workers` pids distintos respondan /health con el Retriever cargado."""
+    ready, deadline = set(), time.time() + timeout
+    while len(ready) < workers:
+        if time.time() > deadline:
+            raise click.ClickException(f"Timeout esperando {workers} workers listos ({len(ready)} listos)")
+        try:
+            h = httpx.get(url + "/health", timeout=2.0).json()
+            if h.get("retriever_loaded"):
+                ready.add(h.get("pid"))
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+
+def mb(kb: int) -> float:
+    return round(kb / 1024.0, 1)
+
+
+@click.command()
+@click.option("--workers", "counts", default="1,2,4", show_default=True)
+@click.option("--port", default=8299, show_default=True)
+@click.option("--timeout", default=300.0, show_default=True)
+@click.option("--settle", default=3.0, show_default=True, help="Segundos de espera tras quedar listos.")
+@click.option("--out", default="eval/memory_report.json", show_default=True)
+def main(counts, port, timeout, settle, out):
+    if not Path("/proc/self/smaps_rollup").exists():
+        raise click.ClickException("Se necesita Linux con /proc/<pid>/smaps_rollup")
+    url = f"http://127.0.0.1:{port}"
+    rows = []
+    for n in [int(c) for c in counts.split(",") if c.strip()]:
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+                                 "--workers", str(n), "--log-level", "warning"], cwd=str(ROOT))
+        try:
+            wait_ready(url, n, timeout)
+            time.sleep(settle)
+            procs = []
+            for pid in descendants(proc.pid):
+                try:
+                    procs.append({"pid": pid, **smaps(pid)})
+                except OSError:
+                    continue
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+        total = {k: sum(p[k] for p in procs) for k in ("rss", "pss", "private")}
+        rows.append({"workers": n, "processes": [{k: (mb(v) if k != "pid" else v) for k, v in p.items()} for p in procs],
+                     "total_rss_mb": mb(total["rss"]), "total_pss_mb": mb(total["pss"]),
+                     "total_private_mb": mb(total["private"])})
+        click.echo(f"workers={n}: {len(procs)} procesos | RSS {mb(total['rss']):8.1f} MB | "
+                   f"PSS {mb(total['pss']):8.1f} MB | privada {mb(total['private']):8.1f} MB")
+        for p in procs:
+            click.echo(f"    pid {p['pid']:>7} RSS {mb(p['rss']):8.1f} | PSS {mb(p['pss']):8.1f} | privada {mb(p['private']):8.1f}")
+
+    out_path = Path(out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps({"index_mmap": os.getenv("INDEX_MMAP", "1"), "results": rows}, indent=2),
+                        encoding="utf-8")
+    click.echo(f"[OK] Resultados en {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# eval/onnx_parity.py
+# Paridad del encoder ONNX (int8) contra SentenceTransformer (torch) en las
+# preguntas del gold set: coseno mínimo/medio, acuerdo del top-k en el índice
+# actual y latencia por consulta. Sale con código 1 si el coseno mínimo cae
+# bajo --min-cos.
+#
+#   python rag/export_onnx.py && python eval/onnx_parity.py
+import time
+from pathlib import Path
+
+# Para resolver imports si se ejecuta con `python eval/onnx_parity.py`
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import click
+import numpy as np
+
+from eval.gold import load_gold
+from rag.onnx_encoder import ONNX_DIR, ONNX_MODEL_FILE, OnnxSentenceEncoder
+from rag.retrieve import MODEL_NAME
+from rag.release import current_release
+
+
+def per_query_ms(model, queries, repeat: int) -> float:
+    model.encode(queries[:1], normalize_embeddings=True, batch_size=1)   # calentamiento
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            model.encode([q], normalize_embeddings=True, batch_size=1)
+    return (time.perf_counter() - t0) * 1000.0 / (repeat * len(queries))
+
+
+@click.command()
+@click.option("--gold", default="eval/gold_set.jsonl", show_default=True)
+@click.option("--model-file", default=ONNX_MODEL_FILE, show_default=True)
+@click.option("--min-cos", default=0.98, show_default=True)
+@click.option("--k", default=4, show_default=True)
+@click.option("--repeat", default=5, show_default=True, help="Repeticiones para medir latencia.")
+def main(gold, model_file, min_cos, k, repeat):
+    queries = [g["question"] for g in load_gold(Path(gold))]
+    if not queries:
+        raise click.ClickException(f"No hay preguntas en {gold}")
+
+    t0 = time.perf_counter()
+    onnx_model = OnnxSentenceEncoder(ONNX_DIR, model_file)
+    onnx_load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    from sentence_transformers import SentenceTransformer
+    torch_model = SentenceTransformer(MODEL_NAME, device="cpu")
+    torch_load = time.perf_counter() - t0
+
+    ref = np.asarray(torch_model.encode(queries, normalize_embeddings=True), dtype="float32")
+    got = onnx_model.encode(queries, normalize_embeddings=True)
+    cos = np.sum(ref * got, axis=1)
+    click.echo(f"[paridad] {len(queries)} preguntas | coseno min {cos.min():.4f} | medio {cos.mean():.4f}")
+
+    index_path = current_release().index_path
+    if index_path.exists():
+        import faiss
+        index = faiss.read_index(str(index_path))
+        _, a = index.search(ref, k)
+        _, b = index.search(got, k)
+        overlap = np.mean([len(set(x) & set(y)) / k for x, y in zip(a, b)])
+        click.echo(f"[paridad] acuerdo top-{k} en {index_path}: {overlap:.3f}")
+
+    click.echo(f"[carga]   onnx {onnx_load:.2f}s | torch {torch_load:.2f}s")
+    click.echo(f"[latencia] onnx {per_query_ms(onnx_model, queries, repeat):.2f} ms/consulta | "
+               f"torch {per_query_ms(torch_model, queries, repeat):.2f} ms/consulta")
+
+    if cos.min() < min_cos:
+        raise click.ClickException(f"Coseno mínimo {cos.min():.4f} < {min_cos}")
+    click.echo("[OK] Paridad dentro del umbral")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
+import asyncio
+import os
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional
+
+from openai import OpenAI, AsyncOpenAI
+
+from .http import get_async_http_client, http_timeout
 
 
 class Provider(ABC):
@@ -13,3 +19,112 @@ class Provider(ABC):
         {"role": "system|user|assistant", "content": "..."}
         """
         raise NotImplementedError
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs: Any) -> Iterator[str]:
+        """
+        Entrega la respuesta en fragmentos de texto a medida que llegan.
+        Por defecto (proveedores sin streaming) entrega la respuesta completa.
+        """
+        yield self.chat(messages, **kwargs)
+
+
+_limiters: Dict[str, asyncio.Semaphore] = {}
+
+
+class AsyncProvider(ABC):
+    """
+    Variante asíncrona para el servidor: no bloquea el event loop mientras
+    espera al LLM. Cada proveedor limita sus llamadas simultáneas con un
+    semáforo (<NOMBRE>_MAX_CONCURRENCY en el entorno).
+    """
+    name: str
+    default_max_concurrency: int = 16
+
+    @property
+    def limiter(self) -> asyncio.Semaphore:
+        # Un semáforo por proveedor (no por modelo/instancia)
+        sem = _limiters.get(self.name)
+        if sem is None:
+            env = f"{self.name.upper()}_MAX_CONCURRENCY"
+            sem = _limiters[self.name] = asyncio.Semaphore(
+                int(os.getenv(env, str(self.default_max_concurrency)))
+            )
+        return sem
+
+    @abstractmethod
+    async def achat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        """Igual que Provider.chat, pero awaitable."""
+        raise NotImplementedError
+
+    async def astream(self, messages: List[Dict[str, str]], **kwargs: Any) -> AsyncIterator[str]:
+        """Versión async de Provider.stream (por defecto, un solo fragmento)."""
+        yield await self.achat(messages, **kwargs)
+
+
+class OpenAICompatibleProvider(Provider, AsyncProvider):
+    """
+    Proveedor con API compatible con OpenAI (OpenRouter, DeepSeek, stub).
+    La configuración de clientes vive solo aquí: el async usa el pool HTTP
+    compartido del proceso (providers/http.py) y el sync el mismo timeout,
+    así un cambio de timeout o límites vale para todos los proveedores.
+    """
+    model: str
+
+    def _connect(self, api_key: str, base_url: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            default_headers=headers,
+            timeout=http_timeout(),
+        )
+        # Cliente async sobre el pool HTTP compartido del proceso
+        self.aclient = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            default_headers=headers,
+            http_client=get_async_http_client(),
+        )
+
+    def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        resp = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=kwargs.get("temperature", 0.2),
+            max_tokens=kwargs.get("max_tokens", 256),
+        )
+        return (resp.choices[0].message.content or "").strip()
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs: Any) -> Iterator[str]:
+        resp = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=kwargs.get("temperature", 0.2),
+            max_tokens=kwargs.get("max_tokens", 256),
+            stream=True,
+        )
+        for event in resp:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+
+    async def achat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        async with self.limiter:
+            resp = await self.aclient.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=kwargs.get("temperature", 0.2),
+                max_tokens=kwargs.get("max_tokens", 256),
+            )
+        return (resp.choices[0].message.content or "").strip()
+
+    async def astream(self, messages: List[Dict[str, str]], **kwargs: Any) -> AsyncIterator[str]:
+        async with self.limiter:
+            resp = await self.aclient.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=kwargs.get("temperature", 0.2),
+                max_tokens=kwargs.get("max_tokens", 256),
+                stream=True,
+            )
+            async for event in resp:
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
@@ -1,13 +1,13 @@
 # providers/deepseek.py
 import os
-from typing import List, Dict, Any
 from dotenv import load_dotenv
-from openai import OpenAI
-from .base import Provider
+from .base import OpenAICompatibleProvider
 
 load_dotenv()
 
-class DeepSeekProvider(Provider):
+BASE_URL = "https://api.deepseek.com"
+
+class DeepSeekProvider(OpenAICompatibleProvider):
     name = "deepseek"
 
     def __init__(self, model: str = "deepseek-chat"):
@@ -15,17 +15,5 @@ class DeepSeekProvider(Provider):
         if not api_key:
             raise RuntimeError("Falta DEEPSEEK_API_KEY en tu .env")
 
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com",
-        )
+        self._connect(api_key, BASE_URL)
         self.model = model
-
-    def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=kwargs.get("temperature", 0.2),
-            max_tokens=kwargs.get("max_tokens", 256),
-        )
-        return (resp.choices[0].message.content or "").strip()
@@ -0,0 +1,34 @@
+# providers/http.py
+import os
+from typing import Optional
+
+import httpx
+
+# Cliente HTTP asíncrono compartido por todos los proveedores del proceso:
+# un solo pool de conexiones (keep-alive + HTTP/1.1) en vez de uno por request.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def http_timeout() -> httpx.Timeout:
+    """Timeout de las llamadas al LLM (LLM_TIMEOUT), igual para clientes sync y async."""
+    return httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "60")), connect=10.0)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=http_timeout(),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+            ),
+        )
+    return _client
+
+
+async def aclose_http_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
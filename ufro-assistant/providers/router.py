@@ -0,0 +1,285 @@
+# providers/router.py
+# Enrutamiento entre proveedores (p.ej. OpenRouter y DeepSeek) con:
+#   - hedging: si el primero no respondió dentro del percentil HEDGE_PERCENTILE
+#     de su latencia reciente, se lanza la misma request al siguiente; gana el
+#     que responda primero y el otro se cancela.
+#   - failover: si uno falla, se intenta con el siguiente.
+#   - estadísticas por proveedor (latencia, primer token, errores) que definen
+#     el orden (los que fallan seguido quedan al final por ROUTER_COOLDOWN_S)
+#     y el umbral del hedge.
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .base import Provider, AsyncProvider
+
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_DELAY_MS = float(os.getenv("HEDGE_DELAY_MS", "2000"))     # umbral mientras no hay muestras suficientes
+HEDGE_MIN_MS = float(os.getenv("HEDGE_MIN_MS", "200"))
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.2"))      # fracción máxima de llamadas con hedge
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "200"))
+ROUTER_TRIP_ERRORS = int(os.getenv("ROUTER_TRIP_ERRORS", "3"))   # errores seguidos para enfriar un proveedor
+ROUTER_COOLDOWN_S = float(os.getenv("ROUTER_COOLDOWN_S", "30"))
+
+
+def _percentile(values, p: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(len(s) * p / 100.0))]
+
+
+class ProviderStats:
+    """Ventana reciente de latencias y errores de un proveedor (compartida en el proceso)."""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self._lock = threading.Lock()
+        self.latency_ms: Deque[float] = deque(maxlen=window)       # respuesta completa (achat)
+        self.first_token_ms: Deque[float] = deque(maxlen=window)   # primer fragmento (astream)
+        self.outcomes: Deque[bool] = deque(maxlen=window)          # True = error
+        self.calls = self.errors = self.cancelled = self.hedges = self.wins = 0
+        self.censored = 0   # intentos cancelados cuyo tiempo entró a la ventana (ver cancelled_after)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def ok(self, ms: float, first_token: bool = False) -> None:
+        with self._lock:
+            (self.first_token_ms if first_token else self.latency_ms).append(ms)
+            self.outcomes.append(False)
+            self.calls += 1
+            self.consecutive_errors = 0
+
+    def error(self, e: BaseException) -> None:
+        with self._lock:
+            self.outcomes.append(True)
+            self.calls += 1
+            self.errors += 1
+            self.consecutive_errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"[:200]
+            if self.consecutive_errors >= ROUTER_TRIP_ERRORS:
+                self.cooldown_until = time.monotonic() + ROUTER_COOLDOWN_S
+
+    def cancelled_after(self, ms: float, first_token: bool = False) -> None:
+        """
+        Intento perdedor cancelado tras `ms`: su latencia real es al menos esa.
+        Solo entra a la ventana si supera el percentil del hedge: ahí la cota
+        ya dice "lento" y evita que los lentos desaparezcan de las muestras.
+        Una cota más baja no dice nada del valor real y, guardada como muestra
+        normal, haría bajar el percentil.
+        """
+        with self._lock:
+            samples = self.first_token_ms if first_token else self.latency_ms
+            self.cancelled += 1
+            if not samples or ms > _percentile(samples, HEDGE_PERCENTILE):
+                samples.append(ms)
+                self.censored += 1
+
+    def hedged(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+    def won(self) -> None:
+        with self._lock:
+            self.wins += 1
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def hedge_delay(self, first_token: bool = False) -> float:
+        """Segundos a esperar antes del hedge: percentil de la latencia reciente."""
+        with self._lock:
+            samples = list(self.first_token_ms if first_token else self.latency_ms)
+        if len(samples) < ROUTER_MIN_SAMPLES:
+            ms = HEDGE_DELAY_MS
+        else:
+            ms = _percentile(samples, HEDGE_PERCENTILE)
+        return max(HEDGE_MIN_MS, ms) / 1000.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        def pct(values, p):
+            return round(_percentile(values, p), 1) if values else None
+
+        with self._lock:
+            n = len(self.outcomes)
+            return {
+                "calls": self.calls, "errors": self.errors, "cancelled": self.cancelled,
+                "hedges": self.hedges, "wins": self.wins, "censored": self.censored,
+                "error_rate": round(sum(self.outcomes) / n, 4) if n else 0.0,
+                "latency_ms": {"p50": pct(self.latency_ms, 50), "p95": pct(self.latency_ms, 95),
+                               "p99": pct(self.latency_ms, 99)},
+                "first_token_ms": {"p50": pct(self.first_token_ms, 50), "p95": pct(self.first_token_ms, 95)},
+                "consecutive_errors": self.consecutive_errors,
+                "cooling_down": self.cooling_down(),
+                "last_error": self.last_error,
+            }
+
+
+_stats: Dict[str, ProviderStats] = {}
+_stats_lock = threading.Lock()
+
+
+def provider_stats(key: str) -> ProviderStats:
+    with _stats_lock:
+        st = _stats.get(key)
+        if st is None:
+            st = _stats[key] = ProviderStats()
+        return st
+
+
+def all_provider_stats() -> Dict[str, Dict[str, Any]]:
+    with _stats_lock:
+        items = list(_stats.items())
+    return {key: st.snapshot() for key, st in items}
+
+
+class RouterProvider(Provider, AsyncProvider):
+    """
+    Proveedor compuesto: mismo contrato que los demás (chat/stream/achat/astream),
+    pero reparte cada llamada entre `providers` (en orden de preferencia).
+    """
+    name = "router"
+
+    def __init__(self, providers: List[Any]):
+        if not providers:
+            raise RuntimeError("El router necesita al menos un proveedor")
+        self.providers = providers
+        self.model = ",".join(self._key(p) for p in providers)
+        self._hedged: Deque[bool] = deque(maxlen=ROUTER_WINDOW)
+
+    @staticmethod
+    def _key(p: Any) -> str:
+        return f"{p.name}:{getattr(p, 'model', '')}"
+
+    def _order(self) -> List[Tuple[Any, ProviderStats]]:
+        """Preferencia configurada, con los proveedores en enfriamiento al final (último recurso)."""
+        pairs = [(p, provider_stats(self._key(p))) for p in self.providers]
+        return [pair for _, pair in sorted(enumerate(pairs), key=lambda x: (x[1][1].cooling_down(), x[0]))]
+
+    def _may_hedge(self) -> bool:
+        n = len(self._hedged)
+        return n < ROUTER_MIN_SAMPLES or sum(self._hedged) / n < HEDGE_MAX_RATE
+
+    # ---------- sync: solo failover ----------
+    def chat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        last: Optional[BaseException] = None
+        for p, st in self._order():
+            t0 = time.perf_counter()
+            try:
+                out = p.chat(messages, **kwargs)
+            except Exception as e:
+                st.error(e)
+                last = e
+                continue
+            st.ok((time.perf_counter() - t0) * 1000.0)
+            return out
+        raise RuntimeError(f"Todos los proveedores fallaron: {last}")
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs: Any) -> Iterator[str]:
+        last: Optional[BaseException] = None
+        for p, st in self._order():
+            t0 = time.perf_counter()
+            it = p.stream(messages, **kwargs)
+            try:
+                first = next(it)
+            except StopIteration:
+                first = ""
+            except Exception as e:
+                st.error(e)
+                last = e
+                continue
+            st.ok((time.perf_counter() - t0) * 1000.0, first_token=True)
+            yield first
+            yield from it
+            return
+        raise RuntimeError(f"Todos los proveedores fallaron: {last}")
+
+    # ---------- async: hedge + failover ----------
+    async def _race(self, start, first_token: bool, discard=None):
+        """
+        Corre start(p) sobre los proveedores según la política y devuelve
+        (resultado, proveedor, stats) del primero que termina bien. Los demás
+        intentos en curso se cancelan; si otro también terminó bien, su
+        resultado se entrega a `discard` (p.ej. para cerrar un stream).
+        """
+        queue = self._order()
+        running: Dict["asyncio.Task[Any]", Tuple[Any, ProviderStats, float]] = {}
+        hedged = False
+        last: Optional[BaseException] = None
+
+        def launch() -> None:
+            p, st = queue.pop(0)
+            running[asyncio.ensure_future(start(p))] = (p, st, time.perf_counter())
+
+        launch()
+        try:
+            while running:
+                timeout = None
+                if queue and not hedged and len(running) == 1 and self._may_hedge():
+                    (_, st, t0), = running.values()
+                    timeout = max(0.0, st.hedge_delay(first_token) - (time.perf_counter() - t0))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # el primero va más lento que su percentil: segunda request al siguiente
+                    hedged = True
+                    queue[0][1].hedged()
+                    launch()
+                    continue
+                for task in done:
+                    p, st, t0 = running.pop(task)
+                    if task.exception() is None:
+                        st.ok((time.perf_counter() - t0) * 1000.0, first_token=first_token)
+                        if hedged:
+                            st.won()
+                        return task.result(), p, st
+                    last = task.exception()
+                    st.error(last)
+                if not running and queue:
+                    launch()   # failover
+            raise RuntimeError(f"Todos los proveedores fallaron: {last}")
+        finally:
+            self._hedged.append(hedged)
+            now = time.perf_counter()
+            for task, (_, st, t0) in running.items():
+                if not task.done():
+                    task.cancel()
+                    st.cancelled_after((now - t0) * 1000.0, first_token=first_token)
+                elif not task.cancelled():
+                    # Terminó en la misma vuelta que el ganador: se recupera su
+                    # excepción (evita "Task exception was never retrieved")
+                    exc = task.exception()
+                    if exc is not None:
+                        st.error(exc)
+                    else:
+                        st.ok((now - t0) * 1000.0, first_token=first_token)
+                        if discard is not None:
+                            asyncio.ensure_future(discard(task.result()))
+
+    async def achat(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        out, _, _ = await self._race(lambda p: p.achat(messages, **kwargs), first_token=False)
+        return out
+
+    async def astream(self, messages: List[Dict[str, str]], **kwargs: Any) -> AsyncIterator[str]:
+        # La carrera es por el primer fragmento; después se sigue solo con el ganador
+        async def first_piece(p):
+            agen = p.astream(messages, **kwargs)
+            try:
+                return agen, await agen.__anext__()
+            except StopAsyncIteration:
+                return agen, ""
+            except BaseException:
+                await agen.aclose()
+                raise
+
+        async def close(result):
+            await result[0].aclose()
+
+        (agen, first), _, _ = await self._race(first_piece, first_token=True, discard=close)
+        try:
+            yield first
+            async for piece in agen:
+                yield piece
+        finally:
+            await agen.aclose()
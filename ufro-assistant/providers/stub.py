@@ -0,0 +1,17 @@
+# providers/stub.py
+# Proveedor "stub": habla con un servidor local compatible con OpenAI
+# (providers/stub_server.py) para medir el servidor sin claves ni red.
+# Reutiliza OpenRouterProvider (cliente OpenAI, pool HTTP compartido) con su
+# propio semáforo de concurrencia, así que la carga es comparable.
+import os
+from .openrouter import OpenRouterProvider
+
+STUB_BASE_URL = os.getenv("STUB_BASE_URL", "http://127.0.0.1:8300/v1")
+
+class StubProvider(OpenRouterProvider):
+    name = "stub"
+
+    def __init__(self, model: str = "stub"):
+        # El servidor stub no valida la clave, pero el cliente OpenAI exige una
+        self._connect(os.getenv("STUB_API_KEY", "stub"), STUB_BASE_URL)
+        self.model = model
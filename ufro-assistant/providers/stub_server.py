@@ -0,0 +1,149 @@
+# providers/stub_server.py
+# Servidor local compatible con la API de OpenAI (/v1/chat/completions) para
+# pruebas de carga sin claves ni latencia remota. Latencia hasta el primer
+# token, velocidad de tokens, largo de respuesta y errores son configurables:
+#
+#   python providers/stub_server.py --port 8300 --latency-ms 400 --dist lognormal \
+#       --tokens-per-s 60 --tokens 120 --error-rate 0.02
+#
+# o con uvicorn (config por entorno STUB_*): uvicorn providers.stub_server:app --port 8300
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CONFIG: Dict[str, Any] = {
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", "300")),      # media hasta el primer token
+    "dist": os.getenv("STUB_LATENCY_DIST", "lognormal"),            # fixed | uniform | exponential | lognormal
+    "jitter": float(os.getenv("STUB_LATENCY_JITTER", "0.5")),       # dispersión relativa
+    "tokens_per_s": float(os.getenv("STUB_TOKENS_PER_S", "50")),    # 0 = todo de una vez
+    "tokens": int(os.getenv("STUB_TOKENS", "80")),                  # largo de la respuesta
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),         # fracción de requests con error HTTP
+    "error_codes": [int(c) for c in os.getenv("STUB_ERROR_CODES", "500,429").split(",") if c.strip()],
+    "abort_rate": float(os.getenv("STUB_ABORT_RATE", "0")),         # streams cortados a mitad
+}
+_rng = random.Random(int(os.getenv("STUB_SEED", "0")) or None)
+
+WORDS = ("según el reglamento vigente la universidad establece que el estudiante debe realizar "
+         "la solicitud en los plazos del calendario académico ante la dirección de registro").split()
+
+app = FastAPI(title="Stub LLM (OpenAI-compatible)")
+stats = {"requests": 0, "errors": 0, "aborted": 0, "streams": 0}
+
+
+def first_token_delay() -> float:
+    mean = CONFIG["latency_ms"] / 1000.0
+    dist, jitter = CONFIG["dist"], CONFIG["jitter"]
+    if mean <= 0 or dist == "fixed":
+        return max(0.0, mean)
+    if dist == "uniform":
+        return _rng.uniform(mean * (1 - jitter), mean * (1 + jitter))
+    if dist == "exponential":
+        return _rng.expovariate(1.0 / mean)
+    # lognormal con media `mean`: cola larga, como un proveedor real
+    sigma = max(1e-6, jitter)
+    return _rng.lognormvariate(math.log(mean) - sigma * sigma / 2.0, sigma)
+
+
+def answer_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> List[str]:
+    n = max(1, min(CONFIG["tokens"], max_tokens or CONFIG["tokens"]))
+    seed = sum(len(str(m.get("content", ""))) for m in messages)
+    return [("" if i == 0 else " ") + WORDS[(seed + i) % len(WORDS)] for i in range(n)]
+
+
+def error_response():
+    stats["errors"] += 1
+    code = _rng.choice(CONFIG["error_codes"] or [500])
+    return JSONResponse({"error": {"message": f"stub: error inyectado {code}", "type": "stub_error"}},
+                        status_code=code)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    if _rng.random() < CONFIG["error_rate"]:
+        await asyncio.sleep(first_token_delay() / 4)
+        return error_response()
+
+    model = body.get("model", "stub")
+    tokens = answer_tokens(body.get("messages", []), int(body.get("max_tokens") or 0))
+    step = 1.0 / CONFIG["tokens_per_s"] if CONFIG["tokens_per_s"] > 0 else 0.0
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(first_token_delay() + step * (len(tokens) - 1))
+        return {
+            "id": cid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        }
+
+    stats["streams"] += 1
+    abort_at = _rng.randrange(len(tokens)) if _rng.random() < CONFIG["abort_rate"] else None
+
+    def chunk(delta: Dict[str, Any], finish=None) -> str:
+        return "data: " + json.dumps({"id": cid, "object": "chat.completion.chunk", "created": created,
+                                      "model": model, "choices": [{"index": 0, "delta": delta,
+                                                                   "finish_reason": finish}]}) + "\n\n"
+
+    async def events():
+        await asyncio.sleep(first_token_delay())
+        yield chunk({"role": "assistant", "content": ""})
+        for i, tok in enumerate(tokens):
+            if abort_at is not None and i == abort_at:
+                stats["aborted"] += 1
+                raise RuntimeError("stub: stream cortado")
+            if i and step:
+                await asyncio.sleep(step)
+            yield chunk({"content": tok})
+        yield chunk({}, finish="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "local"}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "config": CONFIG}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="LLM falso compatible con OpenAI para pruebas de carga")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8300)
+    ap.add_argument("--latency-ms", type=float, default=CONFIG["latency_ms"])
+    ap.add_argument("--dist", choices=["fixed", "uniform", "exponential", "lognormal"], default=CONFIG["dist"])
+    ap.add_argument("--jitter", type=float, default=CONFIG["jitter"])
+    ap.add_argument("--tokens-per-s", type=float, default=CONFIG["tokens_per_s"])
+    ap.add_argument("--tokens", type=int, default=CONFIG["tokens"])
+    ap.add_argument("--error-rate", type=float, default=CONFIG["error_rate"])
+    ap.add_argument("--abort-rate", type=float, default=CONFIG["abort_rate"])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    for key in ("latency_ms", "dist", "jitter", "tokens_per_s", "tokens", "error_rate", "abort_rate"):
+        CONFIG[key] = getattr(args, key)
+    if args.seed:
+        _rng.seed(args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
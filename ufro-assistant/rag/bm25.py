@@ -0,0 +1,147 @@
+# rag/bm25.py
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_PATH = Path("data/bm25.npz")
+
+# Stopwords frecuentes del español (sin tildes, igual que los tokens)
+STOPWORDS = set("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales cuando de del
+desde donde dos durante e el ella ellas ellos en entre era es esa esas ese eso esos esta estas este
+esto estos fue fueron ha han hasta hay la las le les lo los mas me mi mis muy ni no nos o os otra
+otras otro otros para pero poco por porque que quien quienes se sea sean segun ser si sin sobre
+son su sus tambien te tiene tienen toda todas todo todos tu tus u un una unas uno unos y ya
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./-][0-9]+)*")
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _stem(tok: str) -> str:
+    # Stemming mínimo de plurales: semestre/semestres -> semestr,
+    # profesor/profesores -> profesor, vez/veces -> vez
+    if tok.isdigit() or len(tok) <= 4:
+        return tok
+    if tok.endswith("ces"):
+        return tok[:-3] + "z"
+    if tok.endswith("s"):
+        tok = tok[:-1]
+    if tok.endswith("e") and tok[-2] not in "aeiou":
+        tok = tok[:-1]
+    return tok
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenizador para normativa en español: minúsculas, sin tildes, conserva
+    números, fechas (17/03/2025) y numerales de artículos (4.2).
+    """
+    toks = _TOKEN_RE.findall(_strip_accents(text.casefold()))
+    return [_stem(t) for t in toks if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    BM25 con postings en arreglos (CSR): para el término t, sus documentos
+    están en doc_idx[offsets[t]:offsets[t+1]] con frecuencias en tf[...].
+    """
+
+    def __init__(self, terms: Dict[str, int], offsets: np.ndarray, doc_idx: np.ndarray,
+                 tf: np.ndarray, doc_len: np.ndarray, chunk_ids: np.ndarray,
+                 k1: float = 1.2, b: float = 0.75):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_idx = doc_idx
+        self.tf = tf
+        self.doc_len = doc_len
+        self.chunk_ids = chunk_ids
+        self.k1 = k1
+        self.b = b
+        n = len(doc_len)
+        df = np.diff(offsets).astype("float32")
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype("float32")
+        avgdl = float(doc_len.mean()) if n else 1.0
+        # Denominador precalculado por documento: k1 * (1 - b + b·dl/avgdl)
+        self._norm = (k1 * (1.0 - b + b * doc_len / max(avgdl, 1e-9))).astype("float32")
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[int, str]]) -> "BM25Index":
+        terms: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        doc_len: List[int] = []
+        chunk_ids: List[int] = []
+        for d, (chunk_id, text) in enumerate(docs):
+            toks = tokenize(text)
+            counts: Dict[int, int] = {}
+            for tok in toks:
+                tid = terms.setdefault(tok, len(terms))
+                counts[tid] = counts.get(tid, 0) + 1
+            if len(postings) < len(terms):
+                postings.extend([] for _ in range(len(terms) - len(postings)))
+            for tid, c in counts.items():
+                postings[tid].append((d, c))
+            doc_len.append(len(toks))
+            chunk_ids.append(int(chunk_id))
+
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        doc_idx = np.fromiter((d for p in postings for d, _ in p), dtype="int32", count=int(offsets[-1]))
+        tf = np.fromiter((c for p in postings for _, c in p), dtype="float32", count=int(offsets[-1]))
+        return cls(terms, offsets, doc_idx, tf, np.asarray(doc_len, dtype="float32"),
+                   np.asarray(chunk_ids, dtype="int64"))
+
+    def search(self, query: str, k: int = 10, ids: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (chunk_id, score) para la consulta; `ids` restringe a esos chunk_id."""
+        tids = {self.terms[t] for t in tokenize(query) if t in self.terms}
+        if not tids:
+            return []
+        # Solo se tocan los documentos de las listas de postings de la consulta
+        # (nada de arreglos del tamaño del corpus por consulta)
+        docs, parts = [], []
+        for tid in tids:
+            a, b = self.offsets[tid], self.offsets[tid + 1]
+            d = self.doc_idx[a:b]
+            tf = self.tf[a:b]
+            docs.append(d)
+            parts.append(self.idf[tid] * tf * (self.k1 + 1.0) / (tf + self._norm[d]))
+        cand, inv = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(parts), minlength=len(cand))
+        if ids is not None:
+            keep = np.isin(self.chunk_ids[cand], ids)
+            cand, scores = cand[keep], scores[keep]
+        k = min(k, len(cand))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.chunk_ids[cand[i]]), float(scores[i])) for i in top]
+
+    def save(self, path: Path = BM25_PATH) -> None:
+        vocab = np.array(sorted(self.terms, key=self.terms.get), dtype=object)
+        np.savez(path, vocab=vocab.astype(str), offsets=self.offsets, doc_idx=self.doc_idx,
+                 tf=self.tf, doc_len=self.doc_len, chunk_ids=self.chunk_ids,
+                 params=np.array([self.k1, self.b], dtype="float32"))
+
+    @classmethod
+    def load(cls, path: Path = BM25_PATH) -> "BM25Index":
+        z = np.load(path, allow_pickle=False)
+        terms = {t: i for i, t in enumerate(z["vocab"].tolist())}
+        k1, b = (float(x) for x in z["params"])
+        return cls(terms, z["offsets"], z["doc_idx"], z["tf"], z["doc_len"], z["chunk_ids"], k1=k1, b=b)
+
+
+def rrf_fuse(rankings: List[List[int]], k: int, c: int = 60) -> List[Tuple[int, float]]:
+    """Reciprocal rank fusion: score(id) = Σ 1 / (c + rank)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            fused[cid] = fused.get(cid, 0.0) + 1.0 / (c + rank)
+    return sorted(fused.items(), key=lambda x: -x[1])[:k]
@@ -0,0 +1,140 @@
+# rag/cache.py
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+CACHE_PATH = Path("data/cache/answers.sqlite")
+PURGE_EVERY = 256   # cada cuántas escrituras se borran de SQLite las filas vencidas
+
+
+def normalize_question(q: str) -> str:
+    """
+    Normaliza la pregunta para el cache: minúsculas, sin tildes, sin signos
+    (¿?¡!.,;:) y con espacios colapsados.
+    """
+    q = unicodedata.normalize("NFKD", q.casefold())
+    q = "".join(ch for ch in q if not unicodedata.combining(ch))
+    q = re.sub(r"[¿?¡!.,;:\"'()]+", " ", q)
+    return re.sub(r"\s+", " ", q).strip()
+
+
+def file_fingerprint(*paths: Path) -> str:
+    """Versión de un conjunto de archivos (tamaño + mtime); cambia al reconstruir el índice."""
+    h = hashlib.sha1()
+    for p in paths:
+        st = p.stat()
+        h.update(f"{p}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Cache exacto de respuestas en dos niveles:
+      - memoria: LRU acotado con TTL
+      - disco:   SQLite local, sobrevive reinicios
+
+    Todas las entradas pertenecen a una versión del índice; al cambiar la
+    versión (índice reconstruido) se descartan ambos niveles. Las filas de
+    SQLite guardan su versión: con varios workers compartiendo el archivo, uno
+    que aún no recarga escribe bajo su versión y los demás no leen esas filas.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, max_items: int = 1024, ttl_s: float = 7 * 24 * 3600):
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self.index_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        cols = [r[1] for r in self._db.execute("PRAGMA table_info(answers)")]
+        if cols and "version" not in cols:
+            self._db.execute("DROP TABLE answers")   # formato anterior, sin versión por fila
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT NOT NULL, version TEXT NOT NULL, created REAL NOT NULL, payload TEXT NOT NULL,"
+            " PRIMARY KEY (key, version))"
+        )
+        self._db.commit()
+        self._puts = 0
+        self.purge_expired()
+
+    @staticmethod
+    def make_key(question: str, chunk_ids: Iterable[Any], provider: str, model: str,
+                 prompt_version: str, k: int) -> str:
+        raw = json.dumps([normalize_question(question), [str(c) for c in chunk_ids],
+                          provider, model, prompt_version, int(k)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def set_index_version(self, version: str) -> None:
+        """Fija la versión del índice; si cambió, borra las entradas de otras versiones."""
+        with self._lock:
+            if version != self.index_version:
+                self._db.execute("DELETE FROM answers WHERE version != ?", (version,))
+                self._db.commit()
+                self._mem.clear()
+            self.index_version = version
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None and item[0] > now:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            row = self._db.execute("SELECT created, payload FROM answers WHERE key=? AND version=?",
+                                   (key, self.index_version or "")).fetchone()
+            if row is None or row[0] + self.ttl_s <= now:
+                self._mem.pop(key, None)
+                self.misses += 1
+                return None
+            payload = json.loads(row[1])
+            self._remember(key, row[0] + self.ttl_s, payload)
+            self.hits += 1
+            return payload
+
+    def put(self, key: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now + self.ttl_s, payload)
+            self._db.execute("INSERT OR REPLACE INTO answers (key, version, created, payload) VALUES (?, ?, ?, ?)",
+                             (key, self.index_version or "", now, json.dumps(payload, ensure_ascii=False)))
+            self._db.commit()
+            self._puts += 1
+            purge = self._puts % PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Borra de SQLite las filas más viejas que el TTL (get ya no las devuelve). Devuelve cuántas."""
+        with self._lock:
+            n = self._db.execute("DELETE FROM answers WHERE created <= ?", (time.time() - self.ttl_s,)).rowcount
+            self._db.commit()
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "mem_items": len(self._mem),
+            "index_version": self.index_version,
+        }
+
+    def _remember(self, key: str, expires: float, payload: Dict[str, Any]) -> None:
+        self._mem[key] = (expires, payload)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
@@ -0,0 +1,133 @@
+# rag/chunking.py
+import re
+from typing import Iterator, List, Optional, Tuple
+
+from rag.context import CHARS_PER_TOKEN
+
+# Encabezados de la normativa: TÍTULO/CAPÍTULO cortan siempre; ARTÍCULO corta
+# si el chunk en curso ya tiene un tamaño razonable (artículos cortos se agrupan).
+# Solo encabezados reales: en mayúsculas o con mayúscula inicial, y seguidos de
+# "." / "°" / "-" / ":" o solos en su línea. Una cita dentro del texto ("artículo
+# 12 del reglamento...") no corta aunque un salto de línea la deje al inicio.
+HEADING_RE = re.compile(
+    r"^[ \t]*(?:(?P<major>T[ÍI]TULO|T[íi]tulo|CAP[ÍI]TULO|Cap[íi]tulo)[ \t]+[IVXLCDM\d]+"
+    r"|(?P<article>ART[ÍI]CULO|Art[íi]culo|ART\.|Art\.)[ \t]*\d+)"
+    r"[ \t]*(?:[.°º:\-–]|$)",
+    re.MULTILINE,
+)
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"(?<=[.;:!?])\s+(?=[¿¡(\"«A-ZÁÉÍÓÚÑ0-9])")
+
+STRUCT_TARGET_TOKENS = 400   # tamaño objetivo de un chunk
+STRUCT_MAX_TOKENS = 600      # nunca se supera (salvo una sola oración enorme, que se corta)
+STRUCT_MIN_TOKENS = 150      # por debajo, un artículo se une con el siguiente
+STRUCT_VERSION = 3           # sube al cambiar el algoritmo (entra en la firma de rag/ingest.py)
+
+
+def _split(text: str, start: int, end: int, sep: re.Pattern) -> List[Tuple[int, int]]:
+    """Corta [start, end) después de cada separador; las piezas cubren todo el rango."""
+    pieces, a = [], start
+    for m in sep.finditer(text, start, end):
+        if m.end() > a:
+            pieces.append((a, m.end()))
+            a = m.end()
+    if a < end:
+        pieces.append((a, end))
+    return pieces
+
+
+def _units(text: str, start: int, end: int, max_chars: int) -> Iterator[Tuple[int, int]]:
+    """Piezas ≤ max_chars: la sección entera, o párrafos, u oraciones, o ventanas fijas."""
+    if end - start <= max_chars:
+        yield start, end
+        return
+    for a, b in _split(text, start, end, PARAGRAPH_RE):
+        if b - a <= max_chars:
+            yield a, b
+            continue
+        for c, d in _split(text, a, b, SENTENCE_RE):
+            if d - c <= max_chars:
+                yield c, d
+            else:
+                for s in range(c, d, max_chars):
+                    yield s, min(d, s + max_chars)
+
+
+def _strip(text: str, a: int, b: int) -> Optional[Tuple[int, int]]:
+    while a < b and text[a].isspace():
+        a += 1
+    while b > a and text[b - 1].isspace():
+        b -= 1
+    return (a, b) if b > a else None
+
+
+def structure_spans(text: str, target_tokens: int = STRUCT_TARGET_TOKENS,
+                    max_tokens: int = STRUCT_MAX_TOKENS,
+                    min_tokens: int = STRUCT_MIN_TOKENS) -> List[Tuple[int, int]]:
+    """
+    Rangos [inicio, fin) sin solape alineados a la estructura del reglamento:
+    secciones por TÍTULO/CAPÍTULO/ARTÍCULO, luego párrafos y oraciones, juntando
+    piezas hasta ~target_tokens. Una pasada lineal con regex sobre el texto.
+    Los tamaños en tokens son estimaciones (CHARS_PER_TOKEN caracteres por
+    token), no conteos del tokenizador del modelo de embeddings.
+    """
+    target = int(target_tokens * CHARS_PER_TOKEN)
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    min_chars = int(min_tokens * CHARS_PER_TOKEN)
+
+    bounds = [(m.start(), "major" if m.group("major") else "article") for m in HEADING_RE.finditer(text)]
+    if not bounds or bounds[0][0] > 0:
+        bounds.insert(0, (0, "major"))
+    sections = [(pos, bounds[i + 1][0] if i + 1 < len(bounds) else len(text), kind)
+                for i, (pos, kind) in enumerate(bounds)]
+
+    spans: List[Tuple[int, int]] = []
+    cur: Optional[Tuple[int, int]] = None
+
+    def flush():
+        if cur is not None:
+            span = _strip(text, *cur)
+            if span:
+                spans.append(span)
+
+    for sec_start, sec_end, kind in sections:
+        if cur is not None and (kind == "major" or cur[1] - cur[0] >= min_chars):
+            flush()
+            cur = None
+        for a, b in _units(text, sec_start, sec_end, max_chars):
+            if cur is not None and (b - cur[0] > max_chars or cur[1] - cur[0] >= target):
+                flush()
+                cur = None
+            cur = (a, b) if cur is None else (cur[0], b)
+    flush()
+    return _absorb_small(text, spans, min_chars)
+
+
+def _absorb_small(text: str, spans: List[Tuple[int, int]], min_chars: int) -> List[Tuple[int, int]]:
+    """
+    Ningún rango queda bajo min_chars: un encabezado suelto (p.ej. "TÍTULO I\n
+    DISPOSICIONES GENERALES" seguido de un párrafo que no cabía con él) se
+    antepone al rango siguiente, y otro rango corto se une al anterior. El
+    resultado puede pasar max_tokens a lo más en min_tokens.
+    """
+    out: List[Tuple[int, int]] = []
+    head: Optional[int] = None   # inicio de un encabezado pendiente
+    for a, b in spans:
+        if head is not None:
+            a, head = head, None
+        if b - a < min_chars:
+            if HEADING_RE.match(text[a:b]):
+                head = a
+                continue
+            if out:
+                out[-1] = (out[-1][0], b)
+                continue
+        out.append((a, b))
+    if head is not None:
+        # encabezado al final del texto: va con lo anterior, si hay
+        end = spans[-1][1]
+        if out:
+            out[-1] = (out[-1][0], end)
+        else:
+            out.append((head, end))
+    return out
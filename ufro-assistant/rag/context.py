@@ -0,0 +1,138 @@
+# rag/context.py
+import hashlib
+import math
+import os
+import re
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+
+# Presupuesto de tokens de contexto por modelo:
+#   CONTEXT_TOKENS=3000 (por defecto) y CONTEXT_TOKENS_BY_MODEL="deepseek-chat=6000,openai/gpt-4.1-mini=4000"
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "3000"))
+CHARS_PER_TOKEN = 4.0   # aprox. para español con tokenizadores BPE (3800 chars ≈ 900-1000 tokens)
+MIN_TRIM_TOKENS = 120   # no vale la pena agregar un fragmento recortado más corto que esto
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for item in spec.split(","):
+        model, sep, value = item.strip().rpartition("=")
+        if sep and model:
+            out[model.strip()] = int(value)
+    return out
+
+
+CONTEXT_TOKENS_BY_MODEL = _parse_budgets(os.getenv("CONTEXT_TOKENS_BY_MODEL", ""))
+
+
+def token_budget(model: Optional[str]) -> int:
+    return CONTEXT_TOKENS_BY_MODEL.get(model or "", CONTEXT_TOKENS)
+
+
+def estimate_tokens(text: str) -> int:
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def _is_missing(x: Any) -> bool:
+    return x is None or (isinstance(x, float) and math.isnan(x))
+
+
+def _has_span(c: Any) -> bool:
+    return not _is_missing(getattr(c, "char_start", None)) and not _is_missing(getattr(c, "char_end", None))
+
+
+def _merge_spans(chunks: List[Any]) -> Tuple[List[Any], int]:
+    """
+    Une chunks del mismo documento cuyos rangos [char_start, char_end) se
+    solapan o tocan. El bloque unido conserva el mejor score de sus partes.
+    """
+    by_doc: Dict[str, List[Any]] = {}
+    blocks: List[Any] = []
+    for c in chunks:
+        if _has_span(c):
+            by_doc.setdefault(c.doc_id, []).append(c)
+        else:
+            blocks.append(c)
+
+    merged = 0
+    for parts in by_doc.values():
+        parts.sort(key=lambda c: int(c.char_start))
+        cur = parts[0]
+        for nxt in parts[1:]:
+            if int(nxt.char_start) <= int(cur.char_end):
+                tail = nxt.text[int(cur.char_end) - int(nxt.char_start):] if int(nxt.char_end) > int(cur.char_end) else ""
+                if cur.page == nxt.page or _is_missing(nxt.page):
+                    page = cur.page
+                elif _is_missing(cur.page):
+                    page = nxt.page
+                else:
+                    page = f"{str(cur.page).split('-')[0]}-{nxt.page}"
+                cur = replace(cur, text=cur.text + tail, score=max(cur.score, nxt.score), page=page,
+                              char_end=max(int(cur.char_end), int(nxt.char_end)))
+                merged += 1
+            else:
+                blocks.append(cur)
+                cur = nxt
+        blocks.append(cur)
+    return blocks, merged
+
+
+def _trim(text: str, max_tokens: int) -> str:
+    """Corta en el último fin de oración (o espacio) antes del límite."""
+    limit = int(max_tokens * CHARS_PER_TOKEN)
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind(".\n"))
+    if end < limit // 2:
+        end = cut.rfind(" ")
+    return (cut[:end + 1] if end > 0 else cut).rstrip() + " […]"
+
+
+def pack_context(chunks: List[Any], budget_tokens: int) -> Tuple[List[Any], Dict[str, int]]:
+    """
+    Prepara los chunks recuperados para el prompt:
+      1) une fragmentos solapados/contiguos del mismo documento,
+      2) descarta textos duplicados,
+      3) agrega bloques por score hasta `budget_tokens` (el último puede recortarse;
+         el primero va siempre, recortado si no cabe, aunque quede bajo MIN_TRIM_TOKENS).
+    Devuelve (bloques, stats) con tokens antes/después y ahorrados.
+    """
+    tokens_in = sum(estimate_tokens(c.text) for c in chunks)
+    blocks, merged = _merge_spans(chunks)
+
+    seen = set()
+    unique: List[Any] = []
+    for b in sorted(blocks, key=lambda c: -c.score):
+        digest = hashlib.sha1(" ".join(b.text.split()).casefold().encode("utf-8")).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        unique.append(b)
+
+    packed: List[Any] = []
+    used = 0
+    trimmed = 0
+    for b in unique:
+        need = estimate_tokens(b.text)
+        if used + need <= budget_tokens:
+            packed.append(b)
+            used += need
+            continue
+        room = budget_tokens - used
+        if room >= MIN_TRIM_TOKENS or not packed:
+            b = replace(b, text=_trim(b.text, max(1, room)))
+            packed.append(b)
+            used += estimate_tokens(b.text)
+            trimmed += 1
+        break
+
+    stats = {
+        "tokens_in": tokens_in,
+        "tokens_out": used,
+        "tokens_saved": max(0, tokens_in - used),
+        "budget": budget_tokens,
+        "merged": merged,
+        "duplicates": len(blocks) - len(unique),
+        "dropped": len(unique) - len(packed),
+        "trimmed": trimmed,
+    }
+    return packed, stats
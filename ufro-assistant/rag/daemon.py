@@ -0,0 +1,179 @@
+# rag/daemon.py
+# Daemon opcional que mantiene el Retriever cargado (índice, metadatos y
+# modelo de consultas) y responde recuperaciones por un socket Unix local.
+# app.py lo usa automáticamente si está corriendo, así cada pregunta del CLI
+# no vuelve a importar faiss/torch ni a cargar el índice.
+#
+#   python rag/daemon.py serve &        # queda escuchando en UFRO_DAEMON_SOCKET
+#   python app.py "¿Cuándo inicia el semestre?"
+#   python rag/daemon.py status | reload | stop
+#
+# Protocolo: una línea JSON por request y una por respuesta ({"ok": ..., ...}).
+# Si el índice en disco cambia (rag/embed.py) se recarga solo en la siguiente consulta.
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Para resolver imports de rag.* al ejecutar `python rag/daemon.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.schema import RetrievedChunk, RetrievalFilter
+
+SOCKET_PATH = Path(os.getenv("UFRO_DAEMON_SOCKET", "data/run/retriever.sock"))
+
+
+# ==============================
+# Cliente (liviano: sin faiss/torch)
+# ==============================
+def call(request: Dict[str, Any], timeout: float = 120.0, path: Path = SOCKET_PATH) -> Optional[Dict[str, Any]]:
+    """Envía una request al daemon. None si no hay daemon escuchando en `path`."""
+    if not path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(str(path))
+            s.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            line = s.makefile("rb").readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None   # socket huérfano de un daemon que ya no corre
+    if not line:
+        raise RuntimeError("El daemon cerró la conexión sin responder")
+    resp = json.loads(line)
+    if not resp.get("ok"):
+        raise RuntimeError(resp.get("error", "error en el daemon"))
+    return resp
+
+
+def daemon_query(question: str, k: int = 4, mode: Optional[str] = None,
+                 filt: Optional[RetrievalFilter] = None) -> Optional[List[RetrievedChunk]]:
+    """Recuperación vía daemon; None si no está corriendo (el llamador usa un Retriever local)."""
+    resp = call({"op": "query", "question": question, "k": k, "mode": mode,
+                 "filter": asdict(filt) if filt is not None else None})
+    if resp is None:
+        return None
+    return [RetrievedChunk(**c) for c in resp["chunks"]]
+
+
+# ==============================
+# Servidor
+# ==============================
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class RetrieverDaemon:
+    def __init__(self, path: Path = SOCKET_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.retriever = self._load()
+        self.started = time.time()
+        self.queries = 0
+        self.server: Optional[_Server] = None
+
+    def _load(self):
+        from rag.retrieve import Retriever
+        t0 = time.perf_counter()
+        r = Retriever()
+        r.warmup()
+        print(f"[daemon] Retriever listo en {time.perf_counter() - t0:.1f}s (índice {r.version})", flush=True)
+        return r
+
+    def _replace(self) -> None:
+        """Carga un Retriever nuevo y detiene el anterior (llamar con _lock tomado)."""
+        old, self.retriever = self.retriever, self._load()
+        old.close()
+
+    def current(self):
+        """El Retriever vigente; lo recarga si el índice en disco cambió."""
+        from rag.retrieve import index_version
+        r = self.retriever
+        if r.version != index_version():
+            with self._lock:
+                if self.retriever.version != index_version():
+                    self._replace()
+                r = self.retriever
+        return r
+
+    def dispatch(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        op = req.get("op")
+        if op == "query":
+            f = req.get("filter") or {}
+            filt = RetrievalFilter.make(f.get("doc_ids"), f.get("vigencia_min"), f.get("tipos"))
+            chunks = self.current().query(req["question"], k=int(req.get("k", 4)), mode=req.get("mode"), filt=filt)
+            self.queries += 1
+            return {"chunks": [asdict(c) for c in chunks]}
+        if op == "status":
+            return {"pid": os.getpid(), "index_version": self.retriever.version, "queries": self.queries,
+                    "uptime_s": round(time.time() - self.started, 1)}
+        if op == "reload":
+            with self._lock:
+                self._replace()
+            return {"index_version": self.retriever.version}
+        if op == "stop":
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {}
+        raise ValueError(f"Operación no soportada: {op}")
+
+    def serve(self) -> None:
+        if call({"op": "status"}, timeout=2.0, path=self.path) is not None:
+            raise SystemExit(f"Ya hay un daemon escuchando en {self.path}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)   # socket huérfano
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    resp = {"ok": True, **daemon.dispatch(json.loads(line))}
+                except Exception as e:
+                    resp = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(resp, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        self.server = _Server(str(self.path), Handler)
+        os.chmod(self.path, 0o600)   # solo el usuario que lo levantó
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=self.server.shutdown, daemon=True).start())
+        print(f"[daemon] Escuchando en {self.path} (pid {os.getpid()})", flush=True)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.path.unlink(missing_ok=True)
+            print("[daemon] Detenido", flush=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Retriever caliente para el CLI (socket Unix)")
+    ap.add_argument("command", choices=["serve", "status", "reload", "stop"])
+    ap.add_argument("--socket", default=str(SOCKET_PATH), help="Ruta del socket (UFRO_DAEMON_SOCKET).")
+    args = ap.parse_args()
+    path = Path(args.socket)
+
+    if args.command == "serve":
+        try:
+            RetrieverDaemon(path).serve()
+        except KeyboardInterrupt:
+            pass
+        return
+    resp = call({"op": args.command}, path=path)
+    if resp is None:
+        raise SystemExit(f"No hay daemon escuchando en {path}")
+    resp.pop("ok", None)
+    print(json.dumps(resp, ensure_ascii=False) if resp else "[OK]")
+
+
+if __name__ == "__main__":
+    main()
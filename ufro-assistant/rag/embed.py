@@ -1,46 +1,271 @@
 # rag/embed.py
+import argparse
+import os
+import shutil
+import sys
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import faiss
 import numpy as np
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from sentence_transformers import SentenceTransformer
 
+# Para resolver imports de rag.* al ejecutar `python rag/embed.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.index_factory import (INDEX_TYPES, NO_REMOVE, build_index, build_params, resolve_params,
+                               apply_search_params, load_index_config, save_index_config,
+                               parse_param_overrides)
+from rag.embed_store import EmbeddingStore
+from rag.meta_store import MetaStore, parquet_batches
+from rag.bm25 import BM25_PATH
+from rag.release import IndexRelease, current_release, publish, staging_dir
+from rag.manifest import chunk_hashes, load_manifest
+
 CHUNKS_PATH = Path("data/processed/chunks.parquet")
-INDEX_PATH = Path("data/index.faiss")
-META_PATH = Path("data/processed/chunks_meta.parquet")
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"  # 384-dim
+META_COLS = ["chunk_id", "doc_id", "title", "page", "url", "vigencia", "tipo", "source_path",
+             "char_start", "char_end", "text"]
 
-def main():
-    t0 = time.time()
+# chunks.parquet se lee siempre por row groups: ni los textos ni los metadatos
+# del corpus completo pasan juntos por memoria
+def _usable(t: pa.Table) -> pa.Table:
+    """Solo los chunks con texto (excluye los marcados needs_ocr=True)."""
+    return t.filter(pc.and_(pc.invert(t["needs_ocr"]), pc.greater(pc.utf8_length(t["text"]), 0)))
+
+def usable_chunk_ids() -> np.ndarray:
+    """chunk_id de los chunks con texto utilizable, en el orden de chunks.parquet."""
     if not CHUNKS_PATH.exists():
         raise FileNotFoundError("No existe data/processed/chunks.parquet. Ejecuta primero rag/ingest.py")
-
-    df = pd.read_parquet(CHUNKS_PATH)
-    # Usar solo los chunks que tienen texto (excluir los marcados needs_ocr=True)
-    df = df[(~df["needs_ocr"]) & (df["text"].str.len() > 0)].copy()
-    if df.empty:
+    pf = pq.ParquetFile(CHUNKS_PATH)
+    if "chunk_id" not in pf.schema_arrow.names:
+        raise RuntimeError("chunks.parquet no tiene chunk_id. Vuelve a correr rag/ingest.py --full")
+    parts = [_usable(pf.read_row_group(rg, columns=["chunk_id", "text", "needs_ocr"]))["chunk_id"].to_numpy()
+             for rg in range(pf.num_row_groups)]
+    ids = np.concatenate(parts).astype("int64") if parts else np.zeros(0, dtype="int64")
+    if not len(ids):
         raise RuntimeError("No hay chunks con texto utilizable. ¿Todos requieren OCR?")
+    return ids
+
+def iter_shard_texts(ids: np.ndarray, shard_size: int) -> Iterator[Tuple[int, List[str]]]:
+    """
+    (shard, textos) para `ids` (en el orden de chunks.parquet), leyendo por
+    row groups: en memoria hay a lo más un row group y el shard en armado.
+    """
+    wanted = set(ids.tolist())
+    pf = pq.ParquetFile(CHUNKS_PATH)
+    shard, texts = 0, []
+    for rg in range(pf.num_row_groups):
+        t = pf.read_row_group(rg, columns=["chunk_id", "text"]).to_pydict()
+        for cid, text in zip(t["chunk_id"], t["text"]):
+            if cid in wanted:
+                texts.append(text)
+                if len(texts) == shard_size:
+                    yield shard, texts
+                    shard, texts = shard + 1, []
+    if texts:
+        yield shard, texts
+
+def write_meta(path: Path, hashes: Dict[int, str]) -> None:
+    """
+    chunks_meta.parquet de la versión nueva (los chunks utilizables), escrito
+    por row groups. `text_hash` registra qué texto se embebió para cada chunk_id.
+    """
+    pf = pq.ParquetFile(CHUNKS_PATH)
+    cols = [c for c in META_COLS if c in pf.schema_arrow.names]
+    writer: Optional[pq.ParquetWriter] = None
+    try:
+        for rg in range(pf.num_row_groups):
+            t = _usable(pf.read_row_group(rg, columns=list(dict.fromkeys(cols + ["needs_ocr"]))))
+            if "tipo" not in t.column_names:
+                t = t.append_column("tipo", pa.array([""] * t.num_rows, type=pa.string()))
+            t = t.select(META_COLS)
+            t = t.append_column("text_hash", pa.array([hashes.get(cid) for cid in t["chunk_id"].to_pylist()],
+                                                      type=pa.string()))
+            if writer is None:
+                writer = pq.ParquetWriter(path, t.schema)
+            writer.write_table(t)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def encode(model: SentenceTransformer, texts, progress: bool = True) -> np.ndarray:
+    emb = model.encode(list(texts), normalize_embeddings=True, show_progress_bar=progress)
+    return np.asarray(emb, dtype="float32")
+
+# ==============================
+# Encode por shards en un pool de procesos -> EmbeddingStore (float16 en disco)
+# ==============================
+_worker_model = None
+
+def _init_encoder(threads: int):
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(MODEL_NAME)
+
+def _embedding_dim() -> int:
+    return _worker_model.get_sentence_embedding_dimension()
+
+def _encode_shard(shard: int, texts: List[str]):
+    return shard, encode(_worker_model, texts, progress=False).astype("float16")
+
+def encode_to_store(ids: np.ndarray, workers: int, shard_size: int) -> EmbeddingStore:
+    """
+    Codifica los textos de `ids` en shards y los guarda en el EmbeddingStore a
+    medida que terminan (checkpoint por shard). Si el mismo trabajo quedó a
+    medias, solo se codifican los shards pendientes. A lo más 2·workers shards
+    en vuelo; los textos se leen de chunks.parquet shard a shard.
+    """
+    t0 = time.time()
+    if workers <= 1:
+        model = SentenceTransformer(MODEL_NAME)
+        store = EmbeddingStore(ids, model.get_sentence_embedding_dimension(), MODEL_NAME, shard_size)
+        todo = _pending(store)
+        for n, (shard, texts) in enumerate(((s, t) for s, t in iter_shard_texts(ids, shard_size) if s in todo),
+                                           start=1):
+            store.write(shard, encode(model, texts, progress=False))
+            print(f"[INFO] shard {n}/{len(todo)} ({time.time() - t0:.1f}s)")
+        return store
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # spawn: el padre no carga el modelo ni tiene hilos de torch que heredar;
+    # cada worker carga el suyo en _init_encoder
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             initializer=_init_encoder, initargs=(threads,)) as pool:
+        # La dimensión la informa un worker (ya tiene el modelo cargado)
+        store = EmbeddingStore(ids, pool.submit(_embedding_dim).result(), MODEL_NAME, shard_size)
+        todo = _pending(store)
+        it = ((s, t) for s, t in iter_shard_texts(ids, shard_size) if s in todo)
+        pending: deque = deque()
+
+        def submit_next() -> bool:
+            item = next(it, None)
+            if item is None:
+                return False
+            pending.append(pool.submit(_encode_shard, *item))
+            return True
+
+        for _ in range(2 * workers):
+            if not submit_next():
+                break
+        n = 0
+        while pending:
+            shard, emb = pending.popleft().result()
+            store.write(shard, emb)
+            n += 1
+            print(f"[INFO] shard {n}/{len(todo)} ({time.time() - t0:.1f}s)")
+            submit_next()
+    return store
+
+def _pending(store: EmbeddingStore) -> set:
+    todo = set(store.pending())
+    if len(todo) < store.n_shards:
+        print(f"[INFO] Retomando: {store.n_shards - len(todo)}/{store.n_shards} shards ya codificados.")
+    return todo
+
+def load_existing(release: IndexRelease):
+    """
+    Índice + {chunk_id: hash del texto embebido} de la versión publicada, solo
+    si es ID-mapped y registra los hashes (si no, toca reconstruir: no se
+    puede saber si un chunk_id sigue teniendo el mismo texto).
+    """
+    if not release.exists():
+        return None, None
+    names = pq.read_schema(release.meta_path).names
+    if "chunk_id" not in names:
+        return None, None
+    if "text_hash" not in names:
+        print("[INFO] La versión publicada no registra el hash de cada texto: se reconstruye completo.")
+        return None, None
+    t = pq.read_table(release.meta_path, columns=["chunk_id", "text_hash"])
+    index = faiss.read_index(str(release.index_path))
+    if not isinstance(index, faiss.IndexIDMap) or index.ntotal != t.num_rows:
+        return None, None
+    return index, dict(zip(t["chunk_id"].to_pylist(), t["text_hash"].to_pylist()))
+
+def main():
+    ap = argparse.ArgumentParser(description="Embeddings + índice FAISS (incremental por chunk_id)")
+    ap.add_argument("--full", action="store_true", help="Reconstruye el índice desde cero.")
+    ap.add_argument("--index-type", choices=list(INDEX_TYPES), default=None,
+                    help="Tipo de índice FAISS (por defecto, el de data/index_config.json o flat).")
+    ap.add_argument("--param", action="append", default=[],
+                    help="Parámetro del índice clave=valor (p.ej. --param M=32 --param ef_search=128).")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                    help="Procesos para codificar en CPU (cada uno carga el modelo y usa núcleos/workers "
+                         "hilos de torch). Con GPU usa 1.")
+    ap.add_argument("--shard-size", type=int, default=2048,
+                    help="Chunks por shard (unidad de trabajo y de checkpoint).")
+    args = ap.parse_args()
+
+    t0 = time.time()
+    prev = current_release()
+    prev_cfg = load_index_config(prev.config_path)
+    kind = args.index_type or prev_cfg["type"]
+    base = prev_cfg.get("params", {}) if kind == prev_cfg["type"] else {}
+    params = resolve_params(kind, {**base, **parse_param_overrides(args.param)})
+    # Cambiar tipo o parámetros de construcción obliga a reconstruir
+    # (ef_search / nprobe son de búsqueda y se aplican al cargar)
+    full = (args.full or kind != prev_cfg["type"]
+            or build_params(params) != build_params(resolve_params(kind, base)))
+
+    ids = usable_chunk_ids()
+    hashes = chunk_hashes(load_manifest())
 
-    print(f"[INFO] Embeddings para {len(df)} chunks...")
-    model = SentenceTransformer(MODEL_NAME)
-    emb = model.encode(df["text"].tolist(), normalize_embeddings=True, show_progress_bar=True)
-    emb = np.asarray(emb, dtype="float32")
+    index, indexed = (None, None) if full else load_existing(prev)
+    if index is not None:
+        apply_search_params(index, params)
+        current = set(ids.tolist())
+        # chunk_id cuyo texto cambió desde que se embebió: se borra y se vuelve a codificar
+        changed = {cid for cid, h in indexed.items()
+                   if cid in current and hashes.get(cid) is not None and hashes[cid] != h}
+        to_remove = np.array(sorted((indexed.keys() - current) | changed), dtype="int64")
+        if len(to_remove) and kind in NO_REMOVE:
+            print(f"[INFO] El índice {kind} no permite borrar vectores: se reconstruye completo.")
+            index = None
 
-    # FAISS: producto interno (coseno si normalizamos)
-    dim = emb.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(emb)
+    if index is None:
+        print(f"[INFO] Embeddings para {len(ids)} chunks (reconstrucción completa, índice {kind} {params})...")
+        store = encode_to_store(ids, args.workers, args.shard_size)
+        # FAISS: producto interno (coseno si normalizamos), con IDs = chunk_id,
+        # construido desde el store float16 en disco
+        index = build_index(kind, store.matrix(), store.ids, params)
+    else:
+        new = np.array([cid for cid in ids.tolist() if cid not in indexed or cid in changed], dtype="int64")
+        print(f"[INFO] Incremental: {len(new)} chunks nuevos ({len(changed)} con texto cambiado), "
+              f"{len(to_remove)} eliminados, {len(indexed.keys() & current) - len(changed)} reutilizados.")
+        if len(to_remove):
+            index.remove_ids(to_remove)
+        if len(new):
+            store = encode_to_store(new, args.workers, args.shard_size)
+            for emb, batch_ids in store.iter_batches():
+                index.add_with_ids(emb, batch_ids)
 
-    # Persistir
-    faiss.write_index(index, str(INDEX_PATH))
-    # Guardar metadatos en paralelo (mismo orden que emb)
-    meta_cols = ["doc_id", "title", "page", "url", "vigencia", "source_path", "text"]
-    df[meta_cols].to_parquet(META_PATH, index=False)
+    # Persistir: todo en un directorio nuevo que se publica con un solo rename
+    # del puntero (rag/release.py). Los lectores ven la versión anterior completa
+    # o la nueva completa, y los servidores que tienen la anterior mapeada en
+    # memoria (mmap) la siguen leyendo hasta recargar.
+    staging = staging_dir()
+    out = IndexRelease.at(staging)
+    faiss.write_index(index, str(out.index_path))
+    save_index_config(kind, params, out.config_path)
+    # Metadatos: una fila por chunk_id presente en el índice (los chunks
+    # utilizables de chunks.parquet), más el store columnar que abre el Retriever
+    write_meta(out.meta_path, hashes)
+    MetaStore.write_batches(parquet_batches(out.meta_path), out.meta_store)
+    # BM25 de la misma corrida de rag/ingest.py, para que el modo hybrid no mezcle versiones
+    if BM25_PATH.exists():
+        shutil.copy2(BM25_PATH, out.bm25_path)
+    release = publish(staging)
 
     dt = time.time() - t0
-    print(f"[OK] Guardado índice {INDEX_PATH} y metadatos {META_PATH} en {dt:.2f}s.")
+    print(f"[OK] Publicada versión {release.version} del índice ({index.ntotal} vectores) en {dt:.2f}s.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,89 @@
+# rag/embed_store.py
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+STORE_DIR = Path("data/embeddings")
+
+
+class EmbeddingStore:
+    """
+    Embeddings de un trabajo (modelo + lista de chunk_ids) en una matriz
+    float16 (n, d) en disco vía np.memmap. Se llena por shards de `shard_size`
+    filas; state.json registra los shards terminados para que una corrida
+    interrumpida retome donde quedó. Si el trabajo cambia, se reinicia.
+    """
+
+    def __init__(self, ids: np.ndarray, dim: int, model_name: str, shard_size: int = 2048,
+                 root: Path = STORE_DIR):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ids = np.ascontiguousarray(ids, dtype="int64")
+        self.dim = dim
+        self.shard_size = shard_size
+        h = hashlib.sha256(f"{model_name}|{dim}|{shard_size}|".encode("utf-8"))
+        h.update(self.ids.tobytes())
+        self.job = h.hexdigest()
+
+        state = self._load_state()
+        vectors_path = self.root / "vectors.f16"
+        shape = (max(1, len(self.ids)), dim)
+        if state is not None and state.get("job") == self.job and vectors_path.exists():
+            self.done = set(state["done"])
+            self.vectors = np.memmap(vectors_path, dtype="float16", mode="r+", shape=shape)
+        else:
+            self.done = set()
+            self.vectors = np.memmap(vectors_path, dtype="float16", mode="w+", shape=shape)
+            np.save(self.root / "ids.npy", self.ids)
+            self._save_state()
+
+    @property
+    def n_shards(self) -> int:
+        return (len(self.ids) + self.shard_size - 1) // self.shard_size
+
+    def shard_range(self, shard: int) -> Tuple[int, int]:
+        a = shard * self.shard_size
+        return a, min(len(self.ids), a + self.shard_size)
+
+    def pending(self) -> List[int]:
+        return [s for s in range(self.n_shards) if s not in self.done]
+
+    @property
+    def complete(self) -> bool:
+        return not self.pending()
+
+    def write(self, shard: int, emb: np.ndarray) -> None:
+        """Escribe un shard y lo marca terminado (los datos se bajan a disco antes del checkpoint)."""
+        a, b = self.shard_range(shard)
+        self.vectors[a:b] = emb.astype("float16", copy=False)
+        self.vectors.flush()
+        self.done.add(shard)
+        self._save_state()
+
+    def matrix(self) -> np.ndarray:
+        """Vista (n, d) float16 respaldada por el archivo (no se carga en RAM)."""
+        return self.vectors[:len(self.ids)]
+
+    def iter_batches(self, batch: int = 65536) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """(float32 normalizados, chunk_ids) por lotes acotados."""
+        for a in range(0, len(self.ids), batch):
+            emb = np.asarray(self.vectors[a:a + batch], dtype="float32")
+            emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            yield emb, self.ids[a:a + batch]
+
+    def _load_state(self):
+        path = self.root / "state.json"
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        return None
+
+    def _save_state(self) -> None:
+        path = self.root / "state.json"
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"job": self.job, "n": len(self.ids), "dim": self.dim,
+                                   "shard_size": self.shard_size, "done": sorted(self.done)}),
+                       encoding="utf-8")
+        tmp.replace(path)
@@ -0,0 +1,150 @@
+# rag/encoder.py
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+
+def normalize_query_text(q: str) -> str:
+    # MiniLM es uncased: basta con colapsar espacios para la clave del LRU
+    return " ".join(q.split())
+
+
+class QueryEncoder:
+    """
+    Encoder de consultas con LRU texto normalizado -> embedding.
+    Codifica todas las consultas que faltan en una sola llamada a `encode`.
+    """
+
+    def __init__(self, model, cache_size: int = 4096):
+        self.model = model
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        keys = [normalize_query_text(t) for t in texts]
+        out: List[Optional[np.ndarray]] = [None] * len(keys)
+        missing: "OrderedDict[str, List[int]]" = OrderedDict()
+        with self._lock:
+            for i, key in enumerate(keys):
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    out[i] = vec
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+        if missing:
+            embs = self.model.encode(list(missing), normalize_embeddings=True,
+                                     batch_size=max(1, len(missing)))
+            embs = np.asarray(embs, dtype="float32")
+            with self._lock:
+                for (key, positions), vec in zip(missing.items(), embs):
+                    for i in positions:
+                        out[i] = vec
+                    self._lru[key] = vec
+                    self._lru.move_to_end(key)
+                while len(self._lru) > self.cache_size:
+                    self._lru.popitem(last=False)
+        return np.stack(out).astype("float32", copy=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "items": len(self._lru)}
+
+
+class MicroBatcher:
+    """
+    Agrupa llamadas concurrentes: cada `submit(item)` espera a lo más
+    `max_wait_ms` a que lleguen otras y se procesan juntas con
+    `fn(items) -> results` (mismo orden) en un hilo dedicado.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = 32,
+                 max_wait_ms: float = 2.0, name: str = "micro-batcher"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._q: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        with self._lock:
+            if not self._closed:
+                self._q.put((item, fut))
+                return fut
+        # p.ej. una request que tomó el Retriever anterior justo antes de un
+        # reload: se atiende sin lote en el hilo que llama
+        try:
+            fut.set_result(self.fn([item])[0])
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Procesa lo ya encolado y termina el hilo, que si no mantendría vivo
+        al dueño de `fn` (p.ej. un Retriever reemplazado por /admin/reload).
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._q.put(None)
+        self._thread.join(timeout)
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _loop(self) -> None:
+        stop = False
+        while not stop:
+            first = self._q.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:   # close(): se procesa este lote y se termina
+                    stop = True
+                    break
+                batch.append(nxt)
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{len(results)} resultados para un lote de {len(batch)}")
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
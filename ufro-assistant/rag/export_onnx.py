@@ -0,0 +1,71 @@
+# rag/export_onnx.py
+# Exporta el encoder de consultas (MiniLM) a ONNX y lo cuantiza a int8:
+#   python rag/export_onnx.py
+# Genera en data/onnx/: model.onnx (fp32), model.int8.onnx, tokenizer.json y encoder.json.
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+# Para resolver imports de rag.* al ejecutar `python rag/export_onnx.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.retrieve import MODEL_NAME
+from rag.onnx_encoder import ONNX_DIR
+
+INPUTS = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+class _Transformer(torch.nn.Module):
+    """Solo el transformer (el pooling se hace en numpy): devuelve last_hidden_state."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                          token_type_ids=token_type_ids)[0]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta el encoder de consultas a ONNX (int8)")
+    ap.add_argument("--out", default=str(ONNX_DIR))
+    ap.add_argument("--opset", type=int, default=14)
+    args = ap.parse_args()
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    st = SentenceTransformer(MODEL_NAME, device="cpu")
+    tok = st.tokenizer
+    wrapper = _Transformer(st[0].auto_model).eval()
+
+    dummy = tok(["¿Cuándo inicia el semestre académico?"], return_tensors="pt")
+    axes = {name: {0: "batch", 1: "seq"} for name in INPUTS + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(wrapper, tuple(dummy[name] for name in INPUTS), str(out / "model.onnx"),
+                          input_names=INPUTS, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=args.opset)
+    quantize_dynamic(str(out / "model.onnx"), str(out / "model.int8.onnx"), weight_type=QuantType.QInt8)
+
+    tok.save_pretrained(str(out))   # tokenizer.json (tokenizer rápido)
+    (out / "encoder.json").write_text(json.dumps({
+        "model": MODEL_NAME,
+        "dim": st.get_sentence_embedding_dimension(),
+        "max_seq_length": st.max_seq_length,
+        "pad_id": tok.pad_token_id,
+        "pad_token": tok.pad_token,
+    }, indent=2), encoding="utf-8")
+
+    for name in ("model.onnx", "model.int8.onnx"):
+        print(f"[OK] {out / name} ({(out / name).stat().st_size / (1024 * 1024):.1f} MB)")
+    print("Verifica la paridad con: python eval/onnx_parity.py")
+
+
+if __name__ == "__main__":
+    main()
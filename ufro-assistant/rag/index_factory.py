@@ -0,0 +1,139 @@
+# rag/index_factory.py
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_CONFIG_PATH = Path("data/index_config.json")
+
+# Tipos de índice soportados y sus parámetros por defecto.
+# nlist=0 => se elige según el tamaño del corpus (≈ 4·√n, con ≥39 vectores por lista).
+INDEX_TYPES: Dict[str, Dict[str, Any]] = {
+    "flat": {},
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    "ivf_flat": {"nlist": 0, "nprobe": 8},
+    "ivf_pq": {"nlist": 0, "nprobe": 8, "m": 48, "nbits": 8},
+}
+
+# Parámetros que solo afectan la búsqueda (no requieren reconstruir)
+SEARCH_PARAMS = {"ef_search", "nprobe"}
+
+# Tipos cuyo índice interno no soporta remove_ids (actualizar = reconstruir)
+NO_REMOVE = {"hnsw"}
+
+ADD_BATCH = 65536     # filas por add_with_ids (acota la memoria con emb en disco)
+TRAIN_MAX = 100_000   # muestra máxima para entrenar IVF / PQ
+
+
+def resolve_params(kind: str, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice no soportado: {kind} (opciones: {', '.join(INDEX_TYPES)})")
+    params = dict(INDEX_TYPES[kind])
+    for key, value in (overrides or {}).items():
+        if key not in params:
+            raise ValueError(f"Parámetro '{key}' no válido para {kind} (opciones: {', '.join(params) or '-'})")
+        params[key] = type(params[key])(value)
+    return params
+
+
+def build_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in params.items() if k not in SEARCH_PARAMS}
+
+
+def auto_nlist(n: int) -> int:
+    return max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))
+
+
+def as_float32(emb: np.ndarray) -> np.ndarray:
+    """Filas float32 contiguas y normalizadas (emb puede ser un memmap float16)."""
+    out = np.ascontiguousarray(emb, dtype="float32")
+    if emb.dtype != np.float32:
+        faiss.normalize_L2(out)
+    return out
+
+
+def build_index(kind: str, emb: np.ndarray, ids: np.ndarray, params: Dict[str, Any]) -> faiss.Index:
+    """
+    Construye (y entrena si corresponde) un índice de producto interno sobre
+    `emb` normalizados, envuelto en IndexIDMap2 con IDs = chunk_id. `emb` puede
+    ser float16 en disco: se entrena con una muestra y se agrega por lotes.
+    """
+    n, d = emb.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+    if kind == "flat":
+        base = faiss.IndexFlatIP(d)
+    elif kind == "hnsw":
+        base = faiss.IndexHNSWFlat(d, int(params["M"]), metric)
+        base.hnsw.efConstruction = int(params["ef_construction"])
+    elif kind in ("ivf_flat", "ivf_pq"):
+        nlist = int(params["nlist"]) or auto_nlist(n)
+        quantizer = faiss.IndexFlatIP(d)
+        if kind == "ivf_flat":
+            base = faiss.IndexIVFFlat(quantizer, d, nlist, metric)
+        else:
+            m, nbits = int(params["m"]), int(params["nbits"])
+            if d % m != 0:
+                raise ValueError(f"ivf_pq: m={m} debe dividir la dimensión {d}")
+            if n < (1 << nbits):
+                raise ValueError(f"ivf_pq: se necesitan ≥{1 << nbits} vectores para entrenar con nbits={nbits} (hay {n})")
+            base = faiss.IndexIVFPQ(quantizer, d, nlist, m, nbits, metric)
+        if n > TRAIN_MAX:
+            sample = np.sort(np.random.default_rng(0).choice(n, TRAIN_MAX, replace=False))
+            base.train(as_float32(emb[sample]))
+        else:
+            base.train(as_float32(emb))
+    else:
+        raise ValueError(f"Tipo de índice no soportado: {kind}")
+
+    index = faiss.IndexIDMap2(base)
+    for a in range(0, n, ADD_BATCH):
+        index.add_with_ids(as_float32(emb[a:a + ADD_BATCH]), np.ascontiguousarray(ids[a:a + ADD_BATCH], dtype="int64"))
+    apply_search_params(index, params)
+    return index
+
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]) -> None:
+    """Parámetros de búsqueda que no se persisten con write_index (efSearch, nprobe)."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW) and "ef_search" in params:
+        inner.hnsw.efSearch = int(params["ef_search"])
+    if isinstance(inner, faiss.IndexIVF) and "nprobe" in params:
+        inner.nprobe = int(params["nprobe"])
+
+
+def search_parameters(index: faiss.Index, sel: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    SearchParameters con un selector de IDs (chunk_id) que FAISS evalúa durante
+    la búsqueda. Copia efSearch / nprobe del índice interno, porque al pasar
+    params FAISS usa los de la request y no los del índice.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=inner.hnsw.efSearch)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=inner.nprobe)
+    return faiss.SearchParameters(sel=sel)
+
+
+def load_index_config(path: Path = INDEX_CONFIG_PATH) -> Dict[str, Any]:
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"type": "flat", "params": {}}
+
+
+def save_index_config(kind: str, params: Dict[str, Any], path: Path = INDEX_CONFIG_PATH) -> None:
+    path.write_text(json.dumps({"type": kind, "params": params}, indent=2), encoding="utf-8")
+
+
+def parse_param_overrides(items) -> Dict[str, Any]:
+    """['M=48', 'ef_search=128'] -> {'M': '48', 'ef_search': '128'}"""
+    out: Dict[str, Any] = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Parámetro inválido '{item}' (usa clave=valor)")
+        out[key.strip()] = value.strip()
+    return out
@@ -1,19 +1,55 @@
 # rag/ingest.py
+import argparse
+import bisect
+import hashlib
+import json
 import os
 import re
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional, Iterator
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pypdf import PdfReader
 
+# Para resolver imports de rag.* al ejecutar `python rag/ingest.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.bm25 import BM25Index, BM25_PATH
+from rag.manifest import load_manifest, save_manifest, text_hash
+from rag.chunking import (structure_spans, STRUCT_TARGET_TOKENS, STRUCT_MAX_TOKENS, STRUCT_MIN_TOKENS,
+                          STRUCT_VERSION)
+
 RAW_DIR = Path("data/raw")
 OUT_DIR = Path("data/processed")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 CHUNK_SIZE = 3800      # ~equiv. 900-1000 tokens aprox
 CHUNK_OVERLAP = 500    # solape para contexto
+CHUNKS_PATH = OUT_DIR / "chunks.parquet"
+PAGES_PER_TASK = 8     # páginas de PDF por tarea del pool de procesos
+# "fixed": ventanas de CHUNK_SIZE con solape | "structure": Título/Artículo/párrafo/oración
+CHUNKERS = ("fixed", "structure")
+CHUNKER = os.getenv("CHUNKER", "fixed")
+
+# Esquema fijo de chunks.parquet (se escribe por row groups, un doc por grupo)
+CHUNKS_SCHEMA = pa.schema([
+    ("chunk_id", pa.int64()),
+    ("doc_id", pa.string()),
+    ("title", pa.string()),
+    ("page", pa.int32()),
+    ("url", pa.string()),
+    ("vigencia", pa.string()),
+    ("tipo", pa.string()),
+    ("text", pa.string()),
+    ("char_start", pa.int64()),
+    ("char_end", pa.int64()),
+    ("source_path", pa.string()),
+    ("needs_ocr", pa.bool_()),
+])
 
 
 # ==============================
@@ -22,32 +58,75 @@ CHUNK_OVERLAP = 500    # solape para contexto
 def read_txt(path: Path) -> str:
     return open(path, "r", encoding="utf-8", errors="ignore").read()
 
-def read_pdf(path: Path) -> str:
+def pdf_num_pages(path: Path) -> int:
+    try:
+        return len(PdfReader(str(path)).pages)
+    except Exception:
+        return 0
+
+def read_pdf_pages(path: Path, start: int = 0, end: Optional[int] = None) -> List[str]:
+    """Texto de las páginas [start, end) de un PDF (una entrada por página)."""
     try:
-        return "\n".join([p.extract_text() or "" for p in PdfReader(str(path)).pages])
+        pages = PdfReader(str(path)).pages
+        end = len(pages) if end is None else min(end, len(pages))
+        return [pages[i].extract_text() or "" for i in range(start, end)]
     except Exception:
-        return ""
+        return [""] * max(0, (end or 0) - start)
+
+def read_doc_pages(path: Path) -> List[str]:
+    """Lectura serial: lista de textos por página (un .txt es una sola página)."""
+    if path.suffix.lower() == ".txt":
+        return [read_txt(path)]
+    if path.suffix.lower() == ".pdf":
+        return read_pdf_pages(path)
+    return []
+
+def extract_docs_parallel(paths: List[Path], workers: int, window: int = 0) -> Iterator[Tuple[Path, List[str]]]:
+    """
+    Extrae los documentos repartiendo los PDFs por rangos de páginas en un pool
+    de procesos. Entrega (path, páginas) en el mismo orden de `paths`, con a lo
+    más `window` documentos en vuelo para no tener todo el corpus en memoria.
+    """
+    window = window or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+        it = iter(paths)
+
+        def submit_next() -> bool:
+            path = next(it, None)
+            if path is None:
+                return False
+            if path.suffix.lower() == ".pdf":
+                n = pdf_num_pages(path)
+                futs = [pool.submit(read_pdf_pages, path, a, min(n, a + PAGES_PER_TASK))
+                        for a in range(0, n, PAGES_PER_TASK)]
+            else:
+                futs = [pool.submit(read_doc_pages, path)]
+            pending.append((path, futs))
+            return True
+
+        for _ in range(window):
+            if not submit_next():
+                break
+        while pending:
+            path, futs = pending.popleft()
+            pages: List[str] = []
+            for f in futs:
+                pages.extend(f.result())
+            submit_next()
+            yield path, pages
 
-def load_docs(data_dir: Path) -> List[Tuple[Path, str]]:
+def list_docs(data_dir: Path) -> List[Path]:
     """
-    Recorre data/raw y devuelve [(path, texto)]. A diferencia del original,
-    ahora SIEMPRE agregamos el archivo, aunque el texto esté vacío,
-    para poder marcar needs_ocr más adelante y no perder trazabilidad.
+    Recorre data/raw y devuelve los .txt/.pdf. El texto se lee después y solo
+    para los documentos nuevos o modificados (ver manifest).
     """
-    docs: List[Tuple[Path, str]] = []
+    paths: List[Path] = []
     for root, _, files in os.walk(data_dir):
         for fn in files:
-            path = Path(root) / fn
-            if fn.lower().endswith(".txt"):
-                txt = read_txt(path)
-            elif fn.lower().endswith(".pdf"):
-                txt = read_pdf(path)
-            else:
-                continue
-            txt = re.sub(r"\n{3,}", "\n\n", txt).strip()
-            # SIEMPRE anexamos; si viene vacío, luego se marca needs_ocr=True
-            docs.append((path, txt))
-    return docs
+            if fn.lower().endswith((".txt", ".pdf")):
+                paths.append(Path(root) / fn)
+    return sorted(paths)
 
 
 # ==============================
@@ -70,59 +149,103 @@ def clean_text(text: str) -> str:
     text = re.sub(r"\n{3,}", "\n\n", text)
     return text.strip()
 
-def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
-    text = text.strip()
+def chunk_spans(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """Ventanas [inicio, fin) de tamaño fijo con solape sobre `text`."""
     n = len(text)
     if n <= size:
-        return [text]
+        return [(0, n)]
 
-    chunks: List[str] = []
+    spans: List[Tuple[int, int]] = []
     start = 0
     while start < n:
         end = min(n, start + size)
-        chunk = text[start:end]
-        chunks.append(chunk)
+        spans.append((start, end))
         if end == n:
             break
         start = max(0, end - overlap)
-    return chunks
+    return spans
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    text = text.strip()
+    return [text[a:b] for a, b in chunk_spans(text, size, overlap)]
+
+def get_chunker(name: str) -> Tuple[Callable[[str], List[Tuple[int, int]]], str]:
+    """Función de rangos + firma del chunker (la firma entra en doc_signature)."""
+    if name == "fixed":
+        return chunk_spans, f"fixed:{CHUNK_SIZE}:{CHUNK_OVERLAP}"
+    if name == "structure":
+        return structure_spans, f"structure:v{STRUCT_VERSION}:{STRUCT_TARGET_TOKENS}:{STRUCT_MAX_TOKENS}:{STRUCT_MIN_TOKENS}"
+    raise ValueError(f"Chunker no soportado: {name} (opciones: {', '.join(CHUNKERS)})")
+
+
+# ==============================
+# Manifest: archivo fuente -> hash -> chunk IDs
+# ==============================
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def doc_signature(row: pd.Series, path: Path, chunker: str = f"fixed:{CHUNK_SIZE}:{CHUNK_OVERLAP}") -> str:
+    """
+    Huella de un documento: contenido del archivo + metadatos de sources.csv +
+    parámetros del chunker. Si cambia cualquiera, se re-extrae y re-embebe.
+    """
+    meta = json.dumps([str(row.get(c, "")) for c in ("title", "url", "vigencia", "tipo")], ensure_ascii=False)
+    return hashlib.sha256(f"{file_sha256(path)}|{meta}|{chunker}".encode("utf-8")).hexdigest()
 
 
 # ==============================
 # Construcción de chunks con metadatos
 # ==============================
-def build_chunks_for_doc(row: pd.Series, path: Path, full_text: str) -> List[Dict]:
+def build_chunks_for_doc(row: pd.Series, path: Path, pages: List[str],
+                         spans_fn: Callable[[str], List[Tuple[int, int]]] = chunk_spans) -> List[Dict]:
     """
-    Construye los registros de chunks para un documento. Si no hay texto utilizable,
-    devuelve un placeholder con needs_ocr=True para mantener trazabilidad.
+    Construye los registros de chunks para un documento a partir del texto de
+    cada página. Los chunks se cortan sobre el texto completo (páginas unidas
+    por una línea en blanco) y cada uno lleva la página donde comienza y su
+    rango de caracteres. Si no hay texto utilizable, devuelve un placeholder
+    con needs_ocr=True para mantener trazabilidad.
     """
-    chunks_rows: List[Dict] = []
-    full_text = clean_text(full_text or "")
+    base = {
+        "doc_id": str(row["doc_id"]),
+        "title": str(row["title"]),
+        "url": str(row.get("url", "") or ""),
+        "vigencia": str(row.get("vigencia", "") or ""),
+        "tipo": str(row.get("tipo", "") or ""),
+        "source_path": str(path),
+    }
+
+    # Texto completo + offset de inicio de cada página con texto
+    parts: List[str] = []
+    page_starts: List[int] = []
+    page_numbers: List[int] = []
+    pos = 0
+    for pno, raw in enumerate(pages, start=1):
+        t = clean_text(raw or "")
+        if not t:
+            continue
+        page_starts.append(pos)
+        page_numbers.append(pno)
+        parts.append(t)
+        pos += len(t) + 2
+    full_text = "\n\n".join(parts)
 
     # Si no hay texto -> marcar como OCR requerido
     if not full_text or len(full_text) < 30:
-        return [{
-            "doc_id": row["doc_id"],
-            "title": row["title"],
-            "page": None,
-            "url": row.get("url", ""),
-            "vigencia": row.get("vigencia", ""),
-            "text": "",
-            "source_path": str(path),
-            "needs_ocr": True,
-        }]
-
-    # En este esquema no separamos por páginas, sino por documento completo
-    page = 1
-    for ch in chunk_text(full_text):
+        return [{**base, "page": None, "text": "", "char_start": None, "char_end": None, "needs_ocr": True}]
+
+    chunks_rows: List[Dict] = []
+    for start, end in spans_fn(full_text):
+        page = page_numbers[bisect.bisect_right(page_starts, start) - 1]
         chunks_rows.append({
-            "doc_id": row["doc_id"],
-            "title": row["title"],
+            **base,
             "page": page,
-            "url": row.get("url", ""),
-            "vigencia": row.get("vigencia", ""),
-            "text": ch,
-            "source_path": str(path),
+            "text": full_text[start:end],
+            "char_start": start,
+            "char_end": end,
             "needs_ocr": False,
         })
     return chunks_rows
@@ -131,43 +254,135 @@ def build_chunks_for_doc(row: pd.Series, path: Path, full_text: str) -> List[Dic
 # ==============================
 # MAIN
 # ==============================
+def reusable_row_groups(path: Path) -> Dict[str, List[int]]:
+    """doc_id -> row groups de un chunks.parquet previo con el esquema actual."""
+    if not path.exists():
+        return {}
+    pf = pq.ParquetFile(path)
+    if not pf.schema_arrow.equals(CHUNKS_SCHEMA):
+        # chunks.parquet de una versión anterior: no se puede reutilizar
+        return {}
+    groups: Dict[str, List[int]] = {}
+    for rg in range(pf.num_row_groups):
+        for doc_id in set(pf.read_row_group(rg, columns=["doc_id"]).column(0).to_pylist()):
+            groups.setdefault(doc_id, []).append(rg)
+    return groups
+
+def iter_text_chunks(path: Path) -> Iterator[Tuple[int, str]]:
+    """(chunk_id, texto) de los chunks con texto, leyendo chunks.parquet por row groups."""
+    pf = pq.ParquetFile(path)
+    for rg in range(pf.num_row_groups):
+        t = pf.read_row_group(rg, columns=["chunk_id", "text", "needs_ocr"]).to_pydict()
+        for cid, text, needs_ocr in zip(t["chunk_id"], t["text"], t["needs_ocr"]):
+            if not needs_ocr and text:
+                yield cid, text
+    pf.close()
+
 def main():
+    ap = argparse.ArgumentParser(description="Ingesta y chunking de data/raw")
+    ap.add_argument("--full", action="store_true",
+                    help="Ignora el manifest y re-procesa todos los documentos.")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="Procesos para extraer páginas de PDF en paralelo.")
+    ap.add_argument("--chunker", choices=CHUNKERS, default=CHUNKER,
+                    help="Estrategia de chunking (por defecto CHUNKER o fixed).")
+    args = ap.parse_args()
+    spans_fn, chunker_sig = get_chunker(args.chunker)
+
     df_src = read_sources_csv()
-    docs = load_docs(RAW_DIR)
-    if not docs:
+    paths = list_docs(RAW_DIR)
+    if not paths:
         print("No hay archivos válidos en data/raw/")
         sys.exit(1)
 
-    all_rows: List[Dict] = []
-    missing: List[str] = []
+    manifest = load_manifest()
+    # Los chunk_id nunca se reutilizan, ni con --full: un ID viejo ya embebido
+    # conservaría el vector de otro texto en el índice incremental
+    next_id = int(manifest.get("next_chunk_id", 0))
+    if args.full:
+        manifest = {"next_chunk_id": next_id, "docs": {}}
+    prev_groups = {} if args.full else reusable_row_groups(CHUNKS_PATH)
 
+    # 1) Plan: qué documentos se reutilizan tal cual y cuáles hay que extraer
+    plan: List[Tuple[pd.Series, Path, str, bool]] = []
+    missing: List[str] = []
     for _, row in df_src.iterrows():
         doc_id = str(row["doc_id"]).lower()
-        candidate: Optional[Tuple[Path, str]] = None
 
         # Busca coincidencia por doc_id en el nombre del archivo
-        for (path, txt) in docs:
-            if doc_id in path.stem.lower():
-                candidate = (path, txt)
-                break
-
-        if candidate is None:
+        path = next((p for p in paths if doc_id in p.stem.lower()), None)
+        if path is None:
             print(f"[WARN] No se encontró archivo para doc_id={doc_id}. Renombra el archivo en data/raw/ para que contenga el doc_id.")
             missing.append(doc_id)
             continue
 
-        print(f"[INFO] Procesando {row['doc_id']} -> {candidate[0].name}")
-        rows = build_chunks_for_doc(row, candidate[0], candidate[1])
-        all_rows.extend(rows)
+        sig = doc_signature(row, path, chunker_sig)
+        prev = manifest["docs"].get(str(row["doc_id"]))
+        reuse = prev is not None and prev["signature"] == sig and str(row["doc_id"]) in prev_groups
+        plan.append((row, path, sig, reuse))
+
+    # 2) Extracción en paralelo + escritura por row groups a medida que se producen
+    to_extract = [path for _, path, _, reuse in plan if not reuse]
+    extracted = extract_docs_parallel(to_extract, max(1, args.workers)) if to_extract else iter(())
+    tmp_path = CHUNKS_PATH.with_suffix(".parquet.tmp")
+    prev_file = pq.ParquetFile(CHUNKS_PATH) if prev_groups else None
+    new_docs: Dict[str, Dict] = {}
+    total = n_reused = n_changed = 0
 
-    if not all_rows:
+    with pq.ParquetWriter(tmp_path, CHUNKS_SCHEMA) as writer:
+        for row, path, sig, reuse in plan:
+            doc_key = str(row["doc_id"])
+            if reuse:
+                print(f"[INFO] Sin cambios {doc_key} -> {path.name}")
+                entry = dict(manifest["docs"][doc_key])
+                # manifests anteriores no guardaban el hash del texto: se completa al pasar
+                hashes = None if "text_hashes" in entry else []
+                for rg in prev_groups[doc_key]:
+                    table = prev_file.read_row_group(rg)
+                    writer.write_table(table)
+                    total += table.num_rows
+                    if hashes is not None:
+                        hashes += [text_hash(t) for t in table.column("text").to_pylist()]
+                if hashes is not None:
+                    entry["text_hashes"] = hashes
+                new_docs[doc_key] = entry
+                n_reused += 1
+                continue
+
+            _, pages = next(extracted)
+            print(f"[INFO] Procesando {doc_key} -> {path.name} ({len(pages)} páginas)")
+            rows = build_chunks_for_doc(row, path, pages, spans_fn)
+            ids = list(range(next_id, next_id + len(rows)))
+            next_id += len(rows)
+            for cid, r in zip(ids, rows):
+                r["chunk_id"] = cid
+            writer.write_table(pa.Table.from_pylist(rows, schema=CHUNKS_SCHEMA))
+            total += len(rows)
+            new_docs[doc_key] = {"source_path": str(path), "signature": sig, "chunk_ids": ids,
+                                 "text_hashes": [text_hash(r["text"]) for r in rows]}
+            n_changed += 1
+
+    if prev_file is not None:
+        prev_file.close()
+
+    removed = sorted(set(manifest["docs"]) - set(new_docs))
+    for doc_id in removed:
+        print(f"[INFO] Eliminado del corpus: {doc_id}")
+
+    if total == 0:
+        tmp_path.unlink(missing_ok=True)
         print("No se generaron chunks. Revisa si los documentos contienen texto legible.")
         sys.exit(1)
 
-    df_chunks = pd.DataFrame(all_rows)
-    out_path = OUT_DIR / "chunks.parquet"
-    df_chunks.to_parquet(out_path, index=False)
-    print(f"[OK] Guardado {out_path} con {len(df_chunks)} chunks.")
+    tmp_path.replace(CHUNKS_PATH)
+    save_manifest({"next_chunk_id": next_id, "docs": new_docs})
+    print(f"[OK] Guardado {CHUNKS_PATH} con {total} chunks "
+          f"({n_changed} docs procesados, {n_reused} sin cambios, {len(removed)} eliminados).")
+
+    # 3) Índice léxico BM25 (se reconstruye completo: es lineal y barato)
+    bm25 = BM25Index.build(iter_text_chunks(CHUNKS_PATH))
+    bm25.save(BM25_PATH)
+    print(f"[OK] Guardado {BM25_PATH} ({len(bm25.doc_len)} chunks, {len(bm25.terms)} términos).")
 
 if __name__ == "__main__":
     main()
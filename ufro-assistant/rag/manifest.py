@@ -0,0 +1,35 @@
+# rag/manifest.py
+# Manifest de la ingesta (data/processed/manifest.json): por documento, su
+# huella, sus chunk_id y el hash del texto de cada chunk. Lo escribe
+# rag/ingest.py y lo lee rag/embed.py para saber qué vectores siguen valiendo.
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict
+
+MANIFEST_PATH = Path("data/processed/manifest.json")
+
+
+def text_hash(text: str) -> str:
+    """Hash corto del texto de un chunk (cambia si el texto asociado a un chunk_id cambia)."""
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=8).hexdigest()
+
+
+def load_manifest() -> Dict:
+    if MANIFEST_PATH.exists():
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    return {"next_chunk_id": 0, "docs": {}}
+
+
+def save_manifest(manifest: Dict) -> None:
+    tmp = MANIFEST_PATH.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(MANIFEST_PATH)
+
+
+def chunk_hashes(manifest: Dict) -> Dict[int, str]:
+    """chunk_id -> hash del texto, para los documentos del manifest que lo registran."""
+    out: Dict[int, str] = {}
+    for doc in manifest.get("docs", {}).values():
+        out.update(zip(doc.get("chunk_ids", []), doc.get("text_hashes", [])))
+    return out
@@ -0,0 +1,164 @@
+# rag/meta_store.py
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from rag.cache import file_fingerprint
+
+META_STORE_DIR = Path("data/processed/meta")
+DOC_FIELDS = ("doc_id", "title", "url", "vigencia", "tipo")
+
+
+def _as_int(values, missing: int = -1) -> np.ndarray:
+    return pd.to_numeric(values, errors="coerce").fillna(missing).to_numpy(dtype="int64")
+
+
+def parquet_batches(path: Path, batch_size: int = 65536) -> Iterator[pd.DataFrame]:
+    """Un parquet como DataFrames de a lo más `batch_size` filas."""
+    pf = pq.ParquetFile(path)
+    try:
+        for batch in pf.iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+    finally:
+        pf.close()
+
+
+class MetaStore:
+    """
+    Metadatos de chunks en columnas de ancho fijo (.npy abiertos con mmap) y un
+    blob UTF-8 con todos los textos + offsets. Los campos de documento (título,
+    url, vigencia, tipo) se guardan una vez en docs.json y cada fila apunta a
+    su documento. Lookup por chunk_id en O(1) y el texto solo se lee al pedirlo;
+    los workers que abren el mismo store comparten las páginas del SO.
+
+    Se deriva de chunks_meta.parquet: vive en META_STORE_DIR/<huella del parquet>/.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.docs: List[Dict[str, str]] = json.loads((path / "docs.json").read_text(encoding="utf-8"))
+        load = lambda name: np.load(path / f"{name}.npy", mmap_mode="r")
+        self.chunk_ids = load("chunk_ids")      # fila -> chunk_id
+        self.doc_idx = load("doc_idx")          # fila -> posición en docs
+        self.page = load("page")                # -1 = sin página
+        self.char_start = load("char_start")    # -1 = sin rango
+        self.char_end = load("char_end")
+        self.text_offsets = load("text_offsets")
+        self._pos = load("pos")                 # chunk_id -> fila (-1 si no está)
+        blob = path / "text.bin"
+        self._blob = (np.memmap(blob, dtype="uint8", mode="r") if blob.stat().st_size
+                      else np.zeros(0, dtype="uint8"))
+        # Columnas por documento para filtros (pocas filas: viven en memoria)
+        self.doc_vigencia = pd.to_numeric(pd.Series([d["vigencia"] for d in self.docs], dtype=object),
+                                          errors="coerce").to_numpy(dtype="float64")
+        self.doc_tipo = np.array([d["tipo"].upper() for d in self.docs], dtype=object)
+        self.doc_id = np.array([d["doc_id"] for d in self.docs], dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def __contains__(self, chunk_id: int) -> bool:
+        return 0 <= chunk_id < len(self._pos) and self._pos[chunk_id] >= 0
+
+    def row(self, chunk_id: int) -> int:
+        if chunk_id not in self:
+            raise KeyError(chunk_id)
+        return int(self._pos[chunk_id])
+
+    def doc(self, row: int) -> Dict[str, str]:
+        return self.docs[int(self.doc_idx[row])]
+
+    def text(self, row: int) -> str:
+        a, b = int(self.text_offsets[row]), int(self.text_offsets[row + 1])
+        return self._blob[a:b].tobytes().decode("utf-8")
+
+    @staticmethod
+    def write(meta: pd.DataFrame, path: Path) -> None:
+        """Escribe el store de `meta` (DataFrame de chunks_meta.parquet) en `path`."""
+        MetaStore.write_batches([meta], path)
+
+    @staticmethod
+    def write_batches(batches: Iterable[pd.DataFrame], path: Path) -> None:
+        """
+        Como write(), lote a lote (p.ej. parquet_batches): los textos van
+        directo a text.bin, en memoria solo quedan las columnas de ancho fijo.
+        """
+        path.mkdir(parents=True, exist_ok=True)
+        doc_pos: Dict[tuple, int] = {}
+        cols: Dict[str, List[np.ndarray]] = {c: [] for c in ("chunk_id", "doc_idx", "page", "char_start",
+                                                              "char_end", "text_end")}
+        n = size = 0
+        with open(path / "text.bin", "wb") as f:
+            for meta in batches:
+                if "chunk_id" not in meta.columns:
+                    # Índice antiguo (IndexFlatIP sin IDs): el ID es la posición
+                    meta = meta.assign(chunk_id=np.arange(n, n + len(meta), dtype="int64"))
+                if "tipo" not in meta.columns:
+                    meta = meta.assign(tipo="")
+                fields = meta[list(DOC_FIELDS)].fillna("").astype(str)
+                keys = list(zip(*(fields[c] for c in DOC_FIELDS)))
+                cols["doc_idx"].append(np.fromiter((doc_pos.setdefault(key, len(doc_pos)) for key in keys),
+                                                   dtype="int32", count=len(keys)))
+                cols["chunk_id"].append(meta["chunk_id"].to_numpy(dtype="int64"))
+                cols["page"].append(_as_int(meta["page"]).astype("int32"))
+                for col in ("char_start", "char_end"):
+                    values = meta[col] if col in meta.columns else pd.Series(-1, index=meta.index)
+                    cols[col].append(_as_int(values))
+                ends = np.zeros(len(meta), dtype="int64")
+                for i, text in enumerate(meta["text"].fillna("").astype(str)):
+                    data = text.encode("utf-8")
+                    f.write(data)
+                    size += len(data)
+                    ends[i] = size
+                cols["text_end"].append(ends)
+                n += len(meta)
+
+        cat = {c: np.concatenate(v) if v else np.zeros(0, dtype="int64") for c, v in cols.items()}
+        chunk_ids = cat["chunk_id"].astype("int64")
+        pos = np.full(int(chunk_ids.max()) + 1 if len(chunk_ids) else 0, -1, dtype="int32")
+        pos[chunk_ids] = np.arange(len(chunk_ids), dtype="int32")
+        offsets = np.concatenate([np.zeros(1, dtype="int64"), cat["text_end"].astype("int64")])
+        docs = [dict(zip(DOC_FIELDS, key)) for key in doc_pos]
+
+        np.save(path / "chunk_ids.npy", chunk_ids)
+        np.save(path / "doc_idx.npy", cat["doc_idx"].astype("int32"))
+        np.save(path / "page.npy", cat["page"].astype("int32"))
+        for col in ("char_start", "char_end"):
+            np.save(path / f"{col}.npy", cat[col].astype("int64"))
+        np.save(path / "text_offsets.npy", offsets)
+        np.save(path / "pos.npy", pos)
+        (path / "docs.json").write_text(json.dumps(docs, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def open(cls, meta_path: Path, root: Path = META_STORE_DIR) -> "MetaStore":
+        """
+        Abre el store que corresponde a la versión actual de `meta_path`; si no
+        existe lo construye (en un directorio temporal que se renombra, así
+        varios workers pueden arrancar a la vez).
+        """
+        path = root / file_fingerprint(meta_path)
+        if not (path / "docs.json").exists():
+            tmp = root / f"{path.name}.tmp-{os.getpid()}"
+            cls.write_batches(parquet_batches(meta_path), tmp)
+            try:
+                tmp.rename(path)
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)   # otro proceso ganó la carrera
+        return cls(path)
+
+    @staticmethod
+    def prune(meta_path: Path, root: Path = META_STORE_DIR) -> None:
+        """Borra versiones anteriores del store (las abiertas por otro proceso se ignoran)."""
+        keep = file_fingerprint(meta_path)
+        for p in root.glob("*") if root.exists() else []:
+            if p.is_dir() and p.name != keep:
+                shutil.rmtree(p, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rows": len(self), "docs": len(self.docs), "text_mb": round(len(self._blob) / (1024 * 1024), 2)}
@@ -0,0 +1,62 @@
+# rag/onnx_encoder.py
+# Encoder de consultas sin torch: MiniLM exportado a ONNX (int8) + tokenizer
+# rápido de `tokenizers`. Lo genera rag/export_onnx.py en ONNX_DIR.
+import json
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+ONNX_DIR = Path(os.getenv("ONNX_DIR", "data/onnx"))
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "model.int8.onnx")
+
+
+class OnnxSentenceEncoder:
+    """
+    Misma interfaz que usa QueryEncoder de SentenceTransformer
+    (`encode(textos, normalize_embeddings, batch_size)`): mean pooling sobre
+    last_hidden_state con la máscara de atención y normalización L2.
+    """
+
+    def __init__(self, model_dir: Path = ONNX_DIR, model_file: str = ONNX_MODEL_FILE, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        cfg = json.loads((model_dir / "encoder.json").read_text(encoding="utf-8"))
+        self.model_name = cfg["model"]
+        self.dim = int(cfg["dim"])
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(cfg["max_seq_length"]))
+        self.tokenizer.enable_padding(pad_id=int(cfg.get("pad_id", 0)), pad_token=cfg.get("pad_token", "[PAD]"))
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_dir / model_file), sess_options=opts,
+                                            providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, batch_size: int = 32,
+               **_) -> np.ndarray:
+        out = []
+        for a in range(0, len(texts), max(1, batch_size)):
+            encs = self.tokenizer.encode_batch(list(texts[a:a + batch_size]))
+            feeds = {
+                "input_ids": np.array([e.ids for e in encs], dtype="int64"),
+                "attention_mask": np.array([e.attention_mask for e in encs], dtype="int64"),
+                "token_type_ids": np.array([e.type_ids for e in encs], dtype="int64"),
+            }
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+            mask = feeds["attention_mask"][:, :, None].astype("float32")
+            emb = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if normalize_embeddings:
+                emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            out.append(emb.astype("float32"))
+        if not out:
+            return np.zeros((0, self.dim), dtype="float32")
+        return np.vstack(out)
@@ -1,6 +1,9 @@
 # rag/prompts.py
 from typing import List, Dict
 
+# Subir al cambiar system_prompt/build_messages: forma parte de la clave del cache de respuestas
+PROMPT_VERSION = "2"
+
 def system_prompt() -> str:
     return (
         "Eres 'Asistente UFRO', experto en normativa vigente. "
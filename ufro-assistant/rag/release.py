@@ -0,0 +1,105 @@
+# rag/release.py
+# Publicación atómica del índice. rag/embed.py escribe todo lo que lee el
+# Retriever (índice FAISS, index_config.json, chunks_meta.parquet, store
+# columnar y la copia de bm25.npz) en un directorio nuevo de RELEASES_DIR y al
+# final cambia el puntero CURRENT con un solo rename. Un lector que toma el
+# puntero ve una versión completa y consistente (nunca un índice nuevo con
+# metadatos viejos), y "cambió el índice" es "cambió el puntero": una sola
+# recarga por reconstrucción.
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from rag.bm25 import BM25_PATH
+from rag.cache import file_fingerprint
+from rag.index_factory import INDEX_CONFIG_PATH
+
+RELEASES_DIR = Path("data/releases")
+POINTER_PATH = RELEASES_DIR / "CURRENT"
+KEEP_RELEASES = int(os.getenv("KEEP_RELEASES", "2"))   # versiones que se conservan (la vigente incluida)
+
+# Layout anterior (archivos sueltos en data/), usado mientras no haya puntero
+INDEX_PATH = Path("data/index.faiss")
+META_PATH = Path("data/processed/chunks_meta.parquet")
+
+
+@dataclass(frozen=True)
+class IndexRelease:
+    version: str
+    index_path: Path
+    meta_path: Path
+    config_path: Path
+    bm25_path: Path
+    meta_store: Optional[Path] = None   # None = layout anterior (MetaStore.open deriva el store)
+
+    @classmethod
+    def at(cls, root: Path) -> "IndexRelease":
+        return cls(version=root.name, index_path=root / "index.faiss", meta_path=root / "chunks_meta.parquet",
+                   config_path=root / "index_config.json", bm25_path=root / "bm25.npz", meta_store=root / "meta")
+
+    def exists(self) -> bool:
+        return self.index_path.exists() and self.meta_path.exists()
+
+
+def read_pointer() -> Optional[str]:
+    try:
+        return POINTER_PATH.read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_release() -> IndexRelease:
+    """La versión publicada; sin puntero, los archivos sueltos del layout anterior."""
+    name = read_pointer()
+    if name is not None:
+        return IndexRelease.at(RELEASES_DIR / name)
+    legacy = [p for p in (INDEX_PATH, META_PATH, INDEX_CONFIG_PATH, BM25_PATH) if p.exists()]
+    return IndexRelease(version=file_fingerprint(*legacy) if legacy else "", index_path=INDEX_PATH,
+                        meta_path=META_PATH, config_path=INDEX_CONFIG_PATH, bm25_path=BM25_PATH)
+
+
+def current_version() -> str:
+    """Identificador de la versión publicada (lectura barata: solo el puntero)."""
+    return read_pointer() or current_release().version
+
+
+def staging_dir() -> Path:
+    """Directorio temporal donde rag/embed.py arma la próxima versión."""
+    path = RELEASES_DIR / f".staging-{os.getpid()}-{time.time_ns()}"
+    path.mkdir(parents=True)
+    return path
+
+
+def publish(staging: Path) -> IndexRelease:
+    """Da nombre definitivo a `staging` y lo publica reemplazando el puntero (rename atómico)."""
+    ns = time.time_ns()   # nombres ordenables por fecha (prune se basa en eso)
+    name = time.strftime("%Y%m%d-%H%M%S", time.localtime(ns // 10**9)) + f"-{ns // 1000 % 10**6:06d}"
+    final = RELEASES_DIR / name
+    staging.rename(final)
+    tmp = POINTER_PATH.with_name(f".CURRENT.tmp-{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(POINTER_PATH)
+    prune()
+    return IndexRelease.at(final)
+
+
+def prune(keep: int = KEEP_RELEASES) -> None:
+    """
+    Borra versiones viejas y staging abandonados. Se conserva la anterior a la
+    vigente: un servidor que aún no recarga puede seguir abriéndola.
+    """
+    if not RELEASES_DIR.exists():
+        return
+    current = read_pointer()
+    dirs = sorted(p for p in RELEASES_DIR.iterdir() if p.is_dir() and not p.name.startswith("."))
+    old = [p for p in dirs if p.name != current][:max(0, len(dirs) - max(1, keep))]
+    stale = [p for p in RELEASES_DIR.glob(".staging-*")
+             if p.is_dir() and time.time() - p.stat().st_mtime > 24 * 3600]
+    for p in old + stale:
+        shutil.rmtree(p, ignore_errors=True)
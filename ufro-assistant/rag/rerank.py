@@ -0,0 +1,93 @@
+# rag/rerank.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from sentence_transformers import CrossEncoder
+
+from rag.cache import normalize_question
+
+# Cross-encoder multilingüe pequeño (funciona bien con preguntas en español)
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+
+
+class Reranker:
+    """
+    Re-ordena candidatos con un cross-encoder local: puntúa todos los pares
+    (pregunta, chunk) en un solo forward por lotes y devuelve los top-n.
+
+    - Los puntajes por (pregunta normalizada, chunk_id) quedan en un LRU.
+    - Si el costo estimado (ms por par × pares sin cache) supera `budget_ms`,
+      o hay más de `max_inflight` reranks en curso, se omite el rerank y se
+      devuelven los primeros top-n del orden original.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, budget_ms: float = 150.0,
+                 max_inflight: int = 4, cache_size: int = 20000, max_chars: int = 1500):
+        self.model = CrossEncoder(model_name, max_length=512)
+        self.budget_ms = budget_ms
+        self.max_inflight = max_inflight
+        self.cache_size = cache_size
+        self.max_chars = max_chars
+        self.ms_per_pair = 5.0   # estimación inicial; se ajusta con una media móvil
+        self.calls = 0
+        self.skipped = 0
+        self.pairs_scored = 0
+        self.pairs_cached = 0
+        self._inflight = 0
+        self._cache: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rerank(self, question: str, chunks: List[Any], top_n: int,
+               budget_ms: Optional[float] = None) -> List[Any]:
+        budget = self.budget_ms if budget_ms is None else budget_ms
+        qn = normalize_question(question)
+        with self._lock:
+            self.calls += 1
+            scores: Dict[int, float] = {}
+            for c in chunks:
+                hit = self._cache.get((qn, c.chunk_id))
+                if hit is not None:
+                    self._cache.move_to_end((qn, c.chunk_id))
+                    scores[c.chunk_id] = hit
+            todo = [c for c in chunks if c.chunk_id not in scores]
+            over_budget = budget > 0 and todo and self.ms_per_pair * len(todo) > budget
+            if over_budget or (todo and self._inflight >= self.max_inflight):
+                self.skipped += 1
+                return chunks[:top_n]
+            self.pairs_cached += len(chunks) - len(todo)
+            self._inflight += 1
+
+        try:
+            if todo:
+                t0 = time.perf_counter()
+                pred = self.model.predict([(question, c.text[:self.max_chars]) for c in todo],
+                                          batch_size=len(todo), show_progress_bar=False)
+                dt_ms = (time.perf_counter() - t0) * 1000.0
+                with self._lock:
+                    self.ms_per_pair = 0.8 * self.ms_per_pair + 0.2 * (dt_ms / len(todo))
+                    self.pairs_scored += len(todo)
+                    for c, s in zip(todo, pred):
+                        scores[c.chunk_id] = float(s)
+                        self._cache[(qn, c.chunk_id)] = float(s)
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+        ranked = sorted(chunks, key=lambda c: -scores[c.chunk_id])[:top_n]
+        return [replace(c, score=scores[c.chunk_id]) for c in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "skipped_budget": self.skipped,
+            "pairs_scored": self.pairs_scored,
+            "pairs_cached": self.pairs_cached,
+            "ms_per_pair": round(self.ms_per_pair, 3),
+            "budget_ms": self.budget_ms,
+        }
@@ -1,61 +1,256 @@
 # rag/retrieve.py
-from dataclasses import dataclass
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 
 import faiss
 import numpy as np
-import pandas as pd
-from sentence_transformers import SentenceTransformer
 
-INDEX_PATH = Path("data/index.faiss")
-META_PATH = Path("data/processed/chunks_meta.parquet")
+from rag.encoder import QueryEncoder, MicroBatcher
+from rag.index_factory import apply_search_params, load_index_config, search_parameters
+from rag.bm25 import BM25Index, rrf_fuse
+from rag.meta_store import MetaStore
+# Rutas del layout anterior (sin data/releases/CURRENT); se re-exportan por compatibilidad
+from rag.release import INDEX_PATH, META_PATH, current_release, current_version
+# Tipos livianos (sin faiss/pandas); se re-exportan aquí por compatibilidad
+from rag.schema import RetrievedChunk, RetrievalFilter, format_context
+
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+QUERY_BATCH = int(os.getenv("QUERY_BATCH", "32"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "2"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+# Índice en solo lectura con mmap (compartido entre workers vía page cache); INDEX_MMAP=0 lo copia a RAM
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+# "torch" (SentenceTransformer) | "onnx" (MiniLM int8 de rag/export_onnx.py, sin importar torch)
+QUERY_ENCODER = os.getenv("QUERY_ENCODER", "torch")
+# "dense" (solo FAISS) | "hybrid" (FAISS + BM25 fusionados con RRF)
+RETRIEVAL_MODES = ("dense", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Rerank opcional con cross-encoder (rag/rerank.py): sobre-recupera y deja top-k
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+
+def check_mode(mode: str) -> str:
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Modo de recuperación no soportado: {mode} (opciones: {', '.join(RETRIEVAL_MODES)})")
+    return mode
+
+def read_index_shared(path: Path) -> faiss.Index:
+    """
+    Abre el índice con IO_FLAG_READ_ONLY + mmap: los códigos de IndexFlat /
+    HNSW (y las listas IVF en disco) se leen directo del archivo, así todos
+    los workers que lo abren comparten las mismas páginas del page cache en
+    vez de tener una copia cada uno. Si la versión de FAISS no lo soporta
+    para este tipo de índice, se carga en memoria como antes.
+    """
+    if INDEX_MMAP:
+        flags = faiss.IO_FLAG_READ_ONLY | faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            return faiss.read_index(str(path), flags)
+        except RuntimeError as e:
+            print(f"[WARN] No se pudo abrir {path} con mmap ({e}); se carga en memoria.")
+    return faiss.read_index(str(path))
+
+def load_query_model(backend: str):
+    """Modelo con `encode(textos, normalize_embeddings, batch_size)` para las consultas."""
+    if backend == "onnx":
+        from rag.onnx_encoder import OnnxSentenceEncoder
+        return OnnxSentenceEncoder()
+    if backend != "torch":
+        raise ValueError(f"QUERY_ENCODER no soportado: {backend} (opciones: torch, onnx)")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
 
-@dataclass
-class RetrievedChunk:
-    score: float
-    doc_id: str
-    title: str
-    page: Any
-    url: str
-    vigencia: str
-    text: str
+def index_version() -> str:
+    """Versión publicada del índice en disco (el puntero de rag/release.py; cambia al reconstruirlo)."""
+    return current_version()
 
 class Retriever:
     def __init__(self):
-        if not INDEX_PATH.exists() or not META_PATH.exists():
+        # Todo sale de una misma versión publicada (índice, config, metadatos y BM25)
+        release = current_release()
+        if not release.exists():
             raise FileNotFoundError("Faltan index.faiss o chunks_meta.parquet. Corre rag/embed.py")
-        self.index = faiss.read_index(str(INDEX_PATH))
-        self.meta = pd.read_parquet(META_PATH)
-        self.model = SentenceTransformer(MODEL_NAME)
-
-    def query(self, q: str, k: int = 4) -> List[RetrievedChunk]:
-        q_emb = self.model.encode([q], normalize_embeddings=True)
-        q_emb = np.asarray(q_emb, dtype="float32")
-        scores, idx = self.index.search(q_emb, k)
-        results: List[RetrievedChunk] = []
-        for score, i in zip(scores[0], idx[0]):
-            if i == -1:
-                continue
-            row = self.meta.iloc[int(i)]
-            results.append(RetrievedChunk(
-                score=float(score),
-                doc_id=str(row["doc_id"]),
-                title=str(row["title"]),
-                page=row["page"],
-                url=str(row["url"]),
-                vigencia=str(row["vigencia"]),
-                text=str(row["text"]),
-            ))
-        return results
-
-def format_context(chunks: List[RetrievedChunk]) -> str:
-    """
-    Devuelve un bloque de contexto con los fragmentos y referencias.
-    """
-    lines = []
-    for c in chunks:
-        ref = f"{c.title}, p.{c.page}" if pd.notna(c.page) else f"{c.title}"
-        lines.append(f"[Fuente: {ref} | Vigencia: {c.vigencia}]\n{c.text}\n")
-    return "\n---\n".join(lines)
+        # Identifica la versión del índice cargado (p.ej. para invalidar caches)
+        self.version = release.version
+        self.index = read_index_shared(release.index_path)
+        # efSearch / nprobe según index_config.json (no se guardan en el .faiss)
+        self.index_config = load_index_config(release.config_path)
+        apply_search_params(self.index, self.index_config.get("params", {}))
+        # FAISS devuelve chunk_id (IndexIDMap2) -> fila del store columnar (mmap)
+        self.meta = (MetaStore(release.meta_store) if release.meta_store is not None
+                     else MetaStore.open(release.meta_path))
+        self._filter_cache: "OrderedDict[RetrievalFilter, np.ndarray]" = OrderedDict()
+        self._filter_lock = threading.Lock()
+        self.model = load_query_model(QUERY_ENCODER)
+        # Índice léxico opcional (lo genera rag/ingest.py; rag/embed.py lo copia a la versión)
+        self.bm25 = BM25Index.load(release.bm25_path) if release.bm25_path.exists() else None
+        self.reranker = None
+        if RERANK:
+            from rag.rerank import Reranker
+            self.reranker = Reranker(budget_ms=RERANK_BUDGET_MS)
+        # Consultas concurrentes se codifican y buscan en un solo lote
+        self.encoder = QueryEncoder(self.model, cache_size=QUERY_CACHE_SIZE)
+        self._batcher = MicroBatcher(self._query_batch, max_batch=QUERY_BATCH,
+                                     max_wait_ms=QUERY_BATCH_WAIT_MS, name="query-batcher")
+
+    def warmup(self) -> None:
+        """
+        Un encode y una búsqueda de prueba para cargar pesos, inicializar hilos
+        de torch/FAISS y tocar las páginas del índice antes de la primera request.
+        """
+        self.query("calendario académico", k=1)
+
+    def close(self) -> None:
+        """Detiene el hilo del micro-batcher (llamar al reemplazar este Retriever)."""
+        self._batcher.close()
+
+    def embed(self, q: str) -> np.ndarray:
+        """Embedding normalizado de la consulta, shape (1, dim) float32."""
+        return self.encoder.encode([q])
+
+    def _chunk(self, chunk_id: int, score: float) -> RetrievedChunk:
+        row = self.meta.row(int(chunk_id))
+        doc = self.meta.doc(row)
+        page, start, end = int(self.meta.page[row]), int(self.meta.char_start[row]), int(self.meta.char_end[row])
+        return RetrievedChunk(
+            score=float(score),
+            doc_id=doc["doc_id"],
+            title=doc["title"],
+            page=page if page >= 0 else None,
+            url=doc["url"],
+            vigencia=doc["vigencia"],
+            text=self.meta.text(row),
+            chunk_id=int(chunk_id),
+            char_start=start if start >= 0 else None,
+            char_end=end if end >= 0 else None,
+        )
+
+    def filter_ids(self, filt: RetrievalFilter) -> np.ndarray:
+        """chunk_ids (ordenados) que cumplen el filtro; se cachean por filtro."""
+        with self._filter_lock:
+            ids = self._filter_cache.get(filt)
+            if ids is not None:
+                self._filter_cache.move_to_end(filt)
+                return ids
+        # Las condiciones son por documento: máscara sobre docs y luego por fila
+        doc_mask = np.ones(len(self.meta.docs), dtype=bool)
+        if filt.doc_ids:
+            doc_mask &= np.isin(self.meta.doc_id, filt.doc_ids)
+        if filt.vigencia_min is not None:
+            doc_mask &= self.meta.doc_vigencia >= filt.vigencia_min   # NaN (sin vigencia) no cumple
+        if filt.tipos:
+            doc_mask &= np.isin(self.meta.doc_tipo, filt.tipos)
+        ids = np.sort(self.meta.chunk_ids[doc_mask[self.meta.doc_idx]])
+        with self._filter_lock:
+            self._filter_cache[filt] = ids
+            while len(self._filter_cache) > 256:
+                self._filter_cache.popitem(last=False)
+        return ids
+
+    def search_many(self, q_embs: np.ndarray, k: int = 4,
+                    filt: Optional[RetrievalFilter] = None) -> List[List[RetrievedChunk]]:
+        """Una sola llamada a index.search para todas las filas de q_embs."""
+        params = None
+        if filt is not None:
+            ids = self.filter_ids(filt)
+            if len(ids) == 0:
+                return [[] for _ in range(len(q_embs))]
+            k = min(k, len(ids))
+            sel = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+            params = search_parameters(self.index, sel)
+        scores, idx = self.index.search(q_embs, k, params=params)
+        return [
+            [self._chunk(i, score) for score, i in zip(row_scores, row_idx) if i != -1]
+            for row_scores, row_idx in zip(scores, idx)
+        ]
+
+    def search(self, q_emb: np.ndarray, k: int = 4, filt: Optional[RetrievalFilter] = None) -> List[RetrievedChunk]:
+        return self.search_many(q_emb, k, filt)[0]
+
+    def _query_batch(self, items: List[Tuple[str, int, Optional[RetrievalFilter]]]
+                     ) -> List[Tuple[np.ndarray, List[RetrievedChunk]]]:
+        embs = self.encoder.encode([q for q, _, _ in items])
+        # Un index.search por filtro distinto dentro del lote (normalmente uno)
+        groups: Dict[Optional[RetrievalFilter], List[int]] = {}
+        for i, (_, _, filt) in enumerate(items):
+            groups.setdefault(filt, []).append(i)
+        hits: List[List[RetrievedChunk]] = [[] for _ in items]
+        for filt, rows in groups.items():
+            found = self.search_many(embs[rows], max(items[i][1] for i in rows), filt)
+            for i, row_hits in zip(rows, found):
+                hits[i] = row_hits
+        return [(embs[i:i + 1], hits[i][:k]) for i, (_, k, _) in enumerate(items)]
+
+    def query(self, q: str, k: int = 4, mode: Optional[str] = None, rerank: Optional[bool] = None,
+              filt: Optional[RetrievalFilter] = None) -> List[RetrievedChunk]:
+        return self.query_with_embedding(q, k, mode, rerank, filt)[1]
+
+    def query_with_embedding(self, q: str, k: int = 4, mode: Optional[str] = None,
+                             rerank: Optional[bool] = None, filt: Optional[RetrievalFilter] = None
+                             ) -> Tuple[np.ndarray, List[RetrievedChunk]]:
+        """
+        Como query, pero también devuelve el embedding (p.ej. para el cache semántico).
+        Con reranker activo (y rerank distinto de False) trae RERANK_CANDIDATES
+        candidatos y el cross-encoder elige los k finales. `filt` restringe por
+        doc_id / vigencia / tipo dentro de la búsqueda.
+        """
+        use_rerank = self.reranker is not None and rerank is not False
+        n = max(k, RERANK_CANDIDATES) if use_rerank else k
+        q_emb, chunks = self._retrieve(q, n, mode or RETRIEVAL_MODE, filt)
+        if use_rerank:
+            chunks = self.reranker.rerank(q, chunks, top_n=k)
+        return q_emb, chunks
+
+    def query_many(self, qs: Sequence[str], k: int = 4, mode: Optional[str] = None,
+                   rerank: Optional[bool] = None, filt: Optional[RetrievalFilter] = None
+                   ) -> List[Tuple[np.ndarray, List[RetrievedChunk]]]:
+        """
+        query_with_embedding para una lista de preguntas ya reunida (p.ej.
+        /ask-batch): un solo encode y un index.search para todo el lote, sin
+        esperar al micro-batcher. BM25 y rerank siguen siendo por pregunta.
+        """
+        mode = check_mode(mode or RETRIEVAL_MODE)
+        use_rerank = self.reranker is not None and rerank is not False
+        n = max(k, RERANK_CANDIDATES) if use_rerank else k
+        hybrid = mode == "hybrid" and self.bm25 is not None
+        found = self._query_batch([(q, max(n, HYBRID_CANDIDATES) if hybrid else n, filt) for q in qs])
+        out = []
+        for q, (q_emb, chunks) in zip(qs, found):
+            if hybrid:
+                chunks = self._fuse(q, chunks, n, filt)
+            if use_rerank:
+                chunks = self.reranker.rerank(q, chunks, top_n=k)
+            out.append((q_emb, chunks))
+        return out
+
+    def _retrieve(self, q: str, k: int, mode: str,
+                  filt: Optional[RetrievalFilter] = None) -> Tuple[np.ndarray, List[RetrievedChunk]]:
+        # Se valida antes de mirar BM25: sin índice léxico un modo inválido no pasa por "dense"
+        if check_mode(mode) == "dense" or self.bm25 is None:
+            return self._batcher((q, k, filt))
+        q_emb, dense = self._batcher((q, max(k, HYBRID_CANDIDATES), filt))
+        return q_emb, self._fuse(q, dense, k, filt)
+
+    def _fuse(self, q: str, dense: List[RetrievedChunk], k: int,
+              filt: Optional[RetrievalFilter]) -> List[RetrievedChunk]:
+        """Fusiona los candidatos densos con BM25 (RRF) y deja los k primeros."""
+        n = max(k, HYBRID_CANDIDATES)
+        sparse = self.bm25.search(q, n, ids=self.filter_ids(filt) if filt is not None else None)
+        fused = rrf_fuse([[c.chunk_id for c in dense], [cid for cid, _ in sparse]], n)
+        # BM25 puede conocer chunks aún no embebidos: se descartan
+        fused = [(cid, score) for cid, score in fused if cid in self.meta][:k]
+        return [self._chunk(cid, score) for cid, score in fused]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "encoder": QUERY_ENCODER,
+            "encoder_cache": self.encoder.stats(),
+            "batcher": self._batcher.stats(),
+            "reranker": self.reranker.stats() if self.reranker is not None else None,
+            "meta": self.meta.stats(),
+        }
@@ -0,0 +1,51 @@
+# rag/schema.py
+# Tipos de la recuperación sin dependencias pesadas (faiss, torch, pandas):
+# los usa el CLI y el cliente del daemon sin cargar el stack RAG.
+import math
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+@dataclass
+class RetrievedChunk:
+    score: float
+    doc_id: str
+    title: str
+    page: Any
+    url: str
+    vigencia: str
+    text: str
+    chunk_id: int = -1
+    # Posición en el texto completo del documento (para unir chunks solapados)
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+
+@dataclass(frozen=True)
+class RetrievalFilter:
+    """
+    Filtro de metadatos que se evalúa dentro de la búsqueda (IDSelector de
+    FAISS / máscara en BM25), no después: siempre llegan k resultados si existen.
+    """
+    doc_ids: Tuple[str, ...] = ()
+    vigencia_min: Optional[int] = None
+    tipos: Tuple[str, ...] = ()
+
+    @classmethod
+    def make(cls, doc_ids: Optional[Sequence[str]] = None, vigencia_min: Optional[int] = None,
+             tipos: Optional[Sequence[str]] = None) -> Optional["RetrievalFilter"]:
+        """None si no hay ninguna condición (búsqueda sin filtro)."""
+        f = cls(tuple(sorted({d.strip() for d in doc_ids or [] if d.strip()})), vigencia_min,
+                tuple(sorted({t.strip().upper() for t in tipos or [] if t.strip()})))
+        return f if (f.doc_ids or f.vigencia_min is not None or f.tipos) else None
+
+def _is_missing(x: Any) -> bool:
+    return x is None or (isinstance(x, float) and math.isnan(x))
+
+def format_context(chunks: List[RetrievedChunk]) -> str:
+    """
+    Devuelve un bloque de contexto con los fragmentos y referencias.
+    """
+    lines = []
+    for c in chunks:
+        ref = f"{c.title}, p.{c.page}" if not _is_missing(c.page) else f"{c.title}"
+        lines.append(f"[Fuente: {ref} | Vigencia: {c.vigencia}]\n{c.text}\n")
+    return "\n---\n".join(lines)
@@ -0,0 +1,100 @@
+# rag/semantic_cache.py
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cache de preguntas casi duplicadas.
+
+    Guarda el embedding (normalizado, MiniLM) de cada pregunta ya respondida en
+    un índice FAISS pequeño. Una pregunta nueva reutiliza la respuesta si:
+      - el coseno con una pregunta guardada es >= `threshold`, y
+      - el conjunto de chunks recuperados es el mismo (misma evidencia),
+      - con igual proveedor, modelo, versión de prompt y k.
+
+    Los casos "parecida pero con otros chunks" se cuentan como falsos aciertos
+    evitados y los aciertos recientes quedan en `audit` para revisión manual.
+    """
+
+    def __init__(self, dim: int, threshold: float = 0.92, max_items: int = 5000,
+                 candidates: int = 5, audit_size: int = 200):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_items = max_items
+        self.candidates = candidates
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self.entries: Dict[int, Dict[str, Any]] = {}
+        self.order: deque = deque()
+        self.audit: deque = deque(maxlen=audit_size)
+        self.lookups = 0
+        self.hits = 0
+        self.near_rejected = 0   # similares sobre el umbral pero con otros chunks
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scope(chunk_ids: Iterable[Any], provider: str, model: str, prompt_version: str, k: int) -> tuple:
+        return (frozenset(str(c) for c in chunk_ids), provider, model, prompt_version, int(k))
+
+    def lookup(self, q_emb: np.ndarray, question: str, chunk_ids: Iterable[Any], provider: str,
+               model: str, prompt_version: str, k: int) -> Optional[Dict[str, Any]]:
+        scope = self._scope(chunk_ids, provider, model, prompt_version, k)
+        with self._lock:
+            self.lookups += 1
+            if self.index.ntotal == 0:
+                return None
+            scores, ids = self.index.search(q_emb, min(self.candidates, self.index.ntotal))
+            near = False
+            for score, i in zip(scores[0], ids[0]):
+                if i == -1 or score < self.threshold:
+                    break
+                entry = self.entries[int(i)]
+                if entry["scope"] != scope:
+                    near = near or entry["scope"][1:] == scope[1:]
+                    continue
+                self.hits += 1
+                self.audit.append({"question": question, "matched": entry["question"],
+                                   "score": round(float(score), 4)})
+                return entry
+            if near:
+                self.near_rejected += 1
+            return None
+
+    def add(self, q_emb: np.ndarray, question: str, chunk_ids: Iterable[Any], provider: str,
+            model: str, prompt_version: str, k: int, answer: str) -> None:
+        with self._lock:
+            eid = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(np.asarray(q_emb, dtype="float32").reshape(1, -1),
+                                    np.array([eid], dtype="int64"))
+            self.entries[eid] = {"question": question, "answer": answer,
+                                 "scope": self._scope(chunk_ids, provider, model, prompt_version, k)}
+            self.order.append(eid)
+            while len(self.order) > self.max_items:
+                old = self.order.popleft()
+                self.index.remove_ids(np.array([old], dtype="int64"))
+                self.entries.pop(old, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.index.reset()
+            self.entries.clear()
+            self.order.clear()
+            self.audit.clear()
+
+    def stats(self, audit_tail: int = 20) -> Dict[str, Any]:
+        recent: List[Dict[str, Any]] = list(self.audit)[-audit_tail:]
+        return {
+            "threshold": self.threshold,
+            "items": len(self.entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "near_rejected": self.near_rejected,
+            "recent_hits": recent,
+        }
@@ -0,0 +1,140 @@
+# rag/singleflight.py
+# Coalescencia de requests idénticas en vuelo: si llega la misma pregunta (con
+# los mismos parámetros) mientras otra igual todavía se está respondiendo, se
+# espera ese resultado en vez de repetir recuperación y llamada al LLM. Cubre
+# la ventana que el cache de respuestas no alcanza (la primera aún no termina).
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from rag.cache import normalize_question
+
+
+def flight_key(question: str, *params: Any) -> Tuple[Any, ...]:
+    """Pregunta normalizada + parámetros que cambian la respuesta."""
+    return (normalize_question(question),) + tuple(params)
+
+
+class _Stream:
+    """Salida de un generador compartido: los eventos se guardan y cada suscriptor los recorre."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+        self.task: Optional["asyncio.Task[None]"] = None   # pump(): se guarda para poder cancelarla
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """
+    Una sola ejecución por clave a la vez (por proceso / event loop).
+    El trabajo corre en su propia tarea: si el cliente que lo inició se
+    desconecta, los que esperan el mismo resultado lo reciben igual.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Any, "asyncio.Task[Any]"] = {}
+        self._streams: Dict[Any, _Stream] = {}
+        self._lock = threading.Lock()   # solo para los contadores
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self._waiters: Dict[Any, int] = {}
+
+    def _count(self, key: Any, leader: bool) -> None:
+        with self._lock:
+            if leader:
+                self.leaders += 1
+                self._waiters[key] = 0
+            else:
+                self.coalesced += 1
+                self._waiters[key] = self._waiters.get(key, 0) + 1
+                self.max_waiters = max(self.max_waiters, self._waiters[key])
+
+    def _forget(self, key: Any) -> None:
+        with self._lock:
+            self._waiters.pop(key, None)
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Resultado de fn() para la clave y si fue compartido con otra request en vuelo."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+
+            def finished(_):
+                self._calls.pop(key, None)
+                self._forget(key)
+
+            task.add_done_callback(finished)
+        self._count(key, leader=not shared)
+        return await asyncio.shield(task), shared
+
+    async def stream(self, key: Any, agen: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Tuple[Any, bool]]:
+        """
+        Como do() para un generador async: todos los suscriptores reciben la
+        misma secuencia de elementos (los que se unen tarde, desde el inicio).
+        Entrega (elemento, compartido). Si se van todos los suscriptores antes
+        de terminar, el generador se cancela (nadie más leería su salida).
+        """
+        st = self._streams.get(key)
+        shared = st is not None
+        if st is None:
+            st = self._streams[key] = _Stream()
+
+            async def pump():
+                try:
+                    async for item in agen():
+                        async with st.changed:
+                            st.items.append(item)
+                            st.changed.notify_all()
+                except Exception as e:
+                    st.error = e
+                finally:
+                    if self._streams.get(key) is st:
+                        self._streams.pop(key, None)
+                        self._forget(key)
+                    async with st.changed:
+                        st.done = True
+                        st.changed.notify_all()
+
+            st.task = asyncio.ensure_future(pump())
+        self._count(key, leader=not shared)
+
+        st.subscribers += 1
+        try:
+            i = 0
+            while True:
+                async with st.changed:
+                    await st.changed.wait_for(lambda: len(st.items) > i or st.done)
+                    batch, finished = st.items[i:], st.done
+                for item in batch:
+                    yield item, shared
+                i += len(batch)
+                if finished and i >= len(st.items):
+                    if st.error is not None:
+                        raise st.error
+                    return
+        finally:
+            st.subscribers -= 1
+            if st.subscribers == 0 and not st.done:
+                # el último se fue (desconexión): una request nueva con la misma
+                # clave arranca otro generador en vez de unirse a uno cancelado
+                if self._streams.get(key) is st:
+                    self._streams.pop(key, None)
+                    self._forget(key)
+                st.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+                "max_waiters": self.max_waiters,
+                "in_flight": len(self._calls) + len(self._streams),
+            }
@@ -1,45 +1,332 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import Form
 
+from providers.http import aclose_http_client
 from providers.openrouter import OpenRouterProvider
+from providers.stub import StubProvider
+from providers.router import RouterProvider, all_provider_stats
 try:
     from providers.deepseek import DeepSeekProvider
     HAVE_DEEPSEEK = True
 except Exception:
     HAVE_DEEPSEEK = False
 
-from rag.retrieve import Retriever, format_context
-from rag.prompts import build_messages
+from rag.retrieve import (Retriever, RetrievalFilter, format_context, RETRIEVAL_MODE,
+                          check_mode as check_retrieval_mode)
+from rag.release import current_version
+from rag.prompts import build_messages, PROMPT_VERSION
+from rag.context import pack_context, token_budget
+from rag.cache import AnswerCache
+from rag.semantic_cache import SemanticCache
+from rag.singleflight import SingleFlight, flight_key
+
+# ==============================
+# Recursos de proceso (singletons)
+# ==============================
+# El Retriever (índice FAISS + metadatos + SentenceTransformer) y los clientes
+# LLM se crean una vez por proceso y se reutilizan entre requests.
+_retriever: Optional[Retriever] = None
+_retriever_error: Optional[str] = None
+_retriever_lock = threading.Lock()
+# Con varios workers cada uno tiene su Retriever: todos vigilan el puntero
+# data/releases/CURRENT (cada INDEX_WATCH_S segundos, al atender una request)
+# y recargan en segundo plano cuando cambia, como rag/daemon.py.
+INDEX_WATCH_S = float(os.getenv("INDEX_WATCH_S", "5"))
+_index_seen: Optional[str] = None    # versión del último intento de carga
+_index_checked = 0.0
+_watch_lock = threading.Lock()       # tomado mientras hay una recarga en curso
+# Clientes LLM por (proveedor, modelo). `model` viene del request: el dict es
+# un LRU acotado (LLM_CACHE_SIZE) y LLM_MODELS, si se define, es la lista de
+# "proveedor:modelo" aceptados (además de los modelos por defecto).
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "32"))
+LLM_MODELS = {m.strip() for m in os.getenv("LLM_MODELS", "").split(",") if m.strip()}
+_llms: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+_llms_lock = threading.Lock()
+
+# Encode (torch) + búsqueda FAISS son CPU-bound: van a un pool acotado para
+# no bloquear el event loop. Los hilos del pool esperan al micro-batcher del
+# Retriever, que junta las consultas concurrentes en un solo encode + search.
+RAG_THREADS = int(os.getenv("RAG_THREADS", "16"))
+_rag_pool = ThreadPoolExecutor(max_workers=RAG_THREADS, thread_name_prefix="rag")
+
+# Cache exacto de respuestas RAG (memoria + SQLite), ANSWER_CACHE=0 lo desactiva
+answer_cache: Optional[AnswerCache] = None
+if os.getenv("ANSWER_CACHE", "1") == "1":
+    answer_cache = AnswerCache(
+        max_items=int(os.getenv("ANSWER_CACHE_ITEMS", "1024")),
+        ttl_s=float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+    )
+
+# Cache semántico de preguntas casi duplicadas (se recrea con cada índice)
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_THRESHOLD", "0.92"))
+semantic_cache: Optional[SemanticCache] = None
+
+# Preguntas idénticas en vuelo comparten recuperación y llamada al LLM; SINGLE_FLIGHT=0 lo desactiva
+single_flight: Optional[SingleFlight] = SingleFlight() if os.getenv("SINGLE_FLIGHT", "1") == "1" else None
+
+async def run_rag(fn, *args):
+    """Ejecuta trabajo CPU-bound del RAG en el pool, sin bloquear el loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_rag_pool, fn, *args)
 
-app = FastAPI(title="UFRO Assistant API", version="1.0.0")
+def load_retriever() -> Dict[str, Any]:
+    """
+    Construye y calienta un Retriever nuevo y lo publica al terminar.
+    Mientras carga, las requests siguen usando el anterior.
+    """
+    global _retriever, _retriever_error, semantic_cache, _index_seen
+    t0 = time.perf_counter()
+    with _retriever_lock:
+        # aunque falle, no se reintenta hasta que se publique otra versión
+        _index_seen = current_version()
+        try:
+            r = Retriever()
+            r.warmup()
+        except Exception as e:
+            _retriever_error = str(e)
+            print(f"[WARN] Retriever no disponible: {e}")
+            return {"loaded": False, "error": _retriever_error}
+        if answer_cache is not None:
+            # Índice reconstruido => las respuestas guardadas ya no valen
+            answer_cache.set_index_version(r.version)
+        if SEMANTIC_CACHE:
+            semantic_cache = SemanticCache(r.index.d, threshold=SEMANTIC_THRESHOLD)
+        # Se publica al final: una request que ve el Retriever nuevo ya ve
+        # también los caches de su versión
+        old = _retriever
+        _retriever, _retriever_error, _index_seen = r, None, r.version
+    if old is not None:
+        # Las requests que aún lo usan siguen funcionando (sin micro-batching)
+        old.close()
+    dt = (time.perf_counter() - t0) * 1000.0
+    print(f"[OK] Retriever cargado y calentado en {dt:.0f} ms")
+    return {"loaded": True, "load_ms": round(dt, 1)}
+
+def _reload_if_stale() -> None:
+    try:
+        if current_version() != _index_seen:
+            load_retriever()
+    finally:
+        _watch_lock.release()
+
+def watch_index() -> None:
+    """
+    Lanza una recarga en segundo plano si otro proceso publicó una versión
+    nueva del índice (rag/embed.py o /admin/reload en otro worker). Lee el
+    puntero a lo más cada INDEX_WATCH_S segundos; mientras recarga, las
+    requests siguen con el Retriever anterior.
+    """
+    global _index_checked
+    now = time.monotonic()
+    if now - _index_checked < INDEX_WATCH_S:
+        return
+    _index_checked = now
+    if current_version() != _index_seen and _watch_lock.acquire(blocking=False):
+        _rag_pool.submit(_reload_if_stale)
+
+def get_retriever() -> Retriever:
+    watch_index()
+    if _retriever is None:
+        raise HTTPException(503, f"Índice RAG no disponible: {_retriever_error or 'no cargado'}")
+    return _retriever
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_rag(load_retriever)
+    # Cliente del proveedor por defecto listo antes de la primera request
+    try:
+        get_llm("openrouter", None)
+    except Exception as e:
+        print(f"[WARN] Proveedor openrouter no inicializado: {e}")
+    yield
+    _llms.clear()
+    await aclose_http_client()
+    _rag_pool.shutdown(wait=False)
+
+app = FastAPI(title="UFRO Assistant API", version="1.0.0", lifespan=lifespan)
 
 # Sirve archivos estáticos (como CSS, JS) en el directorio "static"
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 class AskPayload(BaseModel):
     question: str
-    provider: str = "openrouter"   # "openrouter" | "deepseek"
+    provider: str = "openrouter"   # "openrouter" | "deepseek" | "stub" | "router"
     model: Optional[str] = None    # p.ej. "openai/gpt-4.1-mini" o "deepseek-chat"
     k: int = 4
     rag: bool = True
     show_sources: bool = False
 
-def get_llm(provider: str, model: Optional[str]):
+class AskBatchPayload(BaseModel):
+    questions: List[str]
+    provider: str = "openrouter"
+    model: Optional[str] = None
+    k: int = 4
+    rag: bool = True
+    show_sources: bool = False
+    mode: Optional[str] = None
+    rerank: Optional[bool] = None
+    doc_ids: Optional[str] = None      # separados por coma, como en /ask
+    vigencia_min: Optional[int] = None
+    tipo: Optional[str] = None
+    stream: bool = False               # NDJSON a medida que terminan
+
+# /ask-batch: tamaño máximo del lote y llamadas LLM simultáneas por lote
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "64"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+
+def _build_llm(provider: str, model: Optional[str]):
+    if model and LLM_MODELS and provider != "router" and f"{provider}:{model}" not in LLM_MODELS:
+        raise HTTPException(400, f"Modelo no permitido: {provider}:{model} (ver LLM_MODELS)")
     if provider == "openrouter":
         return OpenRouterProvider(model=model or "openai/gpt-4.1-mini")
     if provider == "deepseek":
         if not HAVE_DEEPSEEK:
             raise HTTPException(400, "DeepSeek no está disponible en este despliegue")
         return DeepSeekProvider(model=model or "deepseek-chat")
+    if provider == "stub":
+        # LLM local de providers/stub_server.py, para pruebas de carga
+        return StubProvider(model=model or "stub")
+    if provider == "router":
+        return _build_router(model or ROUTER_PROVIDERS)
     raise HTTPException(400, f"Proveedor no soportado: {provider}")
 
+# provider=router: hedge + failover entre proveedores, en orden de preferencia.
+# `model` (o ROUTER_PROVIDERS) es "proveedor:modelo,proveedor:modelo".
+ROUTER_PROVIDERS = os.getenv("ROUTER_PROVIDERS", "openrouter:openai/gpt-4.1-mini,deepseek:deepseek-chat")
+
+def _build_router(spec: str) -> RouterProvider:
+    members = []
+    for item in spec.split(","):
+        name, _, member_model = item.strip().partition(":")
+        if not name or name == "router":
+            continue
+        try:
+            members.append(_build_llm(name, member_model or None))
+        except (HTTPException, RuntimeError) as e:
+            # Un proveedor sin clave o no instalado no impide usar los demás
+            print(f"[WARN] Router: se omite {name}: {getattr(e, 'detail', e)}")
+    if not members:
+        raise HTTPException(400, f"Ningún proveedor disponible para el router: {spec}")
+    return RouterProvider(members)
+
+def get_llm(provider: str, model: Optional[str]):
+    """Cliente LLM por (proveedor, modelo), reutilizado entre requests (LRU de LLM_CACHE_SIZE)."""
+    key = (provider, model or "")
+    with _llms_lock:
+        llm = _llms.get(key)
+        if llm is not None:
+            _llms.move_to_end(key)
+            return llm
+        llm = _llms[key] = _build_llm(provider, model)
+        while len(_llms) > max(1, LLM_CACHE_SIZE):
+            _llms.popitem(last=False)
+    return llm
+
+def sources_payload(chunks) -> List[Dict[str, Any]]:
+    """Fuentes recuperadas en formato JSON (título, página, url, snippet)."""
+    srcs = []
+    for c in chunks:
+        # Soportar tanto dicts como objetos (RetrievedChunk)
+        if isinstance(c, dict):
+            title = c.get("title") or c.get("doc_id", "")
+            page_val = c.get("page", 0)
+            url = c.get("url", "")
+            text = c.get("text", "")
+        else:
+            # objeto con atributos
+            title = getattr(c, "title", None) or getattr(c, "doc_id", "")
+            page_val = getattr(c, "page", 0)
+            url = getattr(c, "url", "")
+            text = getattr(c, "text", "")
+
+        # normalizar page
+        if isinstance(page_val, (int, float)):
+            page = int(page_val)
+        else:
+            page = page_val
+
+        snippet = (text or "")[:250].replace("\n", " ")
+
+        srcs.append({
+            "title": title,
+            "page": page,
+            "url": url,
+            "snippet": snippet,
+        })
+    return srcs
+
+def lookup_answer(question: str, q_emb, chunks, provider: str, llm, k: int) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Busca una respuesta ya generada: primero en el cache exacto, luego en el
+    semántico. Devuelve (clave exacta, respuesta o None, "exact"|"semantic"|None).
+    """
+    model = getattr(llm, "model", "")
+    chunk_ids = [c.chunk_id for c in chunks]
+    key = None
+    if answer_cache is not None:
+        key = AnswerCache.make_key(question, chunk_ids, provider, model, PROMPT_VERSION, k)
+        hit = answer_cache.get(key)
+        if hit is not None:
+            return key, hit["answer"], "exact"
+    if semantic_cache is not None:
+        entry = semantic_cache.lookup(q_emb, question, chunk_ids, provider, model, PROMPT_VERSION, k)
+        if entry is not None:
+            if key:
+                # la próxima vez esta misma redacción acierta en el cache exacto
+                answer_cache.put(key, {"answer": entry["answer"]})
+            return key, entry["answer"], "semantic"
+    return key, None, None
+
+def store_answer(key: Optional[str], question: str, q_emb, chunks, provider: str, llm, k: int, answer: str):
+    if key and answer_cache is not None:
+        answer_cache.put(key, {"answer": answer})
+    if semantic_cache is not None:
+        semantic_cache.add(q_emb, question, [c.chunk_id for c in chunks], provider,
+                           getattr(llm, "model", ""), PROMPT_VERSION, k, answer)
+
+def check_mode(mode: Optional[str]):
+    """400 si el modo pedido (o RETRIEVAL_MODE, si no viene) no existe, antes de recuperar."""
+    try:
+        check_retrieval_mode(RETRIEVAL_MODE if mode is None else mode)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+def make_filter(doc_ids: Optional[str], vigencia_min: Optional[int], tipo: Optional[str]) -> Optional[RetrievalFilter]:
+    """Campos de formulario (listas separadas por coma) -> filtro de recuperación."""
+    return RetrievalFilter.make((doc_ids or "").split(","), vigencia_min, (tipo or "").split(","))
+
+def rag_messages(question: str, chunks, llm) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """Empaqueta el contexto según el presupuesto del modelo y arma el prompt RAG."""
+    packed, ctx = pack_context(chunks, token_budget(getattr(llm, "model", None)))
+    return build_messages(question, format_context(packed)), ctx
+
+def plain_messages(question: str) -> List[Dict[str, str]]:
+    return [
+        {"role":"system","content":"Eres un asistente UFRO, responde breve."},
+        {"role":"user","content": question},
+    ]
+
+def sse(event: str, data: Any) -> str:
+    """Serializa un evento server-sent events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.get("/", response_class=HTMLResponse)
 async def get_index():
     with open("static/index.html", "r") as f:
@@ -47,61 +334,229 @@ async def get_index():
 
 @app.post("/ask")
 async def ask(question: str = Form(...), provider: str = Form(...), model: Optional[str] = Form(None), 
-              k: int = Form(4), rag: bool = Form(True), show_sources: bool = Form(False)):
+              k: int = Form(4), rag: bool = Form(True), show_sources: bool = Form(False),
+              mode: Optional[str] = Form(None), rerank: Optional[bool] = Form(None),
+              doc_ids: Optional[str] = Form(None), vigencia_min: Optional[int] = Form(None),
+              tipo: Optional[str] = Form(None)):
     
     llm = get_llm(provider, model)
+    check_mode(mode)
+    filt = make_filter(doc_ids, vigencia_min, tipo)
+
+    async def run() -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        timings: Dict[str, Any] = {"retrieval_ms": 0.0, "llm_ms": 0.0}
+        if not rag:
+            answer = await llm.achat(plain_messages(question))
+            timings["llm_ms"] = timings["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+            return {"answer": answer, "timings": timings}
+
+        q_emb, chunks = await run_rag(get_retriever().query_with_embedding, question, k, mode, rerank, filt)
+        timings["retrieval_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+
+        # El cache va antes de empaquetar el contexto: un acierto no lo necesita
+        key, answer, tier = lookup_answer(question, q_emb, chunks, provider, llm, k)
+        ctx = None
+        if answer is None:
+            messages, ctx = rag_messages(question, chunks, llm)
+            t1 = time.perf_counter()
+            answer = await llm.achat(messages)
+            timings["llm_ms"] = round((time.perf_counter() - t1) * 1000.0, 1)
+            store_answer(key, question, q_emb, chunks, provider, llm, k, answer)
+        timings["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+        return {"answer": answer, "chunks": chunks, "tier": tier, "context": ctx, "timings": timings}
+
+    coalesced = False
+    if single_flight is not None:
+        out, coalesced = await single_flight.do(
+            flight_key(question, provider, getattr(llm, "model", ""), k, rag, mode, rerank, filt), run)
+    else:
+        out = await run()
+
+    resp: Dict[str, Any] = {"answer": out["answer"], "provider": provider, "rag": rag}
+    if rag:
+        resp.update(cached=out["tier"] is not None, cache_tier=out["tier"], context=out["context"])
+        if show_sources:
+            resp["sources"] = sources_payload(out["chunks"])
+    resp["coalesced"] = coalesced
+    resp["timings"] = out["timings"]
+    return resp
+
+@app.post("/ask/stream")
+async def ask_stream(question: str = Form(...), provider: str = Form(...), model: Optional[str] = Form(None),
+                     k: int = Form(4), rag: bool = Form(True), mode: Optional[str] = Form(None),
+                     rerank: Optional[bool] = Form(None), doc_ids: Optional[str] = Form(None),
+                     vigencia_min: Optional[int] = Form(None), tipo: Optional[str] = Form(None)):
+    """
+    Igual que /ask pero como text/event-stream:
+      event: sources -> fuentes recuperadas (apenas termina la recuperación)
+      event: token   -> {"text": "..."} por cada fragmento del LLM
+      event: done    -> tiempos en ms (retrieval, primer token, total), si vino del cache y si
+                        se compartió con una request idéntica en vuelo (coalesced)
+      event: error   -> {"detail": "..."} si falla a mitad de camino
+    """
+    llm = get_llm(provider, model)
+    check_mode(mode)
+    filt = make_filter(doc_ids, vigencia_min, tipo)
+    retriever = get_retriever() if rag else None
 
-    if not rag:
-        messages = [
-            {"role":"system","content":"Eres un asistente UFRO, responde breve."},
-            {"role":"user","content": question},
-        ]
-        answer = llm.chat(messages)
-        return {"answer": answer, "provider": provider, "rag": False}
-
-    retriever = Retriever()
-    chunks = retriever.query(question, k=k)
-    context_block = format_context(chunks)
-    messages = build_messages(question, context_block)
-
-    answer = llm.chat(messages)
-
-    resp: Dict[str, Any] = {"answer": answer, "provider": provider, "rag": True}
-
-    if show_sources:
-        srcs = []
-        for c in chunks:
-            # Soportar tanto dicts como objetos (RetrievedChunk)
-            if isinstance(c, dict):
-                title = c.get("title") or c.get("doc_id", "")
-                page_val = c.get("page", 0)
-                url = c.get("url", "")
-                text = c.get("text", "")
+    async def produce():
+        # (evento, datos): lo que se comparte entre requests idénticas en vuelo
+        t0 = time.perf_counter()
+        timings: Dict[str, Any] = {"retrieval_ms": 0.0, "first_token_ms": None}
+        try:
+            key, cached, tier, ctx = None, None, None, None
+            if retriever is not None:
+                q_emb, chunks = await run_rag(retriever.query_with_embedding, question, k, mode, rerank, filt)
+                timings["retrieval_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+                yield "sources", sources_payload(chunks)
+                key, cached, tier = lookup_answer(question, q_emb, chunks, provider, llm, k)
+                if cached is None:
+                    messages, ctx = rag_messages(question, chunks, llm)
             else:
-                # objeto con atributos
-                title = getattr(c, "title", None) or getattr(c, "doc_id", "")
-                page_val = getattr(c, "page", 0)
-                url = getattr(c, "url", "")
-                text = getattr(c, "text", "")
-
-            # normalizar page
-            if isinstance(page_val, (int, float)):
-                page = int(page_val)
+                messages = plain_messages(question)
+
+            if cached is not None:
+                timings["first_token_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+                yield "token", {"text": cached}
             else:
-                page = page_val
+                pieces: List[str] = []
+                async for piece in llm.astream(messages):
+                    if timings["first_token_ms"] is None:
+                        timings["first_token_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+                    pieces.append(piece)
+                    yield "token", {"text": piece}
+                if retriever is not None:
+                    store_answer(key, question, q_emb, chunks, provider, llm, k, "".join(pieces).strip())
+        except Exception as e:
+            yield "error", {"detail": str(e)}
+            return
+        timings["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+        yield "done", {"provider": provider, "rag": rag, "cached": tier is not None,
+                       "cache_tier": tier, "context": ctx, "timings": timings}
 
-            snippet = (text or "")[:250].replace("\n", " ")
+    async def events():
+        if single_flight is None:
+            async for event, data in produce():
+                yield sse(event, data)
+            return
+        key = flight_key(question, provider, getattr(llm, "model", ""), k, rag, mode, rerank, filt)
+        async for (event, data), coalesced in single_flight.stream(key, produce):
+            if event == "done":
+                data = {**data, "coalesced": coalesced}
+            yield sse(event, data)
 
-            srcs.append({
-                "title": title,
-                "page": page,
-                "url": url,
-                "snippet": snippet,
-            })
-        resp["sources"] = srcs
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return resp
+@app.post("/ask-batch")
+async def ask_batch(payload: AskBatchPayload):
+    """
+    Varias preguntas en una request (JSON). La recuperación es un solo lote
+    (un encode + un index.search) y las llamadas al LLM corren en paralelo
+    hasta ASK_BATCH_CONCURRENCY, así el lote tarda lo que la respuesta más
+    lenta. Devuelve {"results": [...]} en el orden de `questions`, o con
+    "stream": true una línea NDJSON por pregunta a medida que terminan (con
+    su "index") y una última línea {"done": true, ...}. Un fallo del LLM
+    queda como "error" en su pregunta sin cortar el resto.
+    """
+    questions = payload.questions
+    if not questions:
+        raise HTTPException(400, "questions está vacío")
+    if len(questions) > ASK_BATCH_MAX:
+        raise HTTPException(400, f"Máximo {ASK_BATCH_MAX} preguntas por lote")
+    provider, k = payload.provider, payload.k
+    llm = get_llm(provider, payload.model)
+    check_mode(payload.mode)
+    filt = make_filter(payload.doc_ids, payload.vigencia_min, payload.tipo)
+
+    t0 = time.perf_counter()
+    retrieved = [(None, None)] * len(questions)
+    if payload.rag:
+        retrieved = await run_rag(get_retriever().query_many, questions, k, payload.mode, payload.rerank, filt)
+    retrieval_ms = round((time.perf_counter() - t0) * 1000.0, 1)
+    sem = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+
+    async def answer_one(i: int) -> Dict[str, Any]:
+        question, (q_emb, chunks) = questions[i], retrieved[i]
+        item: Dict[str, Any] = {"index": i, "question": question}
+        t1 = time.perf_counter()
+        try:
+            if chunks is None:
+                async with sem:
+                    item["answer"] = await llm.achat(plain_messages(question))
+            else:
+                key, answer, tier = lookup_answer(question, q_emb, chunks, provider, llm, k)
+                if answer is None:
+                    messages, item["context"] = rag_messages(question, chunks, llm)
+                    async with sem:
+                        answer = await llm.achat(messages)
+                    store_answer(key, question, q_emb, chunks, provider, llm, k, answer)
+                item.update(answer=answer, cached=tier is not None, cache_tier=tier)
+                if payload.show_sources:
+                    item["sources"] = sources_payload(chunks)
+        except Exception as e:
+            item["error"] = str(e)
+        item["llm_ms"] = round((time.perf_counter() - t1) * 1000.0, 1)
+        return item
+
+    def summary(items) -> Dict[str, Any]:
+        return {"provider": provider, "rag": payload.rag, "count": len(questions),
+                "errors": sum(1 for it in items if "error" in it),
+                "timings": {"retrieval_ms": retrieval_ms,
+                            "total_ms": round((time.perf_counter() - t0) * 1000.0, 1)}}
+
+    tasks = [asyncio.create_task(answer_one(i)) for i in range(len(questions))]
+    if not payload.stream:
+        results = await asyncio.gather(*tasks)
+        return {"results": results, **summary(results)}
+
+    async def lines():
+        done: List[Dict[str, Any]] = []
+        try:
+            for fut in asyncio.as_completed(tasks):
+                item = await fut
+                done.append(item)
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, **summary(done)}, ensure_ascii=False) + "\n"
+        finally:
+            # si el cliente corta, no seguir gastando llamadas al LLM
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/admin/reload")
+async def reload_index():
+    """
+    Recarga explícita del índice en este worker. Los demás ven el puntero
+    nuevo y recargan solos en menos de INDEX_WATCH_S segundos.
+    """
+    return await run_rag(load_retriever)
+
+@app.get("/admin/cache-stats")
+def cache_stats():
+    """Aciertos del cache exacto y del semántico (con muestra de aciertos para auditoría)."""
+    return {
+        "exact": answer_cache.stats() if answer_cache is not None else None,
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+        "retriever": _retriever.stats() if _retriever is not None else None,
+        "single_flight": single_flight.stats() if single_flight is not None else None,
+    }
+
+@app.get("/admin/llm-stats")
+def llm_stats():
+    """Latencia (p50/p95/p99, primer token), errores, hedges y cancelaciones por proveedor del router."""
+    return all_provider_stats()
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "retriever_loaded": _retriever is not None,
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+    }